@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from ...db import get_db
 from ...models.user import User
 from ...models.project import Project
 from ...schemas.app import AppCreate, AppUpdate, AppResponse
 from ...services.app_service import AppService
+from ...services.log_stream import LogLine, datetime_to_ns, parse_log_timestamp
 
 router = APIRouter()
 
@@ -124,6 +127,43 @@ async def get_app_logs(
         raise HTTPException(status_code=404, detail="App not found")
     return {"logs": logs}
 
+async def _log_events(lines: AsyncIterator[Optional[LogLine]]):
+    yield "retry: 3000\n\n"
+    async for line in lines:
+        if line is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"id: {line.cursor}\ndata: {line.text}\n\n"
+
+@router.get("/apps/{app_id}/logs/stream")
+async def stream_app_logs(
+    app_id: int,
+    follow: bool = True,
+    tail: int = Query(100, ge=0, le=10000),
+    since: Optional[datetime] = None,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream app logs as Server-Sent Events; reconnects resume after Last-Event-ID"""
+    after_ns = None
+    if last_event_id:
+        after_ns = parse_log_timestamp(last_event_id)
+        if after_ns is None:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    elif since:
+        after_ns = datetime_to_ns(since) - 1
+
+    app_service = AppService(db)
+    lines = await app_service.stream_app_logs(app_id, current_user.id, after_ns=after_ns, follow=follow, tail=tail)
+    if lines is None:
+        raise HTTPException(status_code=404, detail="App not found")
+    return StreamingResponse(
+        _log_events(lines),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/apps/{app_id}/metrics")
 async def get_app_metrics(
     app_id: int,
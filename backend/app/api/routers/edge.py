@@ -0,0 +1,74 @@
+"""
+Edge callbacks
+Wakes scaled-to-zero apps and MicroVMs when a request reaches them (see nginx/scale-to-zero.conf)
+"""
+
+import hmac
+import logging
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from ...config import settings
+from ...services.idle_scaler import (
+    EDGE_SECRET_HEADER, HOP_BY_HOP, REPLAY_HEADER, REPLAY_METHODS, WakeFailed, idle_scaler
+)
+from ...services.vm_control import VMControlUnavailable
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+WAKE_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+@router.api_route("/edge/wake", methods=WAKE_METHODS, include_in_schema=False)
+async def wake_and_replay(request: Request):
+    """Hold a request whose upstream is suspended, wake it and replay the request.
+
+    Only the edge may call this: it sends the original host and URI in
+    X-Original-Host / X-Original-URI and EDGE_WAKE_SECRET in
+    X-VibeCaaS-Edge-Secret. Only targets that are suspended (or being woken)
+    are woken. GET, HEAD and OPTIONS are replayed through EDGE_URL once the
+    target runs; other methods get 503 with Retry-After so the client
+    retries them itself. Requests that were already replayed once fail with
+    502 instead of waking again.
+    """
+    if not settings.edge_url or not settings.edge_wake_secret:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not hmac.compare_digest(request.headers.get(EDGE_SECRET_HEADER, ""), settings.edge_wake_secret):
+        raise HTTPException(status_code=401, detail="Invalid edge secret")
+    if request.headers.get(REPLAY_HEADER):
+        raise HTTPException(status_code=502, detail="Upstream unavailable")
+    host = request.headers.get("x-original-host", "").split(":")[0].lower()
+    uri = request.headers.get("x-original-uri", "/")
+    if not host or not uri.startswith("/") or uri.startswith("//"):
+        raise HTTPException(status_code=400, detail="Invalid original host or URI")
+    target = await idle_scaler.resolve(host)
+    # A running target failed for some other reason, and may already have handled the request
+    if target is None or (target.status != "suspended" and not idle_scaler.waking(target.kind, target.id)):
+        raise HTTPException(status_code=502, detail="Upstream unavailable")
+
+    body = await request.body()
+    try:
+        await idle_scaler.wake(target.kind, target.id)
+    except (WakeFailed, VMControlUnavailable, httpx.HTTPError) as e:
+        logger.warning(f"Failed to wake {target.kind} {target.id} for {host}: {e}")
+        raise HTTPException(status_code=503, detail="Waking up, retry shortly", headers={"Retry-After": "5"})
+    if request.method not in REPLAY_METHODS:
+        raise HTTPException(status_code=503, detail="Woken up, retry the request", headers={"Retry-After": "1"})
+
+    try:
+        upstream = await idle_scaler.replay(
+            request.method,
+            request.headers.get("x-forwarded-proto", "https"),
+            host,
+            uri,
+            request.headers,
+            body,
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"Replay to {host}{uri} after wake failed: {e}")
+        raise HTTPException(status_code=502, detail="Upstream unavailable")
+    headers = {name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP}
+    return Response(content=upstream.content, status_code=upstream.status_code, headers=headers)
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from ...db import get_db
@@ -7,10 +8,16 @@ from ...models.microvm import MicroVMStatus
 from ...schemas.microvm import (
     MicroVMCreate, MicroVMUpdate, MicroVMResponse, MicroVMListResponse,
     MicroVMCreateResponse, MicroVMStatusResponse, MicroVMRuntimeTemplate,
-    MicroVMRegion, MicroVMEventResponse
+    MicroVMRegion, MicroVMEventPage, MicroVMBulkRequest
 )
 from ...services.microvm_service import MicroVMService
+from ...services.microvm_bulk import microvm_bulk
+from ...services.microvm_events import microvm_events
+from ...services.microvm_placement import microvm_placement
+from ...services.microvm_reconciler import SIGNATURE_HEADER, microvm_reconciler, verify_signature
+from ...config import settings
 from ...services.auth_service import get_current_user
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,7 +47,7 @@ async def create_microvm(
             vm_id=microvm.vm_id,
             status=microvm.status,
             dev_url=microvm.dev_url,
-            message=f"MicroVM {microvm.vm_id} is being created. This may take up to 45 seconds."
+            message=f"MicroVM {microvm.vm_id} is being created. This may take up to 45 seconds, or a few seconds when restored from a snapshot."
         )
         
     except ValueError as e:
@@ -49,6 +56,67 @@ async def create_microvm(
         logger.error(f"Failed to create MicroVM: {e}")
         raise HTTPException(status_code=500, detail="Failed to create MicroVM")
 
+@router.post("/microvms/webhooks/vm-control")
+async def vm_control_webhook(request: Request):
+    """Receive VM state changes pushed by vm-control.
+
+    The body is one state object or a list of them (`id`, `status` and
+    optionally `dev_url`, `internal_ip`, `external_ip`), signed with
+    VM_CONTROL_WEBHOOK_SECRET as `sha256=<hex HMAC of the body>`.
+    """
+    if not settings.vm_control_webhook_secret:
+        raise HTTPException(status_code=404, detail="Not found")
+    body = await request.body()
+    if not verify_signature(settings.vm_control_webhook_secret, body, request.headers.get(SIGNATURE_HEADER)):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(payload, (list, dict)):
+        raise HTTPException(status_code=400, detail="Expected a VM state object or a list of them")
+    states = payload if isinstance(payload, list) else payload.get("vms", [payload])
+    if not isinstance(states, list) or not all(isinstance(state, dict) for state in states):
+        raise HTTPException(status_code=400, detail="Expected VM state objects")
+    applied = await microvm_reconciler.apply(states)
+    return {"received": len(states), "transitions": applied}
+
+@router.post("/microvms/bulk")
+async def bulk_microvms(
+    bulk_data: MicroVMBulkRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Start, stop, destroy or resize many MicroVMs at once.
+
+    Targets are given by `ids` or by a label `selector`. The response is
+    NDJSON: one line per MicroVM as its result is committed, then a
+    `summary` line with the counts.
+    """
+    try:
+        plan = await microvm_bulk.prepare(
+            current_user.id,
+            bulk_data.action.value,
+            ids=bulk_data.ids,
+            selector=bulk_data.selector,
+            size={
+                "cpu_cores": bulk_data.cpu_cores,
+                "memory_mb": bulk_data.memory_mb,
+                "storage_gb": bulk_data.storage_gb,
+            },
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        counts = {"total": 0, "ok": 0, "failed": 0}
+        async for item in microvm_bulk.execute(plan):
+            counts["total"] += 1
+            counts["ok" if item["ok"] else "failed"] += 1
+            yield json.dumps(item) + "\n"
+        yield json.dumps({"summary": {"action": plan.action, **counts}}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @router.get("/microvms", response_model=MicroVMListResponse)
 async def list_microvms(
     tenant_id: Optional[int] = Query(None),
@@ -176,13 +244,15 @@ async def get_microvm_status(
         logger.error(f"Failed to get MicroVM status {microvm_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to get MicroVM status")
 
-@router.get("/microvms/{microvm_id}/events", response_model=List[MicroVMEventResponse])
+@router.get("/microvms/{microvm_id}/events", response_model=MicroVMEventPage)
 async def get_microvm_events(
     microvm_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get MicroVM events"""
+    """Get MicroVM events, newest first; pass `next_cursor` back as `cursor` for older ones"""
     try:
         # Verify user owns the MicroVM
         microvm_service = MicroVMService(db)
@@ -191,13 +261,12 @@ async def get_microvm_events(
         if not microvm:
             raise HTTPException(status_code=404, detail="MicroVM not found")
         
-        # Get events
-        from ...models.microvm import MicroVMEvent
-        events = db.query(MicroVMEvent).filter(
-            MicroVMEvent.microvm_id == microvm_id
-        ).order_by(MicroVMEvent.created_at.desc()).limit(50).all()
+        try:
+            events, next_cursor = await microvm_events.page(microvm_id, limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return events
+        return MicroVMEventPage(events=events, next_cursor=next_cursor)
         
     except HTTPException:
         raise
@@ -235,6 +304,16 @@ async def get_available_regions(
         logger.error(f"Failed to get available regions: {e}")
         raise HTTPException(status_code=500, detail="Failed to get available regions")
 
+@router.get("/microvms/placement/scores")
+async def get_placement_scores(
+    cpu_cores: int = Query(2, ge=1, le=16),
+    memory_mb: int = Query(2048, ge=512, le=32768),
+    region: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """How the placement scheduler would score regions and hosts for a VM of this size"""
+    return microvm_placement.explain(cpu_cores, memory_mb, region)
+
 @router.post("/microvms/{microvm_id}/start")
 async def start_microvm(
     microvm_id: int,
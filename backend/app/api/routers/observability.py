@@ -0,0 +1,99 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...config import settings
+from ...db import engine, async_engine, get_async_db
+from ...models.app import App
+from ...models.user import User
+from ...services.auth_service import get_current_user
+from ...services.blob_store import blob_store
+from ...services.containers import container_service
+from ...services.metrics_service import metrics_pipeline
+from ...services.project_service import template_registry
+
+router = APIRouter()
+
+
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    """Pool, image and template state is shared by every tenant: only configured admins may read it"""
+    admins = {email.strip().lower() for email in settings.observability_admin_emails.split(",") if email.strip()}
+    if current_user.email.lower() not in admins:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+def _pool_status(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "status": pool.status(),
+    }
+
+
+@router.get("/db/pool", dependencies=[Depends(require_admin)])
+async def get_db_pool_status():
+    """Current connection pool usage for this API replica"""
+    return {
+        "sync": _pool_status(engine.pool),
+        "async": _pool_status(async_engine.sync_engine.pool),
+    }
+
+
+@router.get("/warm-pool", dependencies=[Depends(require_admin)])
+async def get_warm_pool_status():
+    """Idle warm containers per template for this API replica"""
+    pool = container_service.warm_pool
+    return {
+        key: {"image": template.image, "gpu": template.gpu, "idle": pool.idle_counts()[key], "target": pool.targets[key]}
+        for key, template in pool.templates.items()
+    }
+
+
+@router.get("/images", dependencies=[Depends(require_admin)])
+async def get_image_status():
+    """Base image presence, digests and pull times for this API replica's host"""
+    return container_service.images.status()
+
+
+@router.get("/blob-store", dependencies=[Depends(require_admin)])
+async def get_blob_store_report():
+    """Blobs, references and disk saved by deduplicating project scaffolds"""
+    return await asyncio.to_thread(blob_store.report)
+
+
+@router.get("/templates", dependencies=[Depends(require_admin)])
+async def get_template_status():
+    """Rendered project scaffolds and their node_modules layers"""
+    return template_registry.status()
+
+
+@router.get("/apps/{app_id}/metrics")
+async def get_app_metric_history(
+    app_id: uuid.UUID,
+    start: Optional[datetime] = Query(None, description="Defaults to one hour before `end`"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    max_points: int = Query(500, ge=10, le=5000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """CPU/memory history for an app at the coarsest resolution the range needs"""
+    result = await db.execute(select(App).where(App.id == app_id, App.user_id == current_user.id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="App not found")
+
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return await metrics_pipeline.query(app_id, start, end, max_points)
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from dataclasses import asdict
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
 from typing import List, Optional
 from ...db import get_db
 from ...models.user import User
 from ...models.project import Project
 from ...schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse
+from ...services.build_logs import build_logs
+from ...services.build_queue import build_queue
 from ...services.project_service import ProjectService
 
 router = APIRouter()
@@ -78,10 +83,93 @@ async def deploy_project(
 ):
     """Deploy a project"""
     project_service = ProjectService(db)
-    success = await project_service.deploy_project(project_id, current_user.id)
-    if not success:
+    job = await project_service.queue_deploy(project_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return {"message": "Project deployment queued", "build_id": job.build_id}
+
+@router.get("/projects/{project_id}/builds/{build_id}")
+async def get_project_build(
+    project_id: int,
+    build_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the queue status of a build"""
+    project_service = ProjectService(db)
+    if not await project_service.get_project(project_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    job = await build_queue.get(build_id)
+    if not job or job.project_id != project_id:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return asdict(job)
+
+@router.post("/projects/{project_id}/builds/{build_id}/cancel")
+async def cancel_project_build(
+    project_id: int,
+    build_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a queued or running build"""
+    project_service = ProjectService(db)
+    if not await project_service.get_project(project_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    job = await build_queue.get(build_id)
+    if not job or job.project_id != project_id:
+        raise HTTPException(status_code=404, detail="Build not found")
+    job = await build_queue.cancel(build_id)
+    return asdict(job)
+
+@router.get("/projects/{project_id}/builds")
+async def list_project_builds(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List recent builds of a project, newest first"""
+    project_service = ProjectService(db)
+    if not await project_service.get_project(project_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return build_logs.builds(project_id)
+
+@router.get("/projects/{project_id}/builds/{build_id}/logs")
+async def stream_build_logs(
+    project_id: int,
+    build_id: str,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream a build's log as Server-Sent Events; live until the build finishes"""
+    project_service = ProjectService(db)
+    if not await project_service.get_project(project_id, current_user.id):
         raise HTTPException(status_code=404, detail="Project not found")
-    return {"message": "Project deployment started"}
+    if build_id == "latest":
+        builds = build_logs.builds(project_id)
+        if not builds:
+            raise HTTPException(status_code=404, detail="Build not found")
+        build_id = str(builds[0]["build_id"])
+
+    log = build_logs.get(project_id, build_id)
+    if log is not None:
+        lines = log.follow(last_event_id or 0)
+    elif build_logs.exists(project_id, build_id):
+        lines = iterate_in_threadpool(build_logs.read(project_id, build_id, last_event_id or 0))
+    else:
+        raise HTTPException(status_code=404, detail="Build not found")
+
+    async def events():
+        yield "retry: 3000\n\n"
+        async for seq, line in lines:
+            yield f"id: {seq}\ndata: {line}\n\n"
+        yield "event: end\ndata: \n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/projects/{project_id}/status")
 async def get_project_status(
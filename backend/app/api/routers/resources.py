@@ -3,8 +3,9 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from ...db import get_db
 from ...models.user import User
-from ...schemas.resources import ResourceUsageResponse, ResourceQuotaResponse
+from ...schemas.resources import ResourceUsageResponse, ResourceQuotaResponse, TenantResourceUsageResponse
 from ...services.resource_service import ResourceService
+from ...services.tenant_service import TenantService
 
 router = APIRouter()
 
@@ -18,6 +19,20 @@ async def get_resource_usage(
     usage = await resource_service.get_user_usage(current_user.id)
     return usage
 
+@router.get("/resources/tenants/{tenant_id}/usage", response_model=TenantResourceUsageResponse)
+async def get_tenant_resource_usage(
+    tenant_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get aggregated resource usage for a tenant the user belongs to"""
+    tenant_service = TenantService(db)
+    tenant = await tenant_service.get_tenant(tenant_id, current_user.id)
+    if not tenant:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    resource_service = ResourceService(db)
+    return await resource_service.get_tenant_usage(tenant_id)
+
 @router.get("/resources/quotas", response_model=ResourceQuotaResponse)
 async def get_resource_quotas(
     current_user: User = Depends(get_current_user),
@@ -1,12 +1,97 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
 
-# Create database engine
-engine = create_engine(settings.database_url)
+# Pool metrics, labelled by engine ("sync" / "async") so both can be scraped side by side
+DB_POOL_SIZE = Gauge("vibecaas_db_pool_size", "Configured connection pool size", ["engine"])
+DB_POOL_CHECKED_OUT = Gauge("vibecaas_db_pool_checked_out", "Connections currently checked out", ["engine"])
+DB_POOL_OVERFLOW = Gauge("vibecaas_db_pool_overflow", "Overflow connections currently open", ["engine"])
+DB_POOL_WAITERS = Gauge("vibecaas_db_pool_waiters", "Callers currently waiting for a connection", ["engine"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "vibecaas_db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = Counter("vibecaas_db_pool_timeouts_total", "Pool checkouts that timed out", ["engine"])
+
+
+class _InstrumentedPoolMixin:
+    engine_label = ""
+
+    def _do_get(self):
+        waiters = DB_POOL_WAITERS.labels(self.engine_label)
+        waiters.inc()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.engine_label).inc()
+            raise
+        finally:
+            waiters.dec()
+            DB_POOL_WAIT_SECONDS.labels(self.engine_label).observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    engine_label = "sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+def _with_driver(url: str, driver: str) -> str:
+    """Pin the Postgres driver so one DATABASE_URL can serve both engines"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        return url
+    return parsed.set(drivername=f"postgresql+{driver}").render_as_string(hide_password=False)
+
+
+def _pool_kwargs() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "echo": settings.db_echo,
+    }
+
+
+def _register_pool_gauges(label: str, pool) -> None:
+    DB_POOL_SIZE.labels(label).set_function(pool.size)
+    DB_POOL_CHECKED_OUT.labels(label).set_function(pool.checkedout)
+    DB_POOL_OVERFLOW.labels(label).set_function(lambda: max(pool.overflow(), 0))
+
+
+# Create database engines
+engine = create_engine(
+    _with_driver(settings.database_url, "psycopg2"),
+    poolclass=InstrumentedQueuePool,
+    **_pool_kwargs(),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    _with_driver(settings.database_url, "asyncpg"),
+    poolclass=InstrumentedAsyncQueuePool,
+    **_pool_kwargs(),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+_register_pool_gauges("sync", engine.pool)
+_register_pool_gauges("async", async_engine.sync_engine.pool)
+
 Base = declarative_base()
 
 def get_db():
@@ -14,4 +99,15 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_engines() -> None:
+    """Close pooled connections on shutdown"""
+    await async_engine.dispose()
+    engine.dispose()
@@ -1,15 +1,73 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from .config import settings
-from .api.routers import auth, apps, resources, tenants, projects, agents, billing, secrets, observability, microvm, domains
+from .db import dispose_engines
+from .services.build_queue import build_queue
+from .services.containers import container_service
+from .services.docker_client import docker_clients
+from .services.docker_executor import docker_executor
+from .services.idle_scaler import idle_scaler
+from .services.metrics_service import metrics_pipeline
+from .services.microvm_bulk import microvm_bulk
+from .services.microvm_events import microvm_events
+from .services.microvm_placement import microvm_placement
+from .services.microvm_reconciler import microvm_reconciler
+from .services.microvm_snapshots import microvm_snapshots
+from .services.project_service import template_registry
+from .services.stats_collector import stats_collector
+from .services.vm_control import vm_control
+from .services.workspace_sweeper import workspace_sweeper
+from .api.routers import auth, apps, resources, tenants, projects, agents, billing, secrets, observability, microvm, domains, edge
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await docker_clients.start()
+    stats_collector.start()
+    metrics_pipeline.start()
+    container_service.images.start()
+    container_service.warm_pool.start()
+    build_queue.start()
+    template_registry.start()
+    workspace_sweeper.start()
+    microvm_events.start()
+    microvm_placement.start()
+    microvm_reconciler.start()
+    if settings.idle_suspend_enabled and settings.edge_url and settings.edge_wake_secret:
+        idle_scaler.start()
+    yield
+    await idle_scaler.stop()
+    await microvm_bulk.stop()
+    await microvm_reconciler.stop()
+    await microvm_snapshots.stop()
+    await microvm_placement.stop()
+    # After everything that emits MicroVM events, so the drain catches theirs
+    await microvm_events.stop()
+    await vm_control.close()
+    await workspace_sweeper.stop()
+    await template_registry.stop()
+    await build_queue.stop()
+    await container_service.warm_pool.stop()
+    await container_service.images.stop()
+    await metrics_pipeline.stop()
+    await stats_collector.stop()
+    await docker_clients.stop()
+    docker_executor.shutdown()
+    await dispose_engines()
+
 
 app = FastAPI(
     title="VibeCaaS API",
     description="Multi-Agent AI Development Platform API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -39,6 +97,7 @@ app.include_router(secrets.router, prefix="/api/v1/secrets", tags=["secrets"])
 app.include_router(observability.router, prefix="/api/v1/observability", tags=["observability"])
 app.include_router(microvm.router, prefix="/api/v1", tags=["microvm"])
 app.include_router(domains.router, prefix="/api/v1", tags=["domains"])
+app.include_router(edge.router, prefix="/api/v1", tags=["edge"])
 
 @app.get("/")
 async def root():
@@ -46,4 +105,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "vibecaas-api"}
\ No newline at end of file
+    return {"status": "healthy", "service": "vibecaas-api"}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
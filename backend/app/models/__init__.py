@@ -4,7 +4,7 @@ from .project import Project
 from .agent import Agent, AgentTask, AgentExecution
 from .billing import BillingRecord, UsageRecord
 from .secrets import Secret
-from .microvm import MicroVM, MicroVMEvent, MicroVMQuota
+from .microvm import MicroVM, MicroVMEvent, MicroVMQuota, MicroVMSnapshot
 from .domain import Domain, DomainOrder, DNSRecord, URLForwarding, WebhookSubscription, DomainSearch
 
 __all__ = [
@@ -21,6 +21,7 @@ __all__ = [
     "MicroVM",
     "MicroVMEvent",
     "MicroVMQuota",
+    "MicroVMSnapshot",
     "Domain",
     "DomainOrder",
     "DNSRecord",
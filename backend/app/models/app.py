@@ -15,6 +15,7 @@ class AppStatus(str, Enum):
     CREATING = "creating"
     RUNNING = "running"
     STOPPED = "stopped"
+    SUSPENDED = "suspended"  # Paused while idle; woken by the next request
     ERROR = "error"
     DELETED = "deleted"
 
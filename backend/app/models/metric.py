@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime
+from enum import Enum
 
-from sqlalchemy import DateTime, Float, ForeignKey, Integer
+from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -12,6 +13,7 @@ from .user import Base
 
 class AppMetric(Base):
     __tablename__ = "app_metrics"
+    __table_args__ = (Index("ix_app_metrics_app_id_timestamp", "app_id", "timestamp"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     app_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("apps.id", ondelete="CASCADE"), nullable=False)
@@ -19,3 +21,32 @@ class AppMetric(Base):
     memory_usage: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
 
+
+class MetricResolution(str, Enum):
+    RAW = "raw"
+    MINUTE = "1m"
+    HOUR = "1h"
+
+
+class AppMetricRollup(Base):
+    """Downsampled AppMetric buckets, one row per (app, resolution, bucket)"""
+
+    __tablename__ = "app_metric_rollups"
+    __table_args__ = (
+        UniqueConstraint("app_id", "resolution", "bucket_start", name="uq_app_metric_rollups_bucket"),
+        Index("ix_app_metric_rollups_resolution_bucket_start", "resolution", "bucket_start"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    app_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("apps.id", ondelete="CASCADE"), nullable=False)
+    resolution: Mapped[str] = mapped_column(String(8), nullable=False)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    sample_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cpu_min: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    cpu_max: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    cpu_avg: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    cpu_p95: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    memory_min: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    memory_max: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    memory_avg: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    memory_p95: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..db import Base
@@ -8,6 +8,7 @@ class MicroVMStatus(str, enum.Enum):
     CREATING = "creating"
     RUNNING = "running"
     STOPPED = "stopped"
+    SUSPENDED = "suspended"  # Idle, scaled to zero; woken by the next request
     FAILED = "failed"
     DESTROYING = "destroying"
     DESTROYED = "destroyed"
@@ -51,12 +52,20 @@ class MicroVM(Base):
     build_command = Column(String(500))
     start_command = Column(String(500))
     environment_variables = Column(JSON)  # Dict of env vars
+    labels = Column(JSON)  # Dict of user labels, matched by bulk operation selectors
     
     # VM control integration
     vm_control_id = Column(String(255), unique=True, index=True)  # ID from vm-control API
     vm_control_region = Column(String(50))
+    vm_control_host = Column(String(255))  # Host chosen by the placement scheduler
     vm_control_status = Column(String(50))  # Status from vm-control API
     
+    # Snapshot fast start
+    fast_start = Column(Boolean, default=True)  # Restore from / capture a post-build snapshot
+    snapshot_key = Column(String(64), index=True)  # MicroVMSnapshot.snapshot_key this VM matches
+    commit_sha = Column(String(64))  # Commit vm-control was asked to build
+    boot_mode = Column(String(20))  # cold, restore
+    
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -70,7 +79,7 @@ class MicroVM(Base):
     
     # Feature flags
     is_active = Column(Boolean, default=True)
-    auto_scale = Column(Boolean, default=False)
+    auto_scale = Column(Boolean, default=False)  # Suspend when idle, wake on the next request
     gpu_enabled = Column(Boolean, default=False)
     
     # Relationships
@@ -80,8 +89,33 @@ class MicroVM(Base):
     def __repr__(self):
         return f"<MicroVM(id={self.id}, vm_id={self.vm_id}, status={self.status})>"
 
+class MicroVMSnapshot(Base):
+    __tablename__ = "microvm_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_key = Column(String(64), unique=True, index=True, nullable=False)  # Build inputs incl. commit
+    lineage_key = Column(String(64), index=True, nullable=False)  # Same inputs without the commit
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    runtime = Column(Enum(MicroVMRuntime), nullable=False)
+    region = Column(String(50), nullable=False)
+    repo_url = Column(String(500))
+    branch = Column(String(100))
+    commit_sha = Column(String(64))
+    
+    source_microvm_id = Column(Integer, ForeignKey("microvms.id"))
+    vm_control_snapshot_id = Column(String(255), unique=True)
+    status = Column(String(20), nullable=False, default="creating")  # creating, ready
+    size_mb = Column(Integer)
+    restores = Column(Integer, default=0)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    ready_at = Column(DateTime(timezone=True))
+    last_used_at = Column(DateTime(timezone=True))
+
 class MicroVMEvent(Base):
     __tablename__ = "microvm_events"
+    # Event pages are read per VM, newest first
+    __table_args__ = (Index("ix_microvm_events_microvm_id_created_at", "microvm_id", "created_at"),)
     
     id = Column(Integer, primary_key=True, index=True)
     microvm_id = Column(Integer, ForeignKey("microvms.id"), nullable=False)
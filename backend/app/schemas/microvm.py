@@ -7,6 +7,7 @@ class MicroVMStatus(str, Enum):
     CREATING = "creating"
     RUNNING = "running"
     STOPPED = "stopped"
+    SUSPENDED = "suspended"
     FAILED = "failed"
     DESTROYING = "destroying"
     DESTROYED = "destroyed"
@@ -23,7 +24,7 @@ class MicroVMCreate(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
     description: Optional[str] = None
     runtime: MicroVMRuntime
-    region: str = Field(default="us-east-1", max_length=50)
+    region: Optional[str] = Field(default=None, max_length=50)  # None lets the placement scheduler choose
     cpu_cores: int = Field(default=2, ge=1, le=16)
     memory_mb: int = Field(default=2048, ge=512, le=32768)
     storage_gb: int = Field(default=10, ge=1, le=1000)
@@ -32,8 +33,10 @@ class MicroVMCreate(BaseModel):
     build_command: Optional[str] = None
     start_command: Optional[str] = None
     environment_variables: Optional[Dict[str, str]] = None
+    labels: Optional[Dict[str, str]] = None
     gpu_enabled: bool = False
     auto_scale: bool = False
+    fast_start: bool = True  # Restore from a post-build snapshot when one matches
 
     @validator('repo_url')
     def validate_repo_url(cls, v):
@@ -54,6 +57,7 @@ class MicroVMUpdate(BaseModel):
     memory_mb: Optional[int] = Field(None, ge=512, le=32768)
     storage_gb: Optional[int] = Field(None, ge=1, le=1000)
     environment_variables: Optional[Dict[str, str]] = None
+    labels: Optional[Dict[str, str]] = None
     auto_scale: Optional[bool] = None
 
 class MicroVMResponse(BaseModel):
@@ -77,9 +81,12 @@ class MicroVMResponse(BaseModel):
     build_command: Optional[str]
     start_command: Optional[str]
     environment_variables: Optional[Dict[str, str]]
+    labels: Optional[Dict[str, str]] = None
     vm_control_id: Optional[str]
     vm_control_region: Optional[str]
     vm_control_status: Optional[str]
+    fast_start: Optional[bool]
+    boot_mode: Optional[str]
     created_at: datetime
     updated_at: Optional[datetime]
     started_at: Optional[datetime]
@@ -94,6 +101,26 @@ class MicroVMResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MicroVMBulkAction(str, Enum):
+    START = "start"
+    STOP = "stop"
+    DESTROY = "destroy"
+    RESIZE = "resize"
+
+class MicroVMBulkRequest(BaseModel):
+    action: MicroVMBulkAction
+    ids: Optional[List[int]] = None
+    selector: Optional[Dict[str, str]] = None  # Labels that must all match
+    cpu_cores: Optional[int] = Field(None, ge=1, le=16)  # New size, for resize
+    memory_mb: Optional[int] = Field(None, ge=512, le=32768)
+    storage_gb: Optional[int] = Field(None, ge=1, le=1000)
+
+    @validator('memory_mb')
+    def validate_memory_mb(cls, v):
+        if v is not None and v % 512 != 0:
+            raise ValueError('Memory must be a multiple of 512 MB')
+        return v
+
 class MicroVMEventResponse(BaseModel):
     id: int
     microvm_id: int
@@ -105,6 +132,10 @@ class MicroVMEventResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MicroVMEventPage(BaseModel):
+    events: List[MicroVMEventResponse]
+    next_cursor: Optional[str] = None  # Pass as `cursor` for older events; None on the last page
+
 class MicroVMQuotaResponse(BaseModel):
     id: int
     tenant_id: int
@@ -168,4 +199,7 @@ class MicroVMRegion(BaseModel):
     id: str
     name: str
     available: bool
-    latency_ms: Optional[int] = None
\ No newline at end of file
+    latency_ms: Optional[int] = None  # Measured cold-boot provisioning latency
+    failure_rate: Optional[float] = None
+    free_cpu_cores: Optional[int] = None
+    free_memory_mb: Optional[int] = None
\ No newline at end of file
@@ -13,6 +13,17 @@ class ResourceUsageResponse(BaseModel):
     storage_usage_gb: float
     last_updated: datetime
 
+class TenantResourceUsageResponse(BaseModel):
+    tenant_id: int
+    total_projects: int
+    running_containers: int
+    cpu_usage_percent: float
+    memory_usage_bytes: int
+    memory_usage_gb: float
+    storage_usage_bytes: int
+    storage_usage_gb: float
+    last_updated: datetime
+
 class ResourceQuotaResponse(BaseModel):
     user_id: int
     max_projects: int
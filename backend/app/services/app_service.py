@@ -1,16 +1,25 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from ..models.project import Project
 from ..schemas.app import AppCreate, AppUpdate
 from ..config import settings
+from .docker_client import docker_clients
+from .docker_executor import docker_executor
+from .log_stream import LogLine, stream_container_logs
+from .stats_collector import stats_collector
 import docker
 import uuid
 from datetime import datetime
 
+# Labels stamped on every project container so usage can be resolved with one list call
+PROJECT_LABEL = "vibecaas.project.id"
+OWNER_LABEL = "vibecaas.owner.id"
+TENANT_LABEL = "vibecaas.tenant.id"
+
 class AppService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, docker_client: Optional[docker.DockerClient] = None):
         self.db = db
-        self.docker_client = docker.from_env()
+        self.docker_client = docker_client or docker_clients.get()
 
     async def get_user_apps(self, user_id: int, skip: int = 0, limit: int = 100) -> List[Project]:
         """Get apps for a user"""
@@ -148,37 +157,59 @@ class AppService:
             print(f"Error getting logs for app {app_id}: {e}")
             return None
 
+    async def stream_app_logs(
+        self,
+        app_id: int,
+        user_id: int,
+        after_ns: Optional[int] = None,
+        follow: bool = True,
+        tail: int = 100
+    ) -> Optional[AsyncIterator[Optional[LogLine]]]:
+        """Stream app logs line by line, resuming after `after_ns` when given"""
+        app = await self.get_app(app_id, user_id)
+        if not app:
+            return None
+
+        container_name = f"vibecaas-{app_id}"
+        try:
+            await docker_executor.run("get", self.docker_client.api.inspect_container, container_name)
+        except Exception as e:
+            print(f"Error streaming logs for app {app_id}: {e}")
+            return None
+        return stream_container_logs(
+            self.docker_client.api,
+            container_name,
+            after_ns=after_ns,
+            follow=follow,
+            tail=tail,
+            idle_timeout=settings.log_stream_heartbeat_seconds,
+        )
+
     async def get_app_metrics(self, app_id: int, user_id: int) -> Optional[dict]:
         """Get app metrics"""
         app = await self.get_app(app_id, user_id)
         if not app:
             return None
             
-        try:
-            container = self.docker_client.containers.get(f"vibecaas-{app_id}")
-            stats = container.stats(stream=False)
-            
-            # Calculate CPU usage
-            cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
-            system_delta = stats['cpu_stats']['system_cpu_usage'] - stats['precpu_stats']['system_cpu_usage']
-            cpu_percent = (cpu_delta / system_delta) * len(stats['cpu_stats']['cpu_usage']['percpu_usage']) * 100.0
-            
-            # Calculate memory usage
-            memory_usage = stats['memory_stats']['usage']
-            memory_limit = stats['memory_stats']['limit']
-            memory_percent = (memory_usage / memory_limit) * 100.0
-            
+        snapshot = stats_collector.get(f"vibecaas-{app_id}")
+        if snapshot is None:
             return {
-                "cpu_usage": round(cpu_percent, 2),
-                "memory_usage": memory_usage,
-                "memory_limit": memory_limit,
-                "memory_percent": round(memory_percent, 2),
+                "cpu_usage": 0,
+                "memory_usage": 0,
+                "memory_limit": 0,
+                "memory_percent": 0,
                 "status": app.status,
-                "uptime": stats.get('uptime', 0)
+                "uptime": 0
             }
-        except Exception as e:
-            print(f"Error getting metrics for app {app_id}: {e}")
-            return None
+            
+        return {
+            "cpu_usage": snapshot.cpu_percent,
+            "memory_usage": snapshot.memory_usage_bytes,
+            "memory_limit": snapshot.memory_limit_bytes,
+            "memory_percent": snapshot.memory_percent,
+            "status": app.status,
+            "uptime": snapshot.uptime_seconds
+        }
 
     async def _create_container(self, app_id: int):
         """Create Docker container for app"""
@@ -193,6 +224,11 @@ class AppService:
                 name=f"vibecaas-{app_id}",
                 ports={app.container_config.get("ports", ["3000:3000"])[0].split(":")[0]: int(app.container_config.get("ports", ["3000:3000"])[0].split(":")[1])},
                 environment=app.container_config.get("environment", {}),
+                labels={
+                    PROJECT_LABEL: str(app.id),
+                    OWNER_LABEL: str(app.owner_id),
+                    TENANT_LABEL: str(app.tenant_id)
+                },
                 detach=True,
                 restart_policy={"Name": "unless-stopped"}
             )
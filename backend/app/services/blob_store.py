@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+BLOB_MATERIALIZED = Counter(
+    "vibecaas_blob_materialized_total", "Files materialized into workspaces from the blob store", ["mode"]
+)
+BLOB_STORE_BYTES = Gauge("vibecaas_blob_store_bytes", "Bytes held by blobs in the content-addressed store")
+BLOB_SAVED_BYTES = Gauge("vibecaas_blob_saved_bytes", "Workspace bytes deduplicated by the blob store at last report")
+
+LINK_MODES = ("reflink", "hardlink", "copy")
+
+# From <linux/fs.h>: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Filesystems or kernels without reflinks answer with one of these
+_NO_REFLINK = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed store for the files projects are created with.
+
+    Layout under `root`:
+      blobs/<aa>/<sha256>            file content, read-only
+      refs/<aa>/<sha256>/<owner>     one marker per workspace using the blob,
+                                     holding the mode it was materialized with
+      owners/<owner>.json            {relative path: sha256} for the workspace
+
+    Files are materialized into workspaces with a reflink when the filesystem
+    supports it (btrfs, XFS), so identical scaffolds share extents and a user
+    edit copies on write. Hardlinks also share the inode, which means an
+    in-place write would change every workspace at once; they are only used
+    when `link_mode` asks for them, for workspaces whose tools always replace
+    files instead of rewriting them. Whether reflinks work is probed once,
+    on first use; without them a blob plus a copy costs more disk than the
+    file alone, so `shares` turns False and callers write files directly
+    instead of going through the store. Explicit "copy" mode copies. A blob is
+    removed when its last reference is released. Reference changes take a
+    process-wide lock; replicas sharing one store must not release and
+    acquire the same blob concurrently.
+    """
+
+    def __init__(self, root: str, link_mode: str = "reflink") -> None:
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"link_mode must be one of {', '.join(LINK_MODES)}, not {link_mode!r}")
+        self.root = root
+        self.link_mode = link_mode
+        self._lock = threading.Lock()
+        self._reflink_ok: Optional[bool] = None
+
+    @property
+    def shares(self) -> bool:
+        """Whether materialized files share storage with the blob"""
+        if self.link_mode == "copy":
+            return False
+        if self.link_mode == "hardlink":
+            return True
+        if self._reflink_ok is None:
+            self.probe()
+        return bool(self._reflink_ok)
+
+    def probe(self) -> bool:
+        """Try one reflink under `root` and remember whether the filesystem supports them"""
+        with self._lock:
+            if self._reflink_ok is not None:
+                return self._reflink_ok
+            probe_dir = os.path.join(self.root, "probe")
+            src = os.path.join(probe_dir, f"{os.getpid()}.src")
+            dest = os.path.join(probe_dir, f"{os.getpid()}.dest")
+            try:
+                os.makedirs(probe_dir, exist_ok=True)
+                with open(src, "wb") as f:
+                    f.write(b"probe")
+                with open(src, "rb") as s, open(dest, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                self._reflink_ok = True
+            except OSError as e:
+                logger.warning(
+                    f"Reflinks unavailable under {self.root} ({e.strerror}); "
+                    "writing workspace files directly instead of through the blob store"
+                )
+                self._reflink_ok = False
+            finally:
+                for path in (src, dest):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+            return self._reflink_ok
+
+    def put(self, data: bytes) -> str:
+        """Store `data` if it is new and return its digest"""
+        digest = _digest(data)
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, path)
+        return digest
+
+    def materialize(self, owner: str, target_dir: str, files: Dict[str, bytes]) -> Dict[str, str]:
+        """Write `files` (relative path -> content) into `target_dir` from the store.
+
+        References are recorded for `owner` and replace any it held before.
+        Returns the mode used for each file.
+        """
+        manifest: Dict[str, str] = {}
+        modes: Dict[str, str] = {}
+        with self._lock:
+            previous = self._read_manifest(owner)
+            for rel_path, data in files.items():
+                digest = self.put(data)
+                dest = os.path.join(target_dir, rel_path)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                mode = self._link(self._blob_path(digest), dest)
+                self._add_ref(digest, owner, mode)
+                manifest[rel_path] = digest
+                modes[rel_path] = mode
+                BLOB_MATERIALIZED.labels(mode).inc()
+            self._write_manifest(owner, manifest)
+            for digest in set(previous.values()) - set(manifest.values()):
+                self._drop_ref(digest, owner)
+        return modes
+
+    def release(self, owner: str) -> int:
+        """Drop every reference held by `owner`; returns the number of blobs removed"""
+        removed = 0
+        with self._lock:
+            for digest in set(self._read_manifest(owner).values()):
+                removed += self._drop_ref(digest, owner)
+            try:
+                os.unlink(self._manifest_path(owner))
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def report(self) -> Dict[str, object]:
+        """Disk saved by sharing blobs, as materialized.
+
+        `logical_bytes` is what the workspaces would use with a private copy
+        of every file, `physical_bytes` is the store plus files that had to be
+        copied. Edits made after materialization are not seen.
+        """
+        blobs = refs = shared_refs = 0
+        store_bytes = logical_bytes = copied_bytes = 0
+        by_mode: Dict[str, int] = {mode: 0 for mode in LINK_MODES}
+        blobs_dir = os.path.join(self.root, "blobs")
+        for prefix in self._listdir(blobs_dir):
+            for digest in self._listdir(os.path.join(blobs_dir, prefix)):
+                if digest.endswith(".tmp"):
+                    continue
+                try:
+                    size = os.stat(self._blob_path(digest)).st_size
+                except FileNotFoundError:
+                    continue
+                blobs += 1
+                store_bytes += size
+                for mode in self._ref_modes(digest):
+                    refs += 1
+                    logical_bytes += size
+                    by_mode[mode] = by_mode.get(mode, 0) + 1
+                    if mode == "copy":
+                        copied_bytes += size
+                    else:
+                        shared_refs += 1
+        physical_bytes = store_bytes + copied_bytes
+        saved = max(logical_bytes - physical_bytes, 0)
+        BLOB_STORE_BYTES.set(store_bytes)
+        BLOB_SAVED_BYTES.set(saved)
+        return {
+            "link_mode": self.link_mode,
+            "reflink_supported": self._reflink_ok,
+            "blobs": blobs,
+            "references": refs,
+            "shared_references": shared_refs,
+            "references_by_mode": by_mode,
+            "store_bytes": store_bytes,
+            "logical_bytes": logical_bytes,
+            "physical_bytes": physical_bytes,
+            "saved_bytes": saved,
+        }
+
+    def _link(self, src: str, dest: str) -> str:
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        if self.link_mode == "hardlink":
+            try:
+                os.link(src, dest)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        elif self.link_mode == "reflink" and self._reflink_ok is not False:
+            if self._reflink(src, dest):
+                return "reflink"
+        shutil.copyfile(src, dest)
+        os.chmod(dest, 0o644)
+        return "copy"
+
+    def _reflink(self, src: str, dest: str) -> bool:
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            try:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            except OSError as e:
+                if e.errno not in _NO_REFLINK:
+                    raise
+                if self._reflink_ok:
+                    logger.warning(f"Reflinks stopped working under {self.root} ({e.strerror}); copying workspace files")
+                self._reflink_ok = False
+                return False
+        # The clone inherits the blob's content, not its read-only mode
+        os.chmod(dest, 0o644)
+        self._reflink_ok = True
+        return True
+
+    def _add_ref(self, digest: str, owner: str, mode: str) -> None:
+        ref_dir = self._ref_dir(digest)
+        os.makedirs(ref_dir, exist_ok=True)
+        with open(os.path.join(ref_dir, owner), "w") as f:
+            f.write(mode)
+
+    def _drop_ref(self, digest: str, owner: str) -> int:
+        ref_dir = self._ref_dir(digest)
+        try:
+            os.unlink(os.path.join(ref_dir, owner))
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(ref_dir)
+        except OSError:
+            return 0  # Still referenced
+        try:
+            os.unlink(self._blob_path(digest))
+        except FileNotFoundError:
+            return 0
+        return 1
+
+    def _ref_modes(self, digest: str) -> List[str]:
+        ref_dir = self._ref_dir(digest)
+        modes = []
+        for owner in self._listdir(ref_dir):
+            try:
+                with open(os.path.join(ref_dir, owner)) as f:
+                    modes.append(f.read().strip() or "copy")
+            except OSError:
+                continue
+        return modes
+
+    def _read_manifest(self, owner: str) -> Dict[str, str]:
+        try:
+            with open(self._manifest_path(owner)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, owner: str, manifest: Dict[str, str]) -> None:
+        path = self._manifest_path(owner)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _ref_dir(self, digest: str) -> str:
+        return os.path.join(self.root, "refs", digest[:2], digest)
+
+    def _manifest_path(self, owner: str) -> str:
+        return os.path.join(self.root, "owners", f"{owner}.json")
+
+    @staticmethod
+    def _listdir(path: str) -> List[str]:
+        try:
+            return os.listdir(path)
+        except FileNotFoundError:
+            return []
+
+
+blob_store = BlobStore(root=settings.blob_store_dir, link_mode=settings.blob_store_link_mode)
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+BUILD_LOGS_ACTIVE = Gauge("vibecaas_build_logs_active", "Builds currently writing logs")
+BUILD_LOG_LINES = Counter("vibecaas_build_log_lines_total", "Build log lines recorded")
+BUILD_LOG_CHUNK_BYTES = Counter("vibecaas_build_log_chunk_bytes_total", "Compressed bytes written to build log chunks")
+
+STATUS_FILE = "status.json"
+
+
+def _chunk_name(first_seq: int) -> str:
+    return f"{first_seq:010d}.log.gz"
+
+
+def _read_chunk(path: str) -> List[str]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read().split("\n")
+
+
+class BuildLog:
+    """Log of one build: a bounded in-memory tail plus gzip chunks on disk.
+
+    Lines are numbered from 1. The tail holds at most `ring_lines` lines and
+    lines are flushed to a chunk before they can fall out of it, so a reader
+    finds every line either on disk or in memory. Readers resume after a
+    sequence number, which doubles as the SSE event id.
+    """
+
+    def __init__(self, project_id: int, build_id: str, directory: str, ring_lines: int, chunk_bytes: int, max_line_bytes: int) -> None:
+        self.project_id = project_id
+        self.build_id = build_id
+        self.directory = directory
+        self.ring_lines = ring_lines
+        self.chunk_bytes = chunk_bytes
+        self.max_line_bytes = max_line_bytes
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.last_seq = 0
+        self._ring: Deque[Tuple[int, str]] = deque(maxlen=ring_lines)
+        self._flushed_seq = 0
+        self._pending_bytes = 0
+        self._chunks: List[Tuple[int, int, str]] = []  # (first_seq, last_seq, path)
+        self._changed = asyncio.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._write_status()
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def append(self, text: str) -> None:
+        if self.done:
+            return
+        for line in text.rstrip("\r\n").split("\n"):
+            line = line.rstrip("\r")
+            if len(line) > self.max_line_bytes:
+                line = line[:self.max_line_bytes] + " [truncated]"
+            self.last_seq += 1
+            self._ring.append((self.last_seq, line))
+            self._pending_bytes += len(line) + 1
+            BUILD_LOG_LINES.inc()
+            # Flush well before unflushed lines could be evicted from the ring
+            if self._pending_bytes >= self.chunk_bytes or self.last_seq - self._flushed_seq >= self.ring_lines // 2:
+                self._flush()
+        self._notify()
+
+    def close(self, status: str) -> None:
+        if self.done:
+            return
+        self._flush()
+        self.status = status
+        self.finished_at = time.time()
+        self._write_status()
+        self._notify()
+
+    def info(self) -> Dict[str, object]:
+        return {
+            "build_id": self.build_id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "lines": self.last_seq,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def follow(self, after_seq: int = 0) -> AsyncIterator[Tuple[int, str]]:
+        """Yield (seq, line) after `after_seq`, waiting for new lines until the build ends"""
+        next_seq = after_seq + 1
+        while True:
+            ring_start = self._ring[0][0] if self._ring else self.last_seq + 1
+            if next_seq < ring_start:
+                # Older than the in-memory tail: replay from the chunks on disk, one at a time
+                for first_seq, last_seq, path in [c for c in self._chunks if c[1] >= next_seq]:
+                    lines = await asyncio.to_thread(_read_chunk, path)
+                    for offset, line in enumerate(lines):
+                        seq = first_seq + offset
+                        if next_seq <= seq < ring_start:
+                            yield seq, line
+                            next_seq = seq + 1
+                next_seq = max(next_seq, ring_start)
+                continue
+            for seq, line in [entry for entry in self._ring if entry[0] >= next_seq]:
+                yield seq, line
+                next_seq = seq + 1
+            if self.done and next_seq > self.last_seq:
+                return
+            if next_seq > self.last_seq:
+                changed = self._changed
+                await changed.wait()
+
+    def _notify(self) -> None:
+        # Wake everyone waiting on this event, then arm a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _flush(self) -> None:
+        lines = [line for seq, line in self._ring if seq > self._flushed_seq]
+        if not lines:
+            return
+        first_seq = self._flushed_seq + 1
+        path = os.path.join(self.directory, _chunk_name(first_seq))
+        data = gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=6)
+        with open(path, "wb") as f:
+            f.write(data)
+        BUILD_LOG_CHUNK_BYTES.inc(len(data))
+        self._chunks.append((first_seq, self.last_seq, path))
+        self._flushed_seq = self.last_seq
+        self._pending_bytes = 0
+
+    def _write_status(self) -> None:
+        path = os.path.join(self.directory, STATUS_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.info(), f)
+        os.replace(path + ".tmp", path)
+
+
+class BuildLogStore:
+    """Creates build logs and serves finished ones from disk.
+
+    Layout: <root>/<project_id>/<build_id>/{status.json, NNNNNNNNNN.log.gz}.
+    Only builds that are still running are kept in memory.
+    """
+
+    def __init__(self, root: str, ring_lines: int, chunk_bytes: int, max_line_bytes: int, retention: int) -> None:
+        self.root = root
+        self.ring_lines = ring_lines
+        self.chunk_bytes = chunk_bytes
+        self.max_line_bytes = max_line_bytes
+        self.retention = retention
+        self._active: Dict[str, BuildLog] = {}
+
+    def open(self, project_id: int, build_id: str) -> BuildLog:
+        log = BuildLog(
+            project_id,
+            build_id,
+            os.path.join(self.root, str(project_id), build_id),
+            ring_lines=self.ring_lines,
+            chunk_bytes=self.chunk_bytes,
+            max_line_bytes=self.max_line_bytes,
+        )
+        self._active[build_id] = log
+        BUILD_LOGS_ACTIVE.set(len(self._active))
+        self._prune(project_id)
+        return log
+
+    def close(self, log: BuildLog, status: str) -> None:
+        log.close(status)
+        if self._active.pop(log.build_id, None) is not None:
+            BUILD_LOGS_ACTIVE.set(len(self._active))
+
+    def get(self, project_id: int, build_id: str) -> Optional[BuildLog]:
+        log = self._active.get(build_id)
+        if log is not None and log.project_id == project_id:
+            return log
+        return None
+
+    def builds(self, project_id: int) -> List[Dict[str, object]]:
+        """Builds for a project, newest first"""
+        project_dir = os.path.join(self.root, str(project_id))
+        if not os.path.isdir(project_dir):
+            return []
+        infos = []
+        for build_id in os.listdir(project_dir):
+            active = self.get(project_id, build_id)
+            if active is not None:
+                infos.append(active.info())
+                continue
+            try:
+                with open(os.path.join(project_dir, build_id, STATUS_FILE)) as f:
+                    infos.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(infos, key=lambda info: info.get("started_at") or 0, reverse=True)
+
+    def read(self, project_id: int, build_id: str, after_seq: int = 0) -> Iterator[Tuple[int, str]]:
+        """Lines of a finished build after `after_seq`, one chunk in memory at a time"""
+        build_dir = os.path.join(self.root, str(project_id), build_id)
+        if not os.path.isdir(build_dir):
+            return
+        for name in sorted(n for n in os.listdir(build_dir) if n.endswith(".log.gz")):
+            first_seq = int(name.split(".", 1)[0])
+            for offset, line in enumerate(_read_chunk(os.path.join(build_dir, name))):
+                if first_seq + offset > after_seq:
+                    yield first_seq + offset, line
+
+    def exists(self, project_id: int, build_id: str) -> bool:
+        return os.path.exists(os.path.join(self.root, str(project_id), build_id, STATUS_FILE))
+
+    def _prune(self, project_id: int) -> None:
+        for info in self.builds(project_id)[self.retention:]:
+            if info.get("status") == "running":
+                continue
+            shutil.rmtree(os.path.join(self.root, str(project_id), str(info["build_id"])), ignore_errors=True)
+
+
+build_logs = BuildLogStore(
+    root=settings.build_log_dir,
+    ring_lines=settings.build_log_ring_lines,
+    chunk_bytes=settings.build_log_chunk_bytes,
+    max_line_bytes=settings.build_log_max_line_bytes,
+    retention=settings.build_log_retention,
+)
@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import redis.asyncio as aioredis
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Higher runs first. Within a priority, tenants take turns one build at a time.
+TIER_PRIORITY = {"team": 2, "pro": 1, "starter": 0}
+PRIORITIES = sorted(set(TIER_PRIORITY.values()), reverse=True)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+BUILD_QUEUE_DEPTH = Gauge("vibecaas_build_queue_depth", "Builds waiting for a worker", ["priority"])
+BUILD_QUEUE_RUNNING = Gauge("vibecaas_build_queue_running", "Builds running on this replica")
+BUILD_QUEUE_WAIT_SECONDS = Histogram(
+    "vibecaas_build_queue_wait_seconds",
+    "Time from enqueue to a worker picking the build up",
+    ["priority"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+BUILD_QUEUE_RUN_SECONDS = Histogram(
+    "vibecaas_build_queue_run_seconds",
+    "Time a worker spent on a build",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800),
+)
+BUILD_QUEUE_JOBS = Counter("vibecaas_build_queue_jobs_total", "Builds by final status", ["status"])
+
+
+@dataclass
+class BuildJob:
+    build_id: str
+    project_id: int
+    user_id: int
+    tenant_id: int
+    priority: int = 0
+    status: str = QUEUED
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # Kept by the backend apart from the job, so a worker saving its copy cannot clear it
+    cancel_requested: bool = False
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> "BuildJob":
+        return cls(**json.loads(raw))
+
+
+class InMemoryBuildQueueBackend:
+    """Single-process backend; jobs are lost on restart.
+
+    Finished jobs are forgotten after `job_ttl` seconds, or sooner once more
+    than `max_finished` of them are kept.
+    """
+
+    def __init__(self, job_ttl: float = 7 * 24 * 3600, max_finished: int = 10000) -> None:
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+        self._jobs: Dict[str, BuildJob] = {}
+        self._cancels: Set[str] = set()
+        # build id -> finish time, oldest first
+        self._finished: Dict[str, float] = {}
+        # priority -> tenant -> FIFO of build ids; dict order is the round-robin order
+        self._queues: Dict[int, Dict[int, Deque[str]]] = {p: {} for p in PRIORITIES}
+
+    async def enqueue(self, job: BuildJob, front: bool = False) -> None:
+        self._jobs[job.build_id] = job
+        queue = self._queues[job.priority].setdefault(job.tenant_id, deque())
+        if front:
+            queue.appendleft(job.build_id)
+        else:
+            queue.append(job.build_id)
+
+    async def dequeue(self) -> Optional[BuildJob]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            tenant_id = next(iter(tenants))
+            queue = tenants.pop(tenant_id)
+            build_id = queue.popleft()
+            if queue:
+                tenants[tenant_id] = queue  # back of the line
+            return self._jobs[build_id]
+        return None
+
+    async def remove_queued(self, job: BuildJob) -> bool:
+        queue = self._queues[job.priority].get(job.tenant_id)
+        if not queue or job.build_id not in queue:
+            return False
+        queue.remove(job.build_id)
+        if not queue:
+            del self._queues[job.priority][job.tenant_id]
+        return True
+
+    async def get(self, build_id: str) -> Optional[BuildJob]:
+        job = self._jobs.get(build_id)
+        if job is not None:
+            job.cancel_requested = job.cancel_requested or build_id in self._cancels
+        return job
+
+    async def save(self, job: BuildJob) -> None:
+        self._jobs[job.build_id] = job
+        if job.status in FINISHED and job.build_id not in self._finished:
+            self._finished[job.build_id] = job.finished_at or time.time()
+            self._prune()
+
+    async def request_cancel(self, build_id: str) -> None:
+        self._cancels.add(build_id)
+
+    async def cancel_requested(self, build_id: str) -> bool:
+        return build_id in self._cancels
+
+    async def depth(self) -> Dict[int, int]:
+        return {p: sum(len(q) for q in tenants.values()) for p, tenants in self._queues.items()}
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.job_ttl
+        while self._finished:
+            build_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff and len(self._finished) <= self.max_finished:
+                break
+            del self._finished[build_id]
+            self._jobs.pop(build_id, None)
+            self._cancels.discard(build_id)
+
+    async def lease(self, build_id: str, seconds: float) -> None:
+        pass
+
+    async def release(self, build_id: str) -> None:
+        pass
+
+    async def recover(self) -> int:
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+
+# Pops the next build id: highest priority first, then the tenant at the front of
+# that priority's round-robin zset, which is moved to the back afterwards.
+_DEQUEUE_SCRIPT = """
+local prefix = ARGV[1]
+for i = 2, #ARGV do
+    local tenants = prefix .. ':' .. ARGV[i] .. ':tenants'
+    local first = redis.call('ZRANGE', tenants, 0, 0)
+    if #first > 0 then
+        local list = prefix .. ':' .. ARGV[i] .. ':tenant:' .. first[1]
+        local build_id = redis.call('LPOP', list)
+        if redis.call('LLEN', list) == 0 then
+            redis.call('ZREM', tenants, first[1])
+        else
+            redis.call('ZADD', tenants, redis.call('INCR', prefix .. ':rr'), first[1])
+        end
+        if build_id then
+            redis.call('HINCRBY', prefix .. ':depth', ARGV[i], -1)
+            return build_id
+        end
+    end
+end
+return false
+"""
+
+
+class RedisBuildQueueBackend:
+    """Durable backend shared by every API replica.
+
+    Per priority there is one list per tenant plus a zset ordering the tenants
+    with queued builds; dequeue is a single Lua script so replicas never hand
+    out the same build. Running builds hold a lease that workers refresh; a
+    build whose lease lapses (its replica died) is put back at the front of
+    its tenant's list.
+    """
+
+    def __init__(self, url: str, prefix: str = "buildq", job_ttl: int = 7 * 24 * 3600) -> None:
+        self.redis = aioredis.Redis.from_url(url)
+        self.prefix = prefix
+        self.job_ttl = job_ttl
+        self._dequeue = self.redis.register_script(_DEQUEUE_SCRIPT)
+
+    def _list(self, priority: int, tenant_id: int) -> str:
+        return f"{self.prefix}:{priority}:tenant:{tenant_id}"
+
+    def _tenants(self, priority: int) -> str:
+        return f"{self.prefix}:{priority}:tenants"
+
+    def _job(self, build_id: str) -> str:
+        return f"{self.prefix}:job:{build_id}"
+
+    def _cancel(self, build_id: str) -> str:
+        return f"{self.prefix}:cancel:{build_id}"
+
+    async def enqueue(self, job: BuildJob, front: bool = False) -> None:
+        order = await self.redis.incr(f"{self.prefix}:rr")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._job(job.build_id), job.to_json(), ex=self.job_ttl)
+            if front:
+                pipe.lpush(self._list(job.priority, job.tenant_id), job.build_id)
+            else:
+                pipe.rpush(self._list(job.priority, job.tenant_id), job.build_id)
+            pipe.zadd(self._tenants(job.priority), {str(job.tenant_id): order}, nx=True)
+            pipe.hincrby(f"{self.prefix}:depth", str(job.priority), 1)
+            await pipe.execute()
+
+    async def dequeue(self) -> Optional[BuildJob]:
+        build_id = await self._dequeue(args=[self.prefix, *PRIORITIES])
+        if not build_id:
+            return None
+        return await self.get(build_id.decode())
+
+    async def remove_queued(self, job: BuildJob) -> bool:
+        removed = await self.redis.lrem(self._list(job.priority, job.tenant_id), 0, job.build_id)
+        if not removed:
+            return False
+        await self.redis.hincrby(f"{self.prefix}:depth", str(job.priority), -1)
+        if not await self.redis.llen(self._list(job.priority, job.tenant_id)):
+            await self.redis.zrem(self._tenants(job.priority), str(job.tenant_id))
+        return True
+
+    async def get(self, build_id: str) -> Optional[BuildJob]:
+        raw, cancel = await self.redis.mget(self._job(build_id), self._cancel(build_id))
+        if not raw:
+            return None
+        job = BuildJob.from_json(raw)
+        job.cancel_requested = job.cancel_requested or bool(cancel)
+        return job
+
+    async def save(self, job: BuildJob) -> None:
+        await self.redis.set(self._job(job.build_id), job.to_json(), ex=self.job_ttl)
+
+    async def request_cancel(self, build_id: str) -> None:
+        await self.redis.set(self._cancel(build_id), 1, ex=self.job_ttl)
+
+    async def cancel_requested(self, build_id: str) -> bool:
+        return bool(await self.redis.exists(self._cancel(build_id)))
+
+    async def depth(self) -> Dict[int, int]:
+        raw = await self.redis.hgetall(f"{self.prefix}:depth")
+        return {p: max(int(raw.get(str(p).encode(), 0)), 0) for p in PRIORITIES}
+
+    async def lease(self, build_id: str, seconds: float) -> None:
+        await self.redis.zadd(f"{self.prefix}:running", {build_id: time.time() + seconds})
+
+    async def release(self, build_id: str) -> None:
+        await self.redis.zrem(f"{self.prefix}:running", build_id)
+
+    async def recover(self) -> int:
+        """Requeue running builds whose lease expired"""
+        expired = await self.redis.zrangebyscore(f"{self.prefix}:running", 0, time.time())
+        recovered = 0
+        for raw_id in expired:
+            # Only one replica wins the ZREM, so only one requeues
+            if not await self.redis.zrem(f"{self.prefix}:running", raw_id):
+                continue
+            job = await self.get(raw_id.decode())
+            if job is None or job.status in FINISHED:
+                continue
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                await self.save(job)
+                continue
+            job.status = QUEUED
+            job.started_at = None
+            await self.enqueue(job, front=True)
+            recovered += 1
+        return recovered
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class BuildQueue:
+    """Fixed-size pool of build workers fed from a fair, prioritised queue"""
+
+    def __init__(
+        self,
+        backend,
+        workers: int,
+        handler: Callable[[BuildJob], Awaitable[bool]],
+        poll_interval: float = 1.0,
+        lease_seconds: float = 60.0,
+    ) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Builds whose task was cancelled on request, as opposed to by this worker shutting down
+        self._user_cancelled: Set[str] = set()
+
+    async def enqueue(self, project_id: int, user_id: int, tenant_id: int, tier: str, build_id: Optional[str] = None) -> BuildJob:
+        job = BuildJob(
+            build_id=build_id or uuid.uuid4().hex,
+            project_id=project_id,
+            user_id=user_id,
+            tenant_id=tenant_id,
+            priority=TIER_PRIORITY.get(tier, 0),
+        )
+        await self.backend.enqueue(job)
+        self._wakeup.set()
+        return job
+
+    async def get(self, build_id: str) -> Optional[BuildJob]:
+        return await self.backend.get(build_id)
+
+    async def cancel(self, build_id: str) -> Optional[BuildJob]:
+        """Drop a queued build, or stop a running one (on whichever replica runs it)"""
+        job = await self.backend.get(build_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.status == QUEUED and await self.backend.remove_queued(job):
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            await self.backend.save(job)
+            BUILD_QUEUE_JOBS.labels(CANCELLED).inc()
+            return job
+        job.cancel_requested = True
+        await self.backend.request_cancel(build_id)
+        self._cancel_running(build_id)
+        return job
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._maintenance()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.backend.close()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self.backend.dequeue()
+            except Exception as e:
+                logger.warning(f"Build queue dequeue failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job.status == CANCELLED:
+                continue
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                BUILD_QUEUE_JOBS.labels(CANCELLED).inc()
+                await self.backend.save(job)
+                continue
+            await self._run(job)
+
+    async def _run(self, job: BuildJob) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        BUILD_QUEUE_WAIT_SECONDS.labels(str(job.priority)).observe(job.started_at - job.enqueued_at)
+        await self.backend.save(job)
+        await self.backend.lease(job.build_id, self.lease_seconds)
+        BUILD_QUEUE_RUNNING.inc()
+        task = asyncio.create_task(self.handler(job))
+        self._running[job.build_id] = task
+        try:
+            # A cancel that arrived between dequeue and now found no task to stop
+            if await self.backend.cancel_requested(job.build_id):
+                self._cancel_running(job.build_id)
+            # wait() keeps a cancel of this worker from being forwarded to (and swallowed by) the build
+            await asyncio.wait({task})
+            ok = task.result()
+            job.status = SUCCEEDED if ok else FAILED
+        except asyncio.CancelledError:
+            if job.build_id not in self._user_cancelled:
+                # The worker itself is shutting down: hand the build back instead of finishing it
+                task.cancel()
+                await self._requeue(job)
+                raise
+            job.status = CANCELLED
+        except Exception as e:
+            logger.error(f"Build {job.build_id} crashed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            self._running.pop(job.build_id, None)
+            self._user_cancelled.discard(job.build_id)
+            BUILD_QUEUE_RUNNING.dec()
+        job.finished_at = time.time()
+        BUILD_QUEUE_RUN_SECONDS.observe(job.finished_at - job.started_at)
+        BUILD_QUEUE_JOBS.labels(job.status).inc()
+        await self.backend.save(job)
+        await self.backend.release(job.build_id)
+
+    def _cancel_running(self, build_id: str) -> None:
+        task = self._running.get(build_id)
+        if task:
+            self._user_cancelled.add(build_id)
+            task.cancel()
+
+    async def _requeue(self, job: BuildJob) -> None:
+        job.status = QUEUED
+        job.started_at = None
+        try:
+            await self.backend.enqueue(job, front=True)
+            await self.backend.release(job.build_id)
+        except Exception as e:
+            # Redis keeps the lease, so another replica's recover() requeues it once it lapses
+            logger.warning(f"Could not requeue build {job.build_id} on shutdown: {e}")
+
+    async def _maintenance(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                for build_id, task in list(self._running.items()):
+                    await self.backend.lease(build_id, self.lease_seconds)
+                    if await self.backend.cancel_requested(build_id):
+                        self._cancel_running(build_id)
+                recovered = await self.backend.recover()
+                if recovered:
+                    logger.warning(f"Requeued {recovered} builds with expired leases")
+                    self._wakeup.set()
+                for priority, depth in (await self.backend.depth()).items():
+                    BUILD_QUEUE_DEPTH.labels(str(priority)).set(depth)
+            except Exception as e:
+                logger.warning(f"Build queue maintenance failed: {e}")
+
+
+async def _run_deploy(job: BuildJob) -> bool:
+    from ..db import SessionLocal
+    from .project_service import ProjectService
+
+    db = SessionLocal()
+    try:
+        return await ProjectService(db).deploy_project(job.project_id, job.user_id, build_id=job.build_id)
+    finally:
+        db.close()
+
+
+def _make_backend():
+    if settings.build_queue_backend == "redis":
+        return RedisBuildQueueBackend(settings.redis_url)
+    return InMemoryBuildQueueBackend()
+
+
+build_queue = BuildQueue(
+    backend=_make_backend(),
+    workers=settings.build_workers,
+    handler=_run_deploy,
+    lease_seconds=settings.build_queue_lease_seconds,
+)
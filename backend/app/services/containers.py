@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import asyncio
-import os
-from typing import Any, Dict
+import time
+from typing import Any, AsyncIterator, Dict, Optional
 
 import docker
 from sqlalchemy import select
@@ -11,47 +11,84 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ..config import settings
 from ..db import AsyncSessionLocal
 from ..models.app import App, AppStatus
+from .docker_client import docker_clients
+from .docker_executor import docker_executor, parse_op_overrides
+from .image_manager import ImageManager
+from .log_stream import LogLine, stream_container_logs
+from .stats_collector import stats_collector
+from .warm_pool import TIME_TO_RUNNING, WarmPool, WarmTemplate
+
+# Base images whose default command exits at once without a TTY (a REPL or a shell). Their
+# containers get a keep-alive command instead, or the warm pool could not pause them
+KEEP_ALIVE_IMAGES = {"node:20-alpine", "golang:1.22-alpine", "busybox"}
+KEEP_ALIVE_COMMAND = ["sleep", "infinity"]
 
 
 class ContainerService:
-    def __init__(self) -> None:
-        # Local docker socket; in compose we can mount it if needed
-        docker_host = os.getenv("DOCKER_HOST")
-        self.client = docker.from_env() if not docker_host else docker.DockerClient(base_url=docker_host)
+    def __init__(self, docker_client: Optional[docker.DockerClient] = None) -> None:
+        self._client = docker_client
+        self.warm_pool = WarmPool(
+            client=lambda: self.client,
+            templates={
+                "fastapi": WarmTemplate(self._resolve_image("fastapi", False)),
+                "node": WarmTemplate(self._resolve_image("node", False)),
+                "go": WarmTemplate(self._resolve_image("go", False)),
+                "cuda": WarmTemplate(self._resolve_image("cuda", True), gpu=True),
+            },
+            targets=parse_op_overrides(settings.warm_pool_targets, int),
+            create_kwargs=lambda template: self._base_run_kwargs(template.image, template.gpu),
+            replenish_interval=settings.warm_pool_replenish_interval,
+        )
+        catalogue = [t.image for t in self.warm_pool.templates.values() if settings.enable_gpu_support or not t.gpu]
+        catalogue += [image.strip() for image in settings.image_prepull_extra.split(",") if image.strip()]
+        self.images = ImageManager(
+            client=lambda: self.client,
+            catalogue=catalogue,
+            disk_budget_bytes=int(settings.image_disk_budget_gb * 1024 ** 3),
+            gc_interval=settings.image_gc_interval,
+            prepull=settings.image_prepull_on_startup,
+        )
+
+    @property
+    def client(self) -> docker.DockerClient:
+        # Resolved on each use so a reconnect by the registry is picked up
+        return self._client or docker_clients.get()
 
     async def _get_app(self, app_id) -> App | None:
         async with AsyncSessionLocal() as db:
             result = await db.execute(select(App).where(App.id == app_id))
             return result.scalar_one_or_none()
 
+    async def _get_container(self, container_id: str):
+        return await docker_executor.run("get", self.client.containers.get, container_id)
+
     async def create_container_for_app(self, app_id) -> None:
         app = await self._get_app(app_id)
         if not app:
             return
         async with AsyncSessionLocal() as db:
             try:
+                started = time.perf_counter()
                 image = self._resolve_image(app.framework, app.gpu_enabled)
-                ports = {"3000/tcp": None, "8000/tcp": None}
+                gpu = bool(app.gpu_enabled and settings.enable_gpu_support)
+                name = f"vibecaas-{app.id}"
                 mem_limit = f"{int(app.memory_limit)}m"
                 cpu_quota = int(app.cpu_limit) * 100000
 
-                kwargs: Dict[str, Any] = {
-                    "image": image,
-                    "detach": True,
-                    "environment": {"PORT": "8000"},
-                    "ports": {"8000/tcp": None},
-                    "name": f"vibecaas-{app.id}",
-                    "host_config": self.client.api.create_host_config(
+                container = await self.warm_pool.claim(image, gpu, name, mem_limit, cpu_quota)
+                source = "warm"
+                if container is None:
+                    await self.images.ensure(image)
+                    kwargs = self._base_run_kwargs(image, gpu)
+                    kwargs["name"] = name
+                    kwargs["host_config"] = self.client.api.create_host_config(
                         mem_limit=mem_limit,
                         cpu_quota=cpu_quota,
-                    ),
-                }
-
-                if app.gpu_enabled and settings.enable_gpu_support:
-                    # Request all GPUs or 1 GPU depending on tier; simplified
-                    kwargs["device_requests"] = [docker.types.DeviceRequest(count=-1, capabilities=[["gpu"]])]
-
-                container = self.client.containers.run(**kwargs)
+                    )
+                    container = await docker_executor.run("run", self.client.containers.run, **kwargs)
+                    source = "cold"
+                TIME_TO_RUNNING.labels(source).observe(time.perf_counter() - started)
+                self.images.touch(image)
                 # Update
                 app.container_id = container.id
                 app.status = AppStatus.RUNNING
@@ -70,8 +107,8 @@ class ContainerService:
             await self.create_container_for_app(app.id)
             return
         try:
-            container = self.client.containers.get(app.container_id)
-            container.start()
+            container = await self._get_container(app.container_id)
+            await docker_executor.run("start", container.start)
         except Exception:
             pass
 
@@ -79,8 +116,8 @@ class ContainerService:
         if not app.container_id:
             return
         try:
-            container = self.client.containers.get(app.container_id)
-            container.stop()
+            container = await self._get_container(app.container_id)
+            await docker_executor.run("stop", container.stop)
         except Exception:
             pass
 
@@ -88,8 +125,8 @@ class ContainerService:
         if not app.container_id:
             return
         try:
-            container = self.client.containers.get(app.container_id)
-            container.restart()
+            container = await self._get_container(app.container_id)
+            await docker_executor.run("restart", container.restart)
         except Exception:
             pass
 
@@ -97,8 +134,8 @@ class ContainerService:
         if not app.container_id:
             return
         try:
-            container = self.client.containers.get(app.container_id)
-            container.remove(force=True)
+            container = await self._get_container(app.container_id)
+            await docker_executor.run("remove", container.remove, force=True)
             app.status = AppStatus.DELETED
         except Exception:
             pass
@@ -107,26 +144,50 @@ class ContainerService:
         if not app.container_id:
             return ""
         try:
-            container = self.client.containers.get(app.container_id)
-            return container.logs(tail=500).decode("utf-8", errors="ignore")
+            container = await self._get_container(app.container_id)
+            logs = await docker_executor.run("logs", container.logs, tail=500)
+            return logs.decode("utf-8", errors="ignore")
         except Exception:
             return ""
 
+    def stream_logs(
+        self,
+        app: App,
+        after_ns: Optional[int] = None,
+        follow: bool = True,
+        tail: int = 100,
+    ) -> AsyncIterator[Optional[LogLine]]:
+        return stream_container_logs(
+            self.client.api,
+            app.container_id,
+            after_ns=after_ns,
+            follow=follow,
+            tail=tail,
+            idle_timeout=settings.log_stream_heartbeat_seconds,
+        )
+
     async def get_stats(self, app: App) -> dict:
         if not app.container_id:
             return {"cpu": 0, "memory": 0}
-        try:
-            container = self.client.containers.get(app.container_id)
-            stats = container.stats(stream=False)
-            cpu_delta = stats["cpu_stats"]["cpu_usage"]["total_usage"] - stats["precpu_stats"]["cpu_usage"]["total_usage"]
-            system_delta = stats["cpu_stats"]["system_cpu_usage"] - stats["precpu_stats"]["system_cpu_usage"]
-            cpu_percent = (cpu_delta / system_delta) * len(stats["cpu_stats"]["cpu_usage"].get("percpu_usage", []) or [1]) * 100 if system_delta else 0
-            mem_usage = stats["memory_stats"].get("usage", 0)
-            mem_limit = stats["memory_stats"].get("limit", 1)
-            mem_percent = (mem_usage / mem_limit) * 100
-            return {"cpu": round(cpu_percent, 2), "memory": round(mem_percent, 2)}
-        except Exception:
+        snapshot = stats_collector.get(f"vibecaas-{app.id}")
+        if snapshot is None:
             return {"cpu": 0, "memory": 0}
+        return {"cpu": snapshot.cpu_percent, "memory": snapshot.memory_percent}
+
+    def _base_run_kwargs(self, image: str, gpu: bool) -> Dict[str, Any]:
+        # Everything here is fixed at create time, so warm pool templates share it
+        kwargs: Dict[str, Any] = {
+            "image": image,
+            "detach": True,
+            "environment": {"PORT": "8000"},
+            "ports": {"8000/tcp": None},
+        }
+        if image in KEEP_ALIVE_IMAGES:
+            kwargs["command"] = KEEP_ALIVE_COMMAND
+        if gpu:
+            # Request all GPUs or 1 GPU depending on tier; simplified
+            kwargs["device_requests"] = [docker.types.DeviceRequest(count=-1, capabilities=[["gpu"]])]
+        return kwargs
 
     def _resolve_image(self, framework: str, gpu: bool) -> str:
         # Simplified templates
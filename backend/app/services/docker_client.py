@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Set
+
+import docker
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+# Request/response traffic shares the default client. Long-lived streams (stats
+# subscriptions) hold a connection each, so they get a client of their own and
+# cannot starve the default pool.
+DEFAULT_CLIENT = "default"
+STREAMS_CLIENT = "streams"
+
+# Reconnects asked for by `get` are at least this far apart while Docker is down
+RECONNECT_MIN_INTERVAL = 1.0
+
+DOCKER_CLIENTS_OPEN = Gauge("vibecaas_docker_clients_open", "Docker clients currently held by the registry")
+DOCKER_CLIENT_HEALTHY = Gauge("vibecaas_docker_client_healthy", "1 if the last health check of a client passed", ["client"])
+DOCKER_CLIENT_CONNECTS = Counter("vibecaas_docker_client_connects_total", "Docker clients created (first connect or reconnect)", ["client"])
+
+
+class DockerUnavailable(docker.errors.DockerException):
+    """No connected client; the registry reconnects in the background"""
+
+
+class DockerClientRegistry:
+    """Process-wide docker clients, connected off the event loop.
+
+    Clients are thread-safe and keep a urllib3 connection pool, so one per
+    purpose is enough for the whole process. Creating one negotiates the API
+    version over the socket, so `get` never does it: it returns the cached
+    client or raises DockerUnavailable. Clients are created by `aget`
+    (through the docker executor), by `connect` from worker threads, and by
+    the health loop, which pings each client, drops the ones that fail and
+    reconnects them right away.
+    """
+
+    def __init__(self, max_pool_size: int, timeout: int, health_interval: float) -> None:
+        self.max_pool_size = max_pool_size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._clients: Dict[str, docker.DockerClient] = {}
+        # Every name ever asked for, so the health loop knows what to reconnect
+        self._wanted: Set[str] = {DEFAULT_CLIENT}
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def get(self, name: str = DEFAULT_CLIENT) -> docker.DockerClient:
+        """Connected client for `name`; never blocks"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        self._wanted.add(name)
+        self._wakeup.set()
+        raise DockerUnavailable(f"Docker client '{name}' is not connected")
+
+    def connect(self, name: str = DEFAULT_CLIENT) -> docker.DockerClient:
+        """Client for `name`, connecting if needed (blocking: worker threads only)"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            self._wanted.add(name)
+            client = self._clients.get(name)
+            if client is None:
+                # from_env honours DOCKER_HOST / DOCKER_TLS_VERIFY / DOCKER_CERT_PATH
+                client = docker.from_env(max_pool_size=self.max_pool_size, timeout=self.timeout)
+                self._clients[name] = client
+                DOCKER_CLIENTS_OPEN.set(len(self._clients))
+                DOCKER_CLIENT_CONNECTS.labels(name).inc()
+            return client
+
+    async def aget(self, name: str = DEFAULT_CLIENT) -> docker.DockerClient:
+        """`get` for async callers that can wait for a connect, which runs on the docker executor"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        return await docker_executor.run("connect", self.connect, name)
+
+    def reset(self, name: str) -> None:
+        """Drop a client; the health loop reconnects it"""
+        with self._lock:
+            client = self._clients.pop(name, None)
+            DOCKER_CLIENTS_OPEN.set(len(self._clients))
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    async def check(self) -> Dict[str, bool]:
+        """Ping every open client, resetting the ones that fail, and (re)connect missing ones"""
+        results: Dict[str, bool] = {}
+        for name, client in list(self._clients.items()):
+            try:
+                await docker_executor.run("ping", client.ping)
+                results[name] = True
+            except Exception as e:
+                logger.warning(f"Docker client '{name}' failed health check, reconnecting: {e}")
+                results[name] = False
+                self.reset(name)
+            DOCKER_CLIENT_HEALTHY.labels(name).set(1 if results[name] else 0)
+        await self.reconnect()
+        return results
+
+    async def reconnect(self) -> None:
+        for name in sorted(self._wanted - set(self._clients)):
+            try:
+                await self.aget(name)
+            except Exception as e:
+                logger.warning(f"Docker client '{name}' could not connect: {e}")
+                DOCKER_CLIENT_HEALTHY.labels(name).set(0)
+
+    async def start(self) -> None:
+        try:
+            await self.aget(DEFAULT_CLIENT)
+        except Exception as e:
+            # The health loop keeps retrying the connect
+            logger.warning(f"Docker not reachable at startup: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for name in self.names():
+            self.reset(name)
+
+    def names(self) -> List[str]:
+        return list(self._clients)
+
+    async def _health_loop(self) -> None:
+        while True:
+            # A `get` that found no client cuts the wait short
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.health_interval)
+                self._wakeup.clear()
+                await self.reconnect()
+                await asyncio.sleep(RECONNECT_MIN_INTERVAL)
+            except asyncio.TimeoutError:
+                await self.check()
+
+
+docker_clients = DockerClientRegistry(
+    max_pool_size=settings.docker_max_pool_size,
+    timeout=settings.docker_client_timeout,
+    health_interval=settings.docker_health_interval,
+)
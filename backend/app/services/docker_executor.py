@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..config import settings
+
+T = TypeVar("T")
+
+# Timeouts (seconds) for the docker SDK calls the services make. `stats(stream=False)`
+# takes 1-2s by design because the daemon samples twice before answering.
+DEFAULT_OP_TIMEOUTS: Dict[str, float] = {
+    "connect": 15.0,
+    "ping": 5.0,
+    "get": 10.0,
+    "list": 15.0,
+    "run": 120.0,
+    "warm": 300.0,
+    "pull": 900.0,
+    "start": 30.0,
+    "stop": 30.0,
+    "restart": 60.0,
+    "remove": 30.0,
+    "logs": 15.0,
+    "stats": 10.0,
+}
+
+# Operations that are expensive for the daemon get a tighter concurrency cap than the
+# pool size; anything not listed may use every worker.
+DEFAULT_OP_CONCURRENCY: Dict[str, int] = {
+    "run": 4,
+    "warm": 2,
+    "pull": 2,
+    "build": 2,
+    "stats": 16,
+    "logs": 8,
+}
+
+DOCKER_OP_QUEUE_DEPTH = Gauge("vibecaas_docker_op_queue_depth", "Docker calls waiting for a worker", ["op"])
+DOCKER_OP_IN_FLIGHT = Gauge("vibecaas_docker_op_in_flight", "Docker calls currently executing", ["op"])
+DOCKER_OP_WAIT_SECONDS = Histogram(
+    "vibecaas_docker_op_wait_seconds",
+    "Time a docker call spent queued before a worker picked it up",
+    ["op"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DOCKER_OP_DURATION_SECONDS = Histogram(
+    "vibecaas_docker_op_duration_seconds",
+    "Execution time of docker calls",
+    ["op"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+DOCKER_OP_TIMEOUTS = Counter("vibecaas_docker_op_timeouts_total", "Docker calls that exceeded their timeout", ["op"])
+DOCKER_OP_ERRORS = Counter("vibecaas_docker_op_errors_total", "Docker calls that raised", ["op"])
+
+
+class DockerTimeoutError(TimeoutError):
+    """Raised when a docker call does not complete within its operation timeout"""
+
+
+def parse_op_overrides(raw: str, cast: Callable[[str], Any]) -> Dict[str, Any]:
+    """Parse "op=value,op=value" settings strings"""
+    overrides: Dict[str, Any] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        op, value = item.split("=", 1)
+        overrides[op.strip()] = cast(value.strip())
+    return overrides
+
+
+class DockerExecutor:
+    """Runs blocking docker SDK calls on a dedicated, bounded thread pool.
+
+    Each call is tagged with an operation name used for its timeout, its
+    concurrency cap and its metrics. A call that times out after it has started
+    keeps its worker until the SDK returns; the pool size is the hard bound.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        default_timeout: float,
+        timeouts: Dict[str, float] | None = None,
+        concurrency: Dict[str, int] | None = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.timeouts = {**DEFAULT_OP_TIMEOUTS, **(timeouts or {})}
+        self.concurrency = {**DEFAULT_OP_CONCURRENCY, **(concurrency or {})}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="docker")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, op: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(op)
+        if semaphore is None:
+            limit = min(self.concurrency.get(op, self.max_workers), self.max_workers)
+            semaphore = self._semaphores[op] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def run(self, op: str, fn: Callable[..., T], *args: Any, timeout: float | None = None, **kwargs: Any) -> T:
+        """Execute `fn(*args, **kwargs)` off the event loop under the limits for `op`"""
+        timeout = timeout if timeout is not None else self.timeouts.get(op, self.default_timeout)
+        try:
+            return await asyncio.wait_for(self._submit(op, fn, args, kwargs), timeout)
+        except asyncio.TimeoutError as exc:
+            DOCKER_OP_TIMEOUTS.labels(op).inc()
+            raise DockerTimeoutError(f"docker {op} timed out after {timeout:.1f}s") from exc
+
+    async def _submit(self, op: str, fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        queue_depth = DOCKER_OP_QUEUE_DEPTH.labels(op)
+        queued_at = time.perf_counter()
+        lock = threading.Lock()
+        state = {"started": False, "abandoned": False}
+        queue_depth.inc()
+
+        def call() -> T:
+            with lock:
+                if state["abandoned"]:
+                    raise asyncio.CancelledError()
+                state["started"] = True
+            started_at = time.perf_counter()
+            queue_depth.dec()
+            DOCKER_OP_WAIT_SECONDS.labels(op).observe(started_at - queued_at)
+            in_flight = DOCKER_OP_IN_FLIGHT.labels(op)
+            in_flight.inc()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                DOCKER_OP_ERRORS.labels(op).inc()
+                raise
+            finally:
+                in_flight.dec()
+                DOCKER_OP_DURATION_SECONDS.labels(op).observe(time.perf_counter() - started_at)
+
+        try:
+            async with self._semaphore(op):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, call)
+        finally:
+            with lock:
+                if not state["started"]:
+                    state["abandoned"] = True
+                    queue_depth.dec()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+docker_executor = DockerExecutor(
+    max_workers=settings.docker_executor_workers,
+    default_timeout=settings.docker_op_timeout,
+    timeouts=parse_op_overrides(settings.docker_op_timeouts, float),
+    concurrency=parse_op_overrides(settings.docker_op_concurrency, int),
+)
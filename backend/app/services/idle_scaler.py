@@ -0,0 +1,455 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import func, insert, or_, select, update
+
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..models.app import App, AppStatus
+from ..models.microvm import MicroVM, MicroVMEvent, MicroVMStatus
+from .docker_client import docker_clients
+from .docker_executor import docker_executor
+from .stats_collector import CONTAINER_NAME_PREFIX, stats_collector
+from .vm_control import VMControlClient, vm_control
+
+logger = logging.getLogger(__name__)
+
+IDLE_SUSPENDED = Counter("vibecaas_idle_suspended_total", "Idle targets suspended", ["kind"])
+IDLE_WAKES = Counter("vibecaas_idle_wakes_total", "Suspended targets woken by a request", ["kind", "result"])
+IDLE_WAKE_SECONDS = Histogram(
+    "vibecaas_idle_wake_seconds",
+    "Time from the first request to a suspended target until it runs again",
+    ["kind"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+IDLE_RECLAIMED_CPU = Gauge("vibecaas_idle_reclaimed_cpu_cores", "CPU cores freed by suspended targets", ["kind"])
+IDLE_RECLAIMED_MEMORY = Gauge("vibecaas_idle_reclaimed_memory_mb", "Memory freed by suspended targets", ["kind"])
+
+MICROVM = "microvm"
+APP = "app"
+
+# Set on replayed requests so an upstream that still fails is not woken again in a loop
+REPLAY_HEADER = "X-VibeCaaS-Replayed"
+
+# Sent by the edge with EDGE_WAKE_SECRET; the wake endpoint ignores requests without it
+EDGE_SECRET_HEADER = "X-VibeCaaS-Edge-Secret"
+
+# Only these are replayed after a wake; anything else may have side effects and is retried by the client
+REPLAY_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Not forwarded in either direction when a held request is replayed
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length", "content-encoding",
+    "x-original-host", "x-original-uri", "x-vibecaas-edge-secret",
+}
+
+WAKE_POLL_SECONDS = 0.1
+
+
+class WakeFailed(Exception):
+    """The target cannot be woken, or did not come back within the wake timeout"""
+
+
+class Target(NamedTuple):
+    kind: str  # MICROVM or APP
+    id: Any  # MicroVM.id or App.id
+    status: str
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _event(microvm_id: int, event_type: str, message: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {"microvm_id": microvm_id, "event_type": event_type, "message": message, "metadata": metadata}
+
+
+class IdleScaler:
+    """Scales idle MicroVMs and app containers to zero and wakes them on demand.
+
+    Usage samples arrive through `record`: every `interval` seconds a scan
+    feeds it the CPU of running MicroVMs that opted in with `auto_scale`
+    (one vm-control list request per region, also written back to
+    cpu_usage_percent / memory_usage_mb) and, with `include_apps`, of app
+    containers from the stats collector. A target counts as active while its
+    CPU is at or above `cpu_threshold`; one with no activity for
+    `idle_seconds` is suspended (vm-control suspend, docker stop) behind a
+    conditional RUNNING -> SUSPENDED update, so replicas do not suspend the
+    same target twice. Activity is tracked per process and starts counting
+    when a target is first seen.
+
+    The edge sends requests it could not deliver to the wake endpoint, which
+    holds the request, calls `wake` (one wake per target however many
+    requests are waiting) and `replay`s it through `edge_url` once the
+    target runs. Without an edge URL nothing is suspended or replayed.
+    """
+
+    def __init__(
+        self,
+        client: VMControlClient,
+        idle_seconds: float,
+        cpu_threshold: float,
+        interval: float,
+        wake_timeout: float,
+        include_apps: bool,
+        edge_url: str,
+        base_domain: str,
+        batch_size: int,
+    ) -> None:
+        self.client = client
+        self.idle_seconds = idle_seconds
+        self.cpu_threshold = cpu_threshold
+        self.interval = interval
+        self.wake_timeout = wake_timeout
+        self.include_apps = include_apps
+        self.edge_url = edge_url.rstrip("/")
+        self.base_domain = base_domain.lower()
+        self.batch_size = batch_size
+        self._last_active: Dict[Tuple[str, Any], float] = {}
+        self._waking: Dict[Tuple[str, Any], asyncio.Task] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+        self._task: asyncio.Task | None = None
+
+    def record(self, kind: str, target_id: Any, cpu_percent: Optional[float], now: Optional[float] = None) -> None:
+        """Take one usage sample; None means no sample, which only starts the idle clock"""
+        now = time.monotonic() if now is None else now
+        key = (kind, target_id)
+        if key not in self._last_active or (cpu_percent is not None and cpu_percent >= self.cpu_threshold):
+            self._last_active[key] = now
+
+    def touch(self, kind: str, target_id: Any) -> None:
+        """Mark a target active, e.g. because a request reached it"""
+        self._last_active[(kind, target_id)] = time.monotonic()
+
+    def idle_for(self, kind: str, target_id: Any, now: Optional[float] = None) -> float:
+        last = self._last_active.get((kind, target_id))
+        if last is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - last
+
+    async def scan(self) -> int:
+        """Sample every candidate and suspend the idle ones; returns how many were suspended"""
+        now = time.monotonic()
+        suspended = await self._scan_microvms(now)
+        if self.include_apps:
+            suspended += await self._scan_apps(now)
+        await self._report_reclaimed()
+        return suspended
+
+    async def resolve(self, host: str) -> Optional[Target]:
+        """The MicroVM (by dev_url) or app (by <subdomain>.<base domain>) served at `host`"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MicroVM.id, MicroVM.status).where(
+                    or_(MicroVM.dev_url == f"https://{host}", MicroVM.dev_url == f"http://{host}"),
+                    MicroVM.is_active == True,
+                )
+            )
+            row = result.first()
+            if row is not None:
+                return Target(MICROVM, row.id, row.status.value)
+            subdomain, _, domain = host.partition(".")
+            if self.include_apps and subdomain and domain == self.base_domain:
+                result = await db.execute(select(App.id, App.status).where(App.subdomain == subdomain))
+                row = result.first()
+                if row is not None:
+                    return Target(APP, row.id, row.status.value)
+        return None
+
+    async def wake(self, kind: str, target_id: Any) -> None:
+        """Bring a suspended target back; concurrent callers share one wake"""
+        key = (kind, target_id)
+        task = self._waking.get(key)
+        if task is None:
+            task = asyncio.create_task(self._wake(kind, target_id))
+            self._waking[key] = task
+            task.add_done_callback(lambda _: self._waking.pop(key, None))
+        # A caller that goes away does not cancel the wake for the others
+        await asyncio.shield(task)
+
+    def waking(self, kind: str, target_id: Any) -> bool:
+        return (kind, target_id) in self._waking
+
+    async def replay(
+        self, method: str, scheme: str, host: str, uri: str, headers: Mapping[str, str], body: bytes
+    ) -> httpx.Response:
+        """Send a held request to its original host through the edge at `edge_url`"""
+        if not self.edge_url:
+            raise WakeFailed("No edge URL configured to replay through")
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.wake_timeout, follow_redirects=False)
+        forwarded = {name: value for name, value in headers.items() if name.lower() not in HOP_BY_HOP}
+        forwarded["Host"] = host
+        forwarded["X-Forwarded-Proto"] = scheme
+        forwarded[REPLAY_HEADER] = "1"
+        return await self._http.request(method, f"{self.edge_url}{uri}", headers=forwarded, content=body)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _scan_microvms(self, now: float) -> int:
+        if not self.client.base_url:
+            return 0
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MicroVM.id, MicroVM.vm_id, MicroVM.vm_control_id, MicroVM.vm_control_region, MicroVM.region).where(
+                    MicroVM.status == MicroVMStatus.RUNNING,
+                    MicroVM.is_active == True,
+                    MicroVM.auto_scale == True,
+                    MicroVM.vm_control_id.is_not(None),
+                )
+            )
+            rows = result.all()
+        self._forget(MICROVM, {row.id for row in rows})
+        if not rows:
+            return 0
+
+        by_region: Dict[str, List[str]] = defaultdict(list)
+        for row in rows:
+            by_region[row.vm_control_region or row.region].append(row.vm_control_id)
+        states: Dict[str, Dict[str, Any]] = {}
+        for region, ids in by_region.items():
+            for i in range(0, len(ids), self.batch_size):
+                try:
+                    for state in await self.client.list_vms(region=region, ids=ids[i:i + self.batch_size]):
+                        states[state.get("id")] = state
+                except Exception as e:
+                    logger.warning(f"vm-control usage request for {region} failed: {e}")
+
+        usage = []
+        for row in rows:
+            state = states.get(row.vm_control_id)
+            cpu = state.get("cpu_usage_percent") if state else None
+            self.record(MICROVM, row.id, cpu, now)
+            if state is not None:
+                usage.append(
+                    {"id": row.id, "cpu_usage_percent": int(cpu or 0), "memory_usage_mb": int(state.get("memory_usage_mb") or 0)}
+                )
+        if usage:
+            async with AsyncSessionLocal() as db:
+                # ORM bulk UPDATE by primary key: one executemany for every sampled VM
+                await db.execute(update(MicroVM), usage)
+                await db.commit()
+
+        suspended = 0
+        for row in rows:
+            if self.idle_for(MICROVM, row.id, now) >= self.idle_seconds and await self._suspend_microvm(row, now):
+                suspended += 1
+        return suspended
+
+    async def _suspend_microvm(self, row: Any, now: float) -> bool:
+        idle = int(self.idle_for(MICROVM, row.id, now))
+        async with AsyncSessionLocal() as db:
+            # The row stays locked until vm-control has answered, so a wake cannot overtake the suspend
+            moved = await db.execute(
+                update(MicroVM)
+                .where(MicroVM.id == row.id, MicroVM.status == MicroVMStatus.RUNNING)
+                .values(status=MicroVMStatus.SUSPENDED, updated_at=_utcnow())
+                .returning(MicroVM.id)
+            )
+            if moved.scalar_one_or_none() is None:
+                return False
+            try:
+                await self.client.suspend_vm(row.vm_control_id)
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"Failed to suspend idle MicroVM {row.vm_id}: {e}")
+                return False
+            await db.execute(
+                insert(MicroVMEvent).values(
+                    **_event(row.id, "suspended", f"VM {row.vm_id} suspended after {idle}s idle", {"idle_seconds": idle})
+                )
+            )
+            await db.commit()
+        self._last_active.pop((MICROVM, row.id), None)
+        IDLE_SUSPENDED.labels(MICROVM).inc()
+        return True
+
+    async def _scan_apps(self, now: float) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(App.id, App.container_id).where(App.status == AppStatus.RUNNING, App.container_id.is_not(None))
+            )
+            rows = result.all()
+        self._forget(APP, {row.id for row in rows})
+        suspended = 0
+        for row in rows:
+            snapshot = stats_collector.get(f"{CONTAINER_NAME_PREFIX}{row.id}")
+            self.record(APP, row.id, snapshot.cpu_percent if snapshot else None, now)
+            if self.idle_for(APP, row.id, now) >= self.idle_seconds and await self._suspend_app(row):
+                suspended += 1
+        return suspended
+
+    async def _suspend_app(self, row: Any) -> bool:
+        async with AsyncSessionLocal() as db:
+            moved = await db.execute(
+                update(App)
+                .where(App.id == row.id, App.status == AppStatus.RUNNING)
+                .values(status=AppStatus.SUSPENDED)
+                .returning(App.id)
+            )
+            if moved.scalar_one_or_none() is None:
+                return False
+            try:
+                # Stopped rather than paused: a paused container still completes the TCP handshake, so
+                # the edge would wait out its read timeout instead of failing over to the wake endpoint
+                container = await docker_executor.run("get", docker_clients.get().containers.get, row.container_id)
+                await docker_executor.run("stop", container.stop)
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"Failed to stop idle app {row.id}: {e}")
+                return False
+            await db.commit()
+        self._last_active.pop((APP, row.id), None)
+        IDLE_SUSPENDED.labels(APP).inc()
+        return True
+
+    async def _wake(self, kind: str, target_id: Any) -> None:
+        started = time.perf_counter()
+        try:
+            if kind == MICROVM:
+                await self._wake_microvm(target_id)
+            else:
+                await self._wake_app(target_id)
+        except Exception:
+            IDLE_WAKES.labels(kind, "failed").inc()
+            raise
+        self.touch(kind, target_id)
+        IDLE_WAKES.labels(kind, "ok").inc()
+        IDLE_WAKE_SECONDS.labels(kind).observe(time.perf_counter() - started)
+
+    async def _wake_microvm(self, microvm_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MicroVM.vm_id, MicroVM.vm_control_id, MicroVM.status).where(MicroVM.id == microvm_id)
+            )
+            row = result.first()
+        if row is None or row.status == MicroVMStatus.RUNNING:
+            return
+        if row.status != MicroVMStatus.SUSPENDED or not row.vm_control_id:
+            raise WakeFailed(f"MicroVM {microvm_id} is {row.status.value}")
+        started = time.perf_counter()
+        await self.client.resume_vm(row.vm_control_id)
+        try:
+            await asyncio.wait_for(self._until_running(row.vm_control_id), self.wake_timeout)
+        except asyncio.TimeoutError:
+            raise WakeFailed(f"MicroVM {row.vm_id} did not resume within {self.wake_timeout}s")
+        seconds = round(time.perf_counter() - started, 3)
+        async with AsyncSessionLocal() as db:
+            moved = await db.execute(
+                update(MicroVM)
+                .where(MicroVM.id == microvm_id, MicroVM.status == MicroVMStatus.SUSPENDED)
+                .values(status=MicroVMStatus.RUNNING, updated_at=_utcnow())
+                .returning(MicroVM.id)
+            )
+            if moved.scalar_one_or_none() is not None:
+                await db.execute(
+                    insert(MicroVMEvent).values(
+                        **_event(microvm_id, "resumed", f"VM {row.vm_id} resumed on request", {"resume_seconds": seconds})
+                    )
+                )
+            await db.commit()
+
+    async def _until_running(self, vm_control_id: str) -> None:
+        while (await self.client.get_vm(vm_control_id)).get("status") != "running":
+            await asyncio.sleep(WAKE_POLL_SECONDS)
+
+    async def _wake_app(self, app_id: Any) -> None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(App.container_id, App.status).where(App.id == app_id))
+            row = result.first()
+        if row is None or row.status == AppStatus.RUNNING:
+            return
+        if row.status != AppStatus.SUSPENDED or not row.container_id:
+            raise WakeFailed(f"App {app_id} is {row.status.value}")
+        container = await docker_executor.run("get", docker_clients.get().containers.get, row.container_id)
+        await docker_executor.run("start", container.start)
+        try:
+            await asyncio.wait_for(self._until_started(container), self.wake_timeout)
+        except asyncio.TimeoutError:
+            raise WakeFailed(f"App {app_id} did not start within {self.wake_timeout}s")
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(App).where(App.id == app_id, App.status == AppStatus.SUSPENDED).values(status=AppStatus.RUNNING)
+            )
+            await db.commit()
+
+    async def _until_started(self, container: Any) -> None:
+        """Until the container runs and, if it has a healthcheck, reports healthy"""
+        while True:
+            await docker_executor.run("get", container.reload)
+            state = container.attrs.get("State", {})
+            health = state.get("Health")
+            if state.get("Running") and (health is None or health.get("Status") == "healthy"):
+                return
+            if state.get("Status") in ("exited", "dead"):
+                raise WakeFailed(f"Container {container.name} exited with {state.get('ExitCode')} while starting")
+            await asyncio.sleep(WAKE_POLL_SECONDS)
+
+    async def _report_reclaimed(self) -> None:
+        async with AsyncSessionLocal() as db:
+            vms = await db.execute(
+                select(func.coalesce(func.sum(MicroVM.cpu_cores), 0), func.coalesce(func.sum(MicroVM.memory_mb), 0)).where(
+                    MicroVM.status == MicroVMStatus.SUSPENDED, MicroVM.is_active == True
+                )
+            )
+            cpu, memory = vms.one()
+            IDLE_RECLAIMED_CPU.labels(MICROVM).set(cpu)
+            IDLE_RECLAIMED_MEMORY.labels(MICROVM).set(memory)
+            if self.include_apps:
+                apps = await db.execute(
+                    select(func.coalesce(func.sum(App.cpu_limit), 0), func.coalesce(func.sum(App.memory_limit), 0)).where(
+                        App.status == AppStatus.SUSPENDED
+                    )
+                )
+                cpu, memory = apps.one()
+                IDLE_RECLAIMED_CPU.labels(APP).set(cpu)
+                IDLE_RECLAIMED_MEMORY.labels(APP).set(memory)
+
+    def _forget(self, kind: str, current: set) -> None:
+        """Drop activity for targets that are no longer running"""
+        for key in [key for key in self._last_active if key[0] == kind and key[1] not in current]:
+            del self._last_active[key]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.warning(f"Idle scan failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+idle_scaler = IdleScaler(
+    client=vm_control,
+    idle_seconds=settings.idle_suspend_seconds,
+    cpu_threshold=settings.idle_cpu_threshold,
+    interval=settings.idle_scan_interval,
+    wake_timeout=settings.idle_wake_timeout,
+    include_apps=settings.idle_suspend_apps,
+    edge_url=settings.edge_url,
+    base_domain=settings.base_domain,
+    batch_size=settings.vm_reconcile_batch_size,
+)
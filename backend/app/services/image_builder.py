@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import docker
+from prometheus_client import Counter, Histogram
+
+from ..config import settings
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+BUILD_HASH_LABEL = "vibecaas.build.context-hash"
+
+# Written as .dockerignore when a project has none. Dependencies are installed
+# inside the image, so local node_modules never need to be sent to the daemon.
+DEFAULT_DOCKERIGNORE = [
+    ".git",
+    "node_modules",
+    "**/__pycache__",
+    "**/*.pyc",
+    ".next/cache",
+    "*.log",
+    ".DS_Store",
+]
+
+PROJECT_BUILD_SECONDS = Histogram(
+    "vibecaas_project_build_seconds",
+    "Image build time per project",
+    ["project"],
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200),
+)
+PROJECT_CONTEXT_HASH_SECONDS = Histogram(
+    "vibecaas_project_context_hash_seconds",
+    "Time to hash a project's build context",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+PROJECT_BUILDS = Counter("vibecaas_project_builds_total", "Project image builds by outcome", ["project", "result"])
+
+
+@dataclass
+class BuildResult:
+    tag: str
+    context_hash: str
+    cached: bool
+    duration: float
+
+
+def read_dockerignore(context_dir: str) -> List[str]:
+    path = os.path.join(context_dir, ".dockerignore")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def is_ignored(rel_path: str, patterns: List[str]) -> bool:
+    """Docker-style matching: the last matching pattern wins and '!' re-includes"""
+    ignored = False
+    parts = rel_path.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    for pattern in patterns:
+        negate = pattern.startswith("!")
+        pattern = pattern.lstrip("!").strip("/")
+        if pattern.startswith("**/"):
+            # Any run of path components, at any depth
+            pattern = pattern[3:]
+            candidates = ["/".join(parts[i:j]) for j in range(1, len(parts) + 1) for i in range(j)]
+        else:
+            candidates = prefixes
+        if any(fnmatch.fnmatchcase(candidate, pattern) for candidate in candidates):
+            ignored = not negate
+    return ignored
+
+
+class ImageBuilder:
+    """Builds project images, skipping the build when the context is unchanged.
+
+    The context hash covers every file docker would receive (.dockerignore
+    applied) and is stored as a label on the built image, so a deploy whose
+    tree hashes the same as the existing image reuses it. File digests are
+    memoised by (size, mtime) so rehashing an unchanged tree only stats it.
+    Builds go through the BuildKit CLI when available so generated
+    Dockerfiles can use cache mounts; otherwise docker-py's classic builder
+    is used.
+    """
+
+    def __init__(self, buildkit: bool) -> None:
+        self.buildkit = buildkit and shutil.which("docker") is not None
+        if buildkit and not self.buildkit:
+            logger.warning("docker CLI not found; building with the classic builder (no cache mounts)")
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        # hash_context runs in worker threads, one per concurrent deploy
+        self._digests_lock = threading.Lock()
+
+    def hash_context(self, context_dir: str) -> str:
+        """sha256 over the relative path, mode and content of each file in the build context"""
+        patterns = read_dockerignore(context_dir)
+        digest = hashlib.sha256()
+        seen = set()
+        for root, dirs, files in os.walk(context_dir):
+            rel_root = os.path.relpath(root, context_dir)
+            rel_root = "" if rel_root == "." else rel_root.replace(os.sep, "/")
+            dirs.sort()
+            # Prune ignored directories unless a negation could re-include something inside
+            if not any(p.startswith("!") for p in patterns):
+                dirs[:] = [d for d in dirs if not is_ignored(f"{rel_root}/{d}".lstrip("/"), patterns)]
+            for name in sorted(files):
+                rel_path = f"{rel_root}/{name}".lstrip("/")
+                if is_ignored(rel_path, patterns):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                seen.add(path)
+                digest.update(rel_path.encode())
+                digest.update(f"\0{stat.st_mode:o}\0".encode())
+                digest.update(self._file_digest(path, stat).encode())
+        # Forget files that left the tree
+        prefix = os.path.join(context_dir, "")
+        with self._digests_lock:
+            for path in [p for p in self._digests if p.startswith(prefix) and p not in seen]:
+                del self._digests[path]
+        return digest.hexdigest()
+
+    async def build(
+        self,
+        client: docker.DockerClient,
+        context_dir: str,
+        tag: str,
+        project: str,
+        on_line: Optional[Callable[[str], None]] = None,
+    ) -> BuildResult:
+        """Build `tag` from `context_dir` unless the existing image has the same context hash.
+
+        Build output is passed to `on_line` as it arrives instead of being collected.
+        """
+        on_line = on_line or (lambda line: None)
+        started = time.perf_counter()
+        with PROJECT_CONTEXT_HASH_SECONDS.time():
+            context_hash = await asyncio.to_thread(self.hash_context, context_dir)
+
+        existing = await self._existing_hash(client, tag)
+        if existing == context_hash:
+            PROJECT_BUILDS.labels(project, "cached").inc()
+            on_line(f"Build context unchanged ({context_hash[:12]}), reusing {tag}")
+            return BuildResult(tag, context_hash, cached=True, duration=time.perf_counter() - started)
+
+        labels = {BUILD_HASH_LABEL: context_hash}
+        try:
+            if self.buildkit:
+                await self._build_cli(context_dir, tag, labels, on_line)
+            else:
+                await self._build_classic(client, context_dir, tag, labels, on_line)
+        except BaseException:
+            PROJECT_BUILDS.labels(project, "failed").inc()
+            raise
+        duration = time.perf_counter() - started
+        PROJECT_BUILD_SECONDS.labels(project).observe(duration)
+        PROJECT_BUILDS.labels(project, "built").inc()
+        return BuildResult(tag, context_hash, cached=False, duration=duration)
+
+    def _file_digest(self, path: str, stat: os.stat_result) -> str:
+        with self._digests_lock:
+            cached = self._digests.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        if os.path.islink(path):
+            value = hashlib.sha256(os.readlink(path).encode()).hexdigest()
+        else:
+            file_hash = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    file_hash.update(block)
+            value = file_hash.hexdigest()
+        with self._digests_lock:
+            self._digests[path] = (stat.st_size, stat.st_mtime_ns, value)
+        return value
+
+    async def _existing_hash(self, client: docker.DockerClient, tag: str) -> Optional[str]:
+        try:
+            attrs = await docker_executor.run("get", client.api.inspect_image, tag)
+        except docker.errors.ImageNotFound:
+            return None
+        return ((attrs.get("Config") or {}).get("Labels") or {}).get(BUILD_HASH_LABEL)
+
+    async def _build_cli(
+        self, context_dir: str, tag: str, labels: Dict[str, str], on_line: Callable[[str], None]
+    ) -> None:
+        args = ["docker", "build", "--progress=plain", "--tag", tag]
+        for key, value in labels.items():
+            args += ["--label", f"{key}={value}"]
+        args.append(context_dir)
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env={**os.environ, "DOCKER_BUILDKIT": "1"},
+        )
+        tail: Deque[str] = deque(maxlen=20)
+
+        async def pump() -> None:
+            async for raw in process.stdout:
+                line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                tail.append(line)
+                on_line(line)
+            await process.wait()
+
+        try:
+            await asyncio.wait_for(pump(), settings.build_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"docker build exited with {process.returncode}: " + "\n".join(tail))
+
+    async def _build_classic(
+        self, client: docker.DockerClient, context_dir: str, tag: str, labels: Dict[str, str], on_line: Callable[[str], None]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        def run() -> None:
+            # Low-level build yields progress as the daemon produces it
+            for chunk in client.api.build(path=context_dir, tag=tag, labels=labels, rm=True, decode=True):
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"].strip())
+                text = chunk.get("stream") or chunk.get("status")
+                if text and text.strip():
+                    loop.call_soon_threadsafe(on_line, text.rstrip("\n"))
+
+        await docker_executor.run("build", run, timeout=settings.build_timeout)
+
+
+image_builder = ImageBuilder(buildkit=settings.build_use_buildkit)
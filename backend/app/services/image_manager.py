@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import docker
+from prometheus_client import Counter, Gauge, Histogram
+
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PULL_SECONDS = Histogram(
+    "vibecaas_image_pull_seconds",
+    "Time to pull an image",
+    ["image"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900),
+)
+IMAGE_PULLS = Counter("vibecaas_image_pulls_total", "Image pulls by outcome", ["image", "result"])
+IMAGE_PRESENT = Gauge("vibecaas_image_present", "1 if a catalogue image is available locally", ["image"])
+IMAGE_DISK_BYTES = Gauge("vibecaas_image_disk_bytes", "Disk used by local image layers")
+IMAGE_GC_REMOVED = Counter("vibecaas_image_gc_removed_total", "Images removed by LRU garbage collection")
+IMAGE_GC_FREED_BYTES = Counter("vibecaas_image_gc_freed_bytes_total", "Bytes reclaimed by image garbage collection")
+
+
+@dataclass
+class ImageRecord:
+    image: str
+    id: Optional[str] = None
+    digest: Optional[str] = None
+    size: int = 0
+    last_used: float = 0.0
+    pulled_at: Optional[float] = None
+    pull_seconds: Optional[float] = None
+
+    @property
+    def present(self) -> bool:
+        return self.id is not None
+
+
+def _with_tag(image: str) -> str:
+    # "node" and "node:latest" are the same image; a ":" after the last "/" is a tag
+    return image if ":" in image.rsplit("/", 1)[-1] or "@" in image else f"{image}:latest"
+
+
+class ImageManager:
+    """Pre-pulls the base image catalogue and keeps local images under a disk budget.
+
+    Presence and digests come from one `docker system df` call per refresh.
+    Docker does not record when an image was last used, so use is tracked here
+    from container creates; images never used by this process fall back to
+    their creation time. Garbage collection removes the least recently used
+    images that no container references until layer usage fits the budget.
+    Only images this manager pulled or saw used are candidates, so project
+    images from the image builder and the bases they were built from stay
+    put; catalogue images are never collected.
+    """
+
+    def __init__(
+        self,
+        client: Callable[[], docker.DockerClient],
+        catalogue: Iterable[str],
+        disk_budget_bytes: int,
+        gc_interval: float,
+        prepull: bool = True,
+    ) -> None:
+        self._client = client
+        self.catalogue = sorted({_with_tag(image) for image in catalogue})
+        self.disk_budget_bytes = disk_budget_bytes
+        self.gc_interval = gc_interval
+        self.prepull_on_start = prepull
+        self._records: Dict[str, ImageRecord] = {image: ImageRecord(image) for image in self.catalogue}
+        self._pulls: Dict[str, asyncio.Future] = {}
+        self._task: asyncio.Task | None = None
+
+    def touch(self, image: str) -> None:
+        """Record that a container was just created from `image`"""
+        image = _with_tag(image)
+        self._records.setdefault(image, ImageRecord(image)).last_used = time.time()
+
+    async def ensure(self, image: str) -> ImageRecord:
+        """Make sure `image` is local, pulling it once even with concurrent callers"""
+        image = _with_tag(image)
+        record = self._records.setdefault(image, ImageRecord(image))
+        if record.present:
+            return record
+        pending = self._pulls.get(image)
+        if pending is not None:
+            await asyncio.shield(pending)
+            return record
+        future = asyncio.get_running_loop().create_future()
+        self._pulls[image] = future
+        try:
+            await self._pull(record)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+            # Only surface the error once, to concurrent waiters
+            future.exception()
+            raise
+        finally:
+            self._pulls.pop(image, None)
+        return record
+
+    async def prepull(self) -> None:
+        """Pull every catalogue image that is not present yet"""
+        await self.refresh()
+        results = await asyncio.gather(*(self.ensure(image) for image in self.catalogue), return_exceptions=True)
+        for image, result in zip(self.catalogue, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Pre-pull of {image} failed: {result}")
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Re-read local images and layer usage from the daemon"""
+        client = self._client()
+        df = await docker_executor.run("list", client.api.df)
+        images = df.get("Images") or []
+        by_tag: Dict[str, Dict[str, Any]] = {}
+        for image in images:
+            for tag in image.get("RepoTags") or []:
+                by_tag[tag] = image
+        for name, record in self._records.items():
+            local = by_tag.get(name)
+            record.id = local["Id"] if local else None
+            record.size = local["Size"] if local else 0
+            record.digest = (local.get("RepoDigests") or [None])[0] if local else None
+        for image in self.catalogue:
+            IMAGE_PRESENT.labels(image).set(1 if self._records[image].present else 0)
+        IMAGE_DISK_BYTES.set(df.get("LayersSize") or 0)
+        return df
+
+    async def collect(self) -> List[str]:
+        """Remove least recently used, unreferenced images until under the disk budget"""
+        df = await self.refresh()
+        used = df.get("LayersSize") or 0
+        if used <= self.disk_budget_bytes:
+            return []
+
+        pinned = {self._records[image].id for image in self.catalogue if self._records[image].present}
+        last_used: Dict[str, float] = {}
+        for record in self._records.values():
+            if record.id:
+                last_used[record.id] = max(last_used.get(record.id, 0.0), record.last_used)
+        candidates = [
+            image for image in df.get("Images") or []
+            if image["Id"] in last_used and image.get("Containers", 0) == 0 and image["Id"] not in pinned
+        ]
+        candidates.sort(key=lambda image: last_used.get(image["Id"]) or image.get("Created", 0))
+
+        client = self._client()
+        removed: List[str] = []
+        for image in candidates:
+            if used <= self.disk_budget_bytes:
+                break
+            try:
+                await docker_executor.run("remove", client.api.remove_image, image["Id"])
+            except Exception as e:
+                logger.info(f"Skipping image {image['Id'][:19]} during GC: {e}")
+                continue
+            # Layers shared with other images stay on disk
+            freed = max(image.get("Size", 0) - max(image.get("SharedSize", 0), 0), 0)
+            used -= freed
+            removed.append(image["Id"])
+            IMAGE_GC_REMOVED.inc()
+            IMAGE_GC_FREED_BYTES.inc(freed)
+        if used > self.disk_budget_bytes:
+            logger.warning(
+                f"Images use {used} bytes after GC, over the {self.disk_budget_bytes} byte budget; "
+                "remaining images are in use, pinned or not managed here"
+            )
+        await self.refresh()
+        return removed
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "image": record.image,
+                "present": record.present,
+                "id": record.id,
+                "digest": record.digest,
+                "size": record.size,
+                "last_used": record.last_used or None,
+                "pull_seconds": record.pull_seconds,
+                "pinned": record.image in self.catalogue,
+            }
+            for record in self._records.values()
+        ]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _pull(self, record: ImageRecord) -> None:
+        client = self._client()
+        if "@" in record.image:
+            repository, tag = record.image, None
+        else:
+            repository, _, tag = record.image.rpartition(":")
+        started = time.perf_counter()
+        try:
+            image = await docker_executor.run("pull", client.images.pull, repository, tag=tag)
+        except Exception:
+            IMAGE_PULLS.labels(record.image, "error").inc()
+            raise
+        record.pull_seconds = time.perf_counter() - started
+        record.pulled_at = time.time()
+        record.id = image.id
+        record.digest = (image.attrs.get("RepoDigests") or [None])[0]
+        record.size = image.attrs.get("Size", 0)
+        IMAGE_PULL_SECONDS.labels(record.image).observe(record.pull_seconds)
+        IMAGE_PULLS.labels(record.image, "ok").inc()
+        if record.image in self.catalogue:
+            IMAGE_PRESENT.labels(record.image).set(1)
+        logger.info(f"Pulled {record.image} in {record.pull_seconds:.1f}s")
+
+    async def _run(self) -> None:
+        if self.prepull_on_start:
+            try:
+                await self.prepull()
+            except Exception as e:
+                logger.warning(f"Image pre-pull failed: {e}")
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.warning(f"Image GC failed: {e}")
+            await asyncio.sleep(self.gc_interval)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Optional
+
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+LOG_STREAMS_OPEN = Gauge("vibecaas_log_streams_open", "Open container log streams")
+LOG_STREAM_LINES = Counter("vibecaas_log_stream_lines_total", "Log lines delivered to log stream clients")
+LOG_STREAM_TRUNCATED = Counter("vibecaas_log_stream_truncated_lines_total", "Log lines cut at the per-line byte cap")
+
+# Docker prefixes each line with an RFC3339Nano timestamp when timestamps=True
+_TIMESTAMP_RE = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d{1,9}))?(Z|[+-]\d\d:\d\d)$")
+
+
+@dataclass(frozen=True)
+class LogLine:
+    cursor: str  # docker timestamp of the line; pass back to resume after it
+    text: str
+
+
+def parse_log_timestamp(value: str) -> Optional[int]:
+    """Docker log timestamp to integer nanoseconds since the epoch"""
+    match = _TIMESTAMP_RE.match(value.strip())
+    if not match:
+        return None
+    base, fraction, tz = match.groups()
+    parsed = datetime.fromisoformat(base + ("+00:00" if tz == "Z" else tz))
+    return int(parsed.timestamp()) * 1_000_000_000 + int((fraction or "").ljust(9, "0"))
+
+
+def datetime_to_ns(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp()) * 1_000_000_000 + value.microsecond * 1000
+
+
+async def stream_container_logs(
+    api: Any,
+    container: str,
+    after_ns: Optional[int] = None,
+    follow: bool = True,
+    tail: int | str = "all",
+    idle_timeout: Optional[float] = None,
+    queue_lines: int | None = None,
+    max_line_bytes: int | None = None,
+) -> AsyncIterator[Optional[LogLine]]:
+    """Yield a container's log lines as docker produces them.
+
+    Lines at or before `after_ns` are skipped, so a cursor from a previous
+    stream resumes without duplicates. At most `queue_lines` lines of at most
+    `max_line_bytes` each are buffered; when the client is slower than the
+    container the reader stops pulling from docker until there is room. With
+    `idle_timeout`, None is yielded after that many quiet seconds so callers
+    can send keepalives.
+    """
+    queue_lines = queue_lines or settings.log_stream_queue_lines
+    max_line_bytes = max_line_bytes or settings.log_stream_max_line_bytes
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(queue_lines)
+    stop_event = threading.Event()
+    done = object()
+    handle: dict = {}
+
+    def push(item) -> bool:
+        # Blocking here is the backpressure: docker's socket is not read while the buffer is full
+        while not slots.acquire(timeout=0.5):
+            if stop_event.is_set():
+                return False
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            return False
+        return not stop_event.is_set()
+
+    def emit(raw: bytes, truncated: bool = False) -> bool:
+        stamp, _, text = raw.partition(b" ")
+        cursor = stamp.decode("ascii", errors="replace")
+        line_ns = parse_log_timestamp(cursor)
+        if after_ns is not None and line_ns is not None and line_ns <= after_ns:
+            return True
+        if truncated:
+            LOG_STREAM_TRUNCATED.inc()
+        return push(LogLine(cursor=cursor, text=text.rstrip(b"\r").decode("utf-8", errors="replace")))
+
+    def read() -> None:
+        stream = None
+        try:
+            kwargs: dict = {"stream": True, "follow": follow, "timestamps": True}
+            if after_ns is not None:
+                # Docker's `since` has second granularity; emit() drops the overlap
+                kwargs["since"] = after_ns // 1_000_000_000 or 1
+            else:
+                kwargs["tail"] = tail
+            stream = api.logs(container, **kwargs)
+            handle["stream"] = stream
+            if stop_event.is_set():
+                return
+            pending = b""
+            skipping = False
+            for chunk in stream:
+                pending += chunk
+                while True:
+                    newline = pending.find(b"\n")
+                    if newline < 0:
+                        break
+                    line, pending = pending[:newline], pending[newline + 1:]
+                    if skipping:
+                        skipping = False
+                        continue
+                    if len(line) > max_line_bytes:
+                        if not emit(line[:max_line_bytes], truncated=True):
+                            return
+                    elif not emit(line):
+                        return
+                if len(pending) > max_line_bytes:
+                    # Drop the rest of an oversized line up to its newline
+                    if not skipping and not emit(pending[:max_line_bytes], truncated=True):
+                        return
+                    pending = b""
+                    skipping = True
+            if pending and not skipping:
+                emit(pending)
+        except Exception as e:
+            if not stop_event.is_set():
+                logger.info(f"Log stream for {container} ended: {e}")
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except RuntimeError:
+                pass
+
+    LOG_STREAMS_OPEN.inc()
+    # Follow streams live as long as the client, so they get their own thread
+    # rather than pinning a docker executor worker
+    threading.Thread(target=read, name=f"logs-{container}", daemon=True).start()
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), idle_timeout) if idle_timeout else await queue.get()
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is done:
+                return
+            slots.release()
+            LOG_STREAM_LINES.inc()
+            yield item
+    finally:
+        stop_event.set()
+        stream = handle.get("stream")
+        if stream is not None and hasattr(stream, "close"):
+            # Unblocks a reader waiting on a quiet follow stream
+            try:
+                stream.close()
+            except Exception:
+                pass
+        LOG_STREAMS_OPEN.dec()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import and_, delete, func, insert, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..models.metric import AppMetric, AppMetricRollup, MetricResolution
+from .stats_collector import CONTAINER_NAME_PREFIX, stats_collector
+
+logger = logging.getLogger(__name__)
+
+METRIC_SAMPLES_WRITTEN = Counter("vibecaas_app_metric_samples_written_total", "Raw AppMetric rows inserted")
+METRIC_SAMPLES_DROPPED = Counter("vibecaas_app_metric_samples_dropped_total", "Samples dropped because the buffer was full")
+METRIC_SAMPLES_REJECTED = Counter("vibecaas_app_metric_samples_rejected_total", "Samples dropped because the database rejected them")
+METRIC_FLUSH_SECONDS = Histogram("vibecaas_app_metric_flush_seconds", "Duration of AppMetric batch inserts")
+
+BUCKET_WIDTH = {
+    MetricResolution.MINUTE: timedelta(minutes=1),
+    MetricResolution.HOUR: timedelta(hours=1),
+}
+DATE_TRUNC_UNIT = {
+    MetricResolution.MINUTE: "minute",
+    MetricResolution.HOUR: "hour",
+}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _floor(ts: datetime, width: timedelta) -> datetime:
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return ts - ((ts - epoch) % width)
+
+
+def _app_id_from_container_name(name: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(name[len(CONTAINER_NAME_PREFIX):])
+    except ValueError:
+        return None
+
+
+class MetricsPipeline:
+    """Samples app containers into AppMetric and keeps 1m/1h rollups.
+
+    Raw samples are buffered and written with one executemany per batch. A
+    batch the database rejects (say, a sample for a deleted app) is split in
+    half until the offending rows are isolated and dropped; rows are only kept
+    for the next flush when the write failed for some other reason. A
+    maintenance loop upserts the most recent rollup buckets from raw rows (so
+    late samples are folded in) and prunes each resolution past its retention.
+    """
+
+    def __init__(
+        self,
+        sample_interval: float,
+        flush_interval: float,
+        flush_batch_size: int,
+        rollup_interval: float,
+        retention: Dict[MetricResolution, timedelta],
+    ) -> None:
+        self.sample_interval = sample_interval
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.rollup_interval = rollup_interval
+        self.retention = retention
+        self.max_buffer = flush_batch_size * 20
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+
+    def record(self, app_id: uuid.UUID, cpu_usage: float, memory_usage: float, timestamp: datetime | None = None) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            METRIC_SAMPLES_DROPPED.inc()
+            return
+        self._buffer.append({
+            "app_id": app_id,
+            "cpu_usage": cpu_usage,
+            "memory_usage": memory_usage,
+            "timestamp": timestamp or _utcnow(),
+        })
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            # Batches still to write, next one last
+            pending = [rows[i:i + self.flush_batch_size] for i in range(0, len(rows), self.flush_batch_size)][::-1]
+            batch: List[Dict[str, Any]] = []
+            written = 0
+            try:
+                with METRIC_FLUSH_SECONDS.time():
+                    while pending:
+                        batch = pending.pop()
+                        try:
+                            await self._insert(batch)
+                        except (IntegrityError, DataError) as e:
+                            if len(batch) == 1:
+                                METRIC_SAMPLES_REJECTED.inc()
+                                logger.warning(f"Dropping metric sample for app {batch[0]['app_id']}: {e.orig}")
+                            else:
+                                middle = len(batch) // 2
+                                pending += [batch[middle:], batch[:middle]]
+                            continue
+                        written += len(batch)
+                        METRIC_SAMPLES_WRITTEN.inc(len(batch))
+            except Exception:
+                # Keep the newest unwritten rows for the next attempt, within the buffer bound
+                unwritten = batch + [row for remaining in reversed(pending) for row in remaining]
+                room = max(self.max_buffer - len(self._buffer), 0)
+                METRIC_SAMPLES_DROPPED.inc(max(len(unwritten) - room, 0))
+                self._buffer = (unwritten[-room:] if room else []) + self._buffer
+                raise
+            return written
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(AppMetric), rows)
+            await db.commit()
+
+    async def rollup(self, resolution: MetricResolution, since: datetime, until: datetime) -> None:
+        """Upsert rollup buckets for raw samples in [since, until)"""
+        # Inline the unit so GROUP BY matches the selected expression exactly
+        bucket = func.date_trunc(literal_column(f"'{DATE_TRUNC_UNIT[resolution]}'"), AppMetric.timestamp)
+        source = (
+            select(
+                AppMetric.app_id,
+                literal(resolution.value),
+                bucket,
+                func.count(),
+                func.min(AppMetric.cpu_usage),
+                func.max(AppMetric.cpu_usage),
+                func.avg(AppMetric.cpu_usage),
+                func.percentile_cont(0.95).within_group(AppMetric.cpu_usage),
+                func.min(AppMetric.memory_usage),
+                func.max(AppMetric.memory_usage),
+                func.avg(AppMetric.memory_usage),
+                func.percentile_cont(0.95).within_group(AppMetric.memory_usage),
+            )
+            .where(and_(AppMetric.timestamp >= since, AppMetric.timestamp < until))
+            .group_by(AppMetric.app_id, bucket)
+        )
+        columns = [
+            "app_id", "resolution", "bucket_start", "sample_count",
+            "cpu_min", "cpu_max", "cpu_avg", "cpu_p95",
+            "memory_min", "memory_max", "memory_avg", "memory_p95",
+        ]
+        stmt = pg_insert(AppMetricRollup).from_select(columns, source)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_app_metric_rollups_bucket",
+            set_={c: getattr(stmt.excluded, c) for c in columns[3:]},
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def prune(self, now: datetime | None = None) -> None:
+        now = now or _utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(AppMetric).where(AppMetric.timestamp < now - self.retention[MetricResolution.RAW]))
+            for resolution in (MetricResolution.MINUTE, MetricResolution.HOUR):
+                await db.execute(
+                    delete(AppMetricRollup).where(
+                        AppMetricRollup.resolution == resolution.value,
+                        AppMetricRollup.bucket_start < now - self.retention[resolution],
+                    )
+                )
+            await db.commit()
+
+    def pick_resolution(self, start: datetime, end: datetime, max_points: int, now: datetime | None = None) -> MetricResolution:
+        """Finest resolution that still covers `start` and fits in `max_points`"""
+        now = now or _utcnow()
+        widths = {MetricResolution.RAW: timedelta(seconds=self.sample_interval), **BUCKET_WIDTH}
+        for resolution in (MetricResolution.RAW, MetricResolution.MINUTE, MetricResolution.HOUR):
+            covers_range = start >= now - self.retention[resolution]
+            if covers_range and (end - start) / widths[resolution] <= max_points:
+                return resolution
+        return MetricResolution.HOUR
+
+    async def query(self, app_id: uuid.UUID, start: datetime, end: datetime, max_points: int = 500) -> Dict[str, Any]:
+        resolution = self.pick_resolution(start, end, max_points)
+        async with AsyncSessionLocal() as db:
+            if resolution == MetricResolution.RAW:
+                result = await db.execute(
+                    select(AppMetric)
+                    .where(AppMetric.app_id == app_id, AppMetric.timestamp >= start, AppMetric.timestamp < end)
+                    .order_by(AppMetric.timestamp)
+                )
+                points = [
+                    {
+                        "timestamp": m.timestamp,
+                        "sample_count": 1,
+                        "cpu": {"min": m.cpu_usage, "max": m.cpu_usage, "avg": m.cpu_usage, "p95": m.cpu_usage},
+                        "memory": {"min": m.memory_usage, "max": m.memory_usage, "avg": m.memory_usage, "p95": m.memory_usage},
+                    }
+                    for m in result.scalars()
+                ]
+            else:
+                result = await db.execute(
+                    select(AppMetricRollup)
+                    .where(
+                        AppMetricRollup.app_id == app_id,
+                        AppMetricRollup.resolution == resolution.value,
+                        AppMetricRollup.bucket_start >= _floor(start, BUCKET_WIDTH[resolution]),
+                        AppMetricRollup.bucket_start < end,
+                    )
+                    .order_by(AppMetricRollup.bucket_start)
+                )
+                points = [
+                    {
+                        "timestamp": r.bucket_start,
+                        "sample_count": r.sample_count,
+                        "cpu": {"min": r.cpu_min, "max": r.cpu_max, "avg": r.cpu_avg, "p95": r.cpu_p95},
+                        "memory": {"min": r.memory_min, "max": r.memory_max, "avg": r.memory_avg, "p95": r.memory_p95},
+                    }
+                    for r in result.scalars()
+                ]
+        return {"app_id": str(app_id), "resolution": resolution.value, "start": start, "end": end, "points": points}
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._sample_loop()),
+                asyncio.create_task(self._flush_loop()),
+                asyncio.create_task(self._maintenance_loop()),
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final metrics flush failed: {e}")
+
+    async def _sample_loop(self) -> None:
+        while True:
+            now = _utcnow()
+            for snapshot in stats_collector.snapshots():
+                app_id = _app_id_from_container_name(snapshot.name)
+                if app_id:
+                    self.record(app_id, snapshot.cpu_percent, snapshot.memory_usage_bytes / (1024 * 1024), now)
+            await asyncio.sleep(self.sample_interval)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {e}")
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.rollup_interval)
+            now = _utcnow()
+            try:
+                # Recompute the trailing buckets so late or partial ones converge
+                minute = _floor(now, BUCKET_WIDTH[MetricResolution.MINUTE])
+                await self.rollup(MetricResolution.MINUTE, minute - timedelta(minutes=2), now)
+                hour = _floor(now, BUCKET_WIDTH[MetricResolution.HOUR])
+                await self.rollup(MetricResolution.HOUR, hour - timedelta(hours=1), now)
+                await self.prune(now)
+            except Exception as e:
+                logger.error(f"Metrics rollup failed: {e}")
+
+
+metrics_pipeline = MetricsPipeline(
+    sample_interval=settings.metrics_sample_interval,
+    flush_interval=settings.metrics_flush_interval,
+    flush_batch_size=settings.metrics_flush_batch_size,
+    rollup_interval=settings.metrics_rollup_interval,
+    retention={
+        # Hourly rollups are computed from raw rows, so raw must outlive one hour bucket
+        MetricResolution.RAW: max(timedelta(hours=settings.metrics_raw_retention_hours), timedelta(hours=2)),
+        MetricResolution.MINUTE: timedelta(days=settings.metrics_minute_retention_days),
+        MetricResolution.HOUR: timedelta(days=settings.metrics_hour_retention_days),
+    },
+)
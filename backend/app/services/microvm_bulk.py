@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import httpx
+from prometheus_client import Counter, Histogram
+from sqlalchemy import insert, select, update
+
+from ..config import settings
+from ..db import AsyncSessionLocal, SessionLocal
+from ..models.microvm import MicroVM, MicroVMEvent, MicroVMStatus
+from .microvm_quota import RESOURCES, quota_ledger, usage_for
+from .vm_control import VMControlClient, vm_control
+
+logger = logging.getLogger(__name__)
+
+MICROVM_BULK_ITEMS = Counter(
+    "vibecaas_microvm_bulk_items_total", "MicroVMs processed by bulk operations", ["action", "result"]
+)
+MICROVM_BULK_SECONDS = Histogram(
+    "vibecaas_microvm_bulk_seconds",
+    "Duration of one bulk operation",
+    ["action"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+# Action -> statuses it applies to, status afterwards, event type
+ACTIONS = {
+    "start": ({MicroVMStatus.STOPPED}, MicroVMStatus.RUNNING, "started"),
+    "stop": ({MicroVMStatus.RUNNING}, MicroVMStatus.STOPPED, "stopped"),
+    "destroy": (
+        {
+            MicroVMStatus.CREATING, MicroVMStatus.RUNNING, MicroVMStatus.STOPPED,
+            MicroVMStatus.SUSPENDED, MicroVMStatus.FAILED,
+        },
+        MicroVMStatus.DESTROYED,
+        "destroyed",
+    ),
+    "resize": ({MicroVMStatus.RUNNING, MicroVMStatus.STOPPED}, None, "resources_updated"),
+}
+
+SIZE_FIELDS = ("cpu_cores", "memory_mb", "storage_gb")
+
+
+class BulkPlan(NamedTuple):
+    action: str
+    targets: List[Any]  # Rows of the VMs the action applies to
+    skipped: List[Dict[str, Any]]  # Results for VMs that were not found or are in the wrong state
+    size: Dict[str, int]  # New size for resize
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _result(row: Any, ok: bool, status: Optional[str] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    return {"id": row.id, "vm_id": row.vm_id, "ok": ok, "status": status, "error": error}
+
+
+class MicroVMBulkOperations:
+    """Start, stop, destroy or resize many MicroVMs in one request.
+
+    `prepare` selects the targets with one query, by id list or by label
+    selector (every key must match), and sorts out VMs that are missing or
+    in a state the action does not apply to. `execute` applies the rest in
+    a detached task that calls vm-control concurrently, at most
+    `concurrency` at a time, and writes every result whether or not anyone
+    is still reading: each `batch_size` results become one conditional
+    UPDATE (rows another writer moved in the meantime are reported as
+    changed concurrently) and one event insert. The caller only streams
+    that task's progress, a result per VM as its batch is committed.
+    Resizes reserve their quota growth up front and give it back if they do
+    not apply; destroys release quota once per tenant per batch.
+    """
+
+    def __init__(self, client: VMControlClient, concurrency: int, batch_size: int, max_items: int) -> None:
+        self.client = client
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_items = max_items
+        self._running: Set[asyncio.Task] = set()
+
+    async def prepare(
+        self,
+        owner_id: int,
+        action: str,
+        ids: Optional[List[int]] = None,
+        selector: Optional[Dict[str, str]] = None,
+        size: Optional[Dict[str, Optional[int]]] = None,
+    ) -> BulkPlan:
+        """Resolve the VMs a bulk request applies to; raises ValueError for a malformed request"""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        if bool(ids) == bool(selector):
+            raise ValueError("Pass either ids or a label selector")
+        if ids and len(set(ids)) > self.max_items:
+            raise ValueError(f"At most {self.max_items} MicroVMs per request")
+        size = {field: value for field, value in (size or {}).items() if value is not None}
+        if action == "resize" and not size:
+            raise ValueError("Resize needs cpu_cores, memory_mb or storage_gb")
+
+        query = select(
+            MicroVM.id, MicroVM.vm_id, MicroVM.tenant_id, MicroVM.status, MicroVM.vm_control_id,
+            MicroVM.cpu_cores, MicroVM.memory_mb, MicroVM.storage_gb,
+        ).where(MicroVM.owner_id == owner_id, MicroVM.is_active == True)
+        if ids:
+            query = query.where(MicroVM.id.in_(set(ids)))
+        for key, value in (selector or {}).items():
+            query = query.where(MicroVM.labels[key].as_string() == value)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(query.order_by(MicroVM.id).limit(self.max_items + 1))
+            rows = result.all()
+        if len(rows) > self.max_items:
+            raise ValueError(f"Selector matches more than {self.max_items} MicroVMs")
+
+        applies_to = ACTIONS[action][0]
+        targets, skipped = [], []
+        for row in rows:
+            if row.status in applies_to:
+                targets.append(row)
+            else:
+                skipped.append(_result(row, False, row.status.value, f"cannot {action} a {row.status.value} MicroVM"))
+        found = {row.id for row in rows}
+        for missing in sorted(set(ids or []) - found):
+            skipped.append({"id": missing, "vm_id": None, "ok": False, "status": None, "error": "not found"})
+        return BulkPlan(action, targets, skipped, size)
+
+    async def execute(self, plan: BulkPlan) -> AsyncIterator[Dict[str, Any]]:
+        """Apply the plan, yielding one result per VM.
+
+        The work runs in its own task: a caller that stops iterating (the
+        client went away) no longer sees results, but every VM is still
+        applied and written.
+        """
+        progress: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._apply(plan, progress))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        while (items := await progress.get()) is not None:
+            for item in items:
+                yield item
+
+    async def stop(self) -> None:
+        """Let running bulk operations finish writing their results"""
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _apply(self, plan: BulkPlan, progress: asyncio.Queue) -> None:
+        started = asyncio.get_running_loop().time()
+        try:
+            MICROVM_BULK_ITEMS.labels(plan.action, "skipped").inc(len(plan.skipped))
+            progress.put_nowait(plan.skipped)
+
+            targets = plan.targets
+            if plan.action == "resize":
+                targets, rejected = await asyncio.to_thread(self._reserve_resizes, targets, plan.size)
+                MICROVM_BULK_ITEMS.labels(plan.action, "quota_exceeded").inc(len(rejected))
+                progress.put_nowait(rejected)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            tasks = [asyncio.create_task(self._call(semaphore, plan, row)) for row in targets]
+            batch: List[Tuple[Any, Optional[str]]] = []
+            for next_done in asyncio.as_completed(tasks):
+                batch.append(await next_done)
+                if len(batch) >= self.batch_size:
+                    progress.put_nowait(await self._write_or_report(plan, batch))
+                    batch = []
+            if batch:
+                progress.put_nowait(await self._write_or_report(plan, batch))
+        except Exception as e:
+            logger.error(f"Bulk {plan.action} of {len(plan.targets)} MicroVMs failed: {e}")
+        finally:
+            progress.put_nowait(None)
+            MICROVM_BULK_SECONDS.labels(plan.action).observe(asyncio.get_running_loop().time() - started)
+
+    async def _call(self, semaphore: asyncio.Semaphore, plan: BulkPlan, row: Any) -> Tuple[Any, Optional[str]]:
+        """Apply the action in vm-control; returns the row and an error, or None on success"""
+        async with semaphore:
+            try:
+                if plan.action == "destroy":
+                    if row.vm_control_id:
+                        await self.client.delete_vm(row.vm_control_id)
+                elif not row.vm_control_id:
+                    if plan.action != "resize":
+                        return row, "not provisioned in vm-control"
+                elif plan.action == "start":
+                    await self.client.start_vm(row.vm_control_id)
+                elif plan.action == "stop":
+                    await self.client.stop_vm(row.vm_control_id)
+                elif row.status == MicroVMStatus.RUNNING:
+                    await self.client.update_vm(row.vm_control_id, self._new_size(row, plan.size))
+            except httpx.HTTPStatusError as e:
+                # Already gone is what a destroy wants
+                if not (plan.action == "destroy" and e.response.status_code == 404):
+                    return row, f"vm-control returned {e.response.status_code}"
+            except Exception as e:
+                return row, str(e) or type(e).__name__
+        return row, None
+
+    async def _write_or_report(self, plan: BulkPlan, batch: List[Tuple[Any, Optional[str]]]) -> List[Dict[str, Any]]:
+        """Write a batch; if that fails, report it per VM and carry on with the next batch"""
+        try:
+            return await self._write(plan, batch)
+        except Exception as e:
+            logger.error(f"Failed to record bulk {plan.action} of {len(batch)} MicroVMs: {e}")
+            MICROVM_BULK_ITEMS.labels(plan.action, "unrecorded").inc(len(batch))
+            return [_result(row, False, row.status.value, error or "applied but not recorded") for row, error in batch]
+
+    async def _write(self, plan: BulkPlan, batch: List[Tuple[Any, Optional[str]]]) -> List[Dict[str, Any]]:
+        now = _utcnow()
+        applies_to, new_status, event_type = ACTIONS[plan.action]
+        done = [row for row, error in batch if error is None]
+        failed = [(row, error) for row, error in batch if error is not None]
+        applied: Set[int] = set()
+        released: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(RESOURCES, 0))
+
+        values: Dict[str, Any] = {"updated_at": now}
+        if plan.action == "resize":
+            values.update(plan.size)
+        else:
+            values["status"] = new_status
+            values["started_at" if new_status == MicroVMStatus.RUNNING else "stopped_at"] = now
+        if plan.action == "destroy":
+            values["is_active"] = False
+
+        async with AsyncSessionLocal() as db:
+            if done:
+                # Every row gets the same values, so the batch is one UPDATE; rows a concurrent
+                # destroy, suspend or reconcile moved out of the action's states are left alone
+                moved = await db.execute(
+                    update(MicroVM)
+                    .where(
+                        MicroVM.id.in_([row.id for row in done]),
+                        MicroVM.status.in_(applies_to),
+                        MicroVM.is_active == True,
+                    )
+                    .values(**values)
+                    .returning(MicroVM.id)
+                )
+                applied = set(moved.scalars().all())
+            if plan.action == "destroy":
+                # Only rows this request deactivated give their quota back
+                for row in done:
+                    if row.id in applied:
+                        for key, amount in usage_for(row.cpu_cores, row.memory_mb, row.storage_gb).items():
+                            released[row.tenant_id][key] += amount
+            if applied:
+                await db.execute(
+                    insert(MicroVMEvent),
+                    [
+                        {
+                            "microvm_id": row.id,
+                            "event_type": event_type,
+                            "message": f"MicroVM {row.vm_id} {event_type.replace('_', ' ')} by bulk {plan.action}",
+                            "metadata": {"bulk": True, **({"size": plan.size} if plan.action == "resize" else {})},
+                        }
+                        for row in done
+                        if row.id in applied
+                    ],
+                )
+            await db.commit()
+
+        if released:
+            await asyncio.to_thread(self._release, released)
+        unapplied = [row for row, _ in failed] + [row for row in done if row.id not in applied]
+        if plan.action == "resize" and unapplied:
+            await asyncio.to_thread(self._revert_resizes, unapplied, plan.size)
+
+        results = []
+        for row in done:
+            if row.id in applied:
+                status = new_status.value if new_status else row.status.value
+                results.append(_result(row, True, status))
+                MICROVM_BULK_ITEMS.labels(plan.action, "ok").inc()
+            else:
+                results.append(_result(row, False, None, "changed concurrently"))
+                MICROVM_BULK_ITEMS.labels(plan.action, "conflict").inc()
+        for row, error in failed:
+            results.append(_result(row, False, row.status.value, error))
+            MICROVM_BULK_ITEMS.labels(plan.action, "failed").inc()
+        return results
+
+    def _reserve_resizes(self, targets: List[Any], size: Dict[str, int]) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        accepted, rejected = [], []
+        with SessionLocal() as db:
+            for row in targets:
+                old = usage_for(row.cpu_cores, row.memory_mb, row.storage_gb)
+                new = usage_for(**self._new_size(row, size))
+                if quota_ledger.adjust(db, row.tenant_id, old, new):
+                    accepted.append(row)
+                else:
+                    rejected.append(_result(row, False, row.status.value, "quota exceeded"))
+        return accepted, rejected
+
+    def _revert_resizes(self, rows: List[Any], size: Dict[str, int]) -> None:
+        """Move the reservations of resizes that did not apply back to the old size"""
+        with SessionLocal() as db:
+            for row in rows:
+                old = usage_for(row.cpu_cores, row.memory_mb, row.storage_gb)
+                quota_ledger.adjust(db, row.tenant_id, usage_for(**self._new_size(row, size)), old)
+
+    @staticmethod
+    def _release(released: Dict[int, Dict[str, int]]) -> None:
+        with SessionLocal() as db:
+            for tenant_id, usage in released.items():
+                quota_ledger.release(db, tenant_id, usage)
+
+    @staticmethod
+    def _new_size(row: Any, size: Dict[str, int]) -> Dict[str, int]:
+        return {field: size.get(field, getattr(row, field)) for field in SIZE_FIELDS}
+
+
+microvm_bulk = MicroVMBulkOperations(
+    client=vm_control,
+    concurrency=settings.vm_bulk_concurrency,
+    batch_size=settings.vm_bulk_batch_size,
+    max_items=settings.vm_bulk_max_items,
+)
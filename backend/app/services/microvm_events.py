@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import insert, select, tuple_
+
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..models.microvm import MicroVMEvent
+
+logger = logging.getLogger(__name__)
+
+MICROVM_EVENTS_WRITTEN = Counter("vibecaas_microvm_events_written_total", "MicroVMEvent rows inserted by the event sink")
+MICROVM_EVENTS_DROPPED = Counter(
+    "vibecaas_microvm_events_dropped_total", "MicroVM events dropped because the buffer was full"
+)
+MICROVM_EVENTS_BUFFERED = Gauge("vibecaas_microvm_events_buffered", "MicroVM events waiting to be written")
+MICROVM_EVENT_FLUSH_SECONDS = Histogram(
+    "vibecaas_microvm_event_flush_seconds", "Duration of MicroVMEvent batch inserts"
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def encode_cursor(created_at: datetime, event_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{event_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for a cursor it did not make"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, event_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(event_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class MicroVMEventSink:
+    """Buffers MicroVM events and writes them in batches.
+
+    `emit` only appends to an in-memory buffer, stamping the event time so
+    ordering does not depend on when it is written. The buffer is flushed
+    with one executemany every `flush_interval` seconds, or as soon as it
+    holds `batch_size` events, and drained on `stop`. A failed flush keeps
+    the newest events for the next attempt; past `max_buffer` new events are
+    dropped and counted rather than slowing callers down. Events therefore
+    show up in queries up to one flush interval after they happen.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_buffer: int) -> None:
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def emit(self, microvm_id: int, event_type: str, message: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            MICROVM_EVENTS_DROPPED.inc()
+            return
+        self._buffer.append({
+            "microvm_id": microvm_id,
+            "event_type": event_type,
+            "message": message,
+            "metadata": metadata or {},
+            "created_at": _utcnow(),
+        })
+        MICROVM_EVENTS_BUFFERED.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            try:
+                with MICROVM_EVENT_FLUSH_SECONDS.time():
+                    async with AsyncSessionLocal() as db:
+                        for i in range(0, len(rows), self.batch_size):
+                            await db.execute(insert(MicroVMEvent), rows[i:i + self.batch_size])
+                        await db.commit()
+            except BaseException:
+                # Keep the newest rows for the next attempt, within the buffer bound; also when
+                # cancelled mid-write, so the rows are not lost with this frame
+                room = max(self.max_buffer - len(self._buffer), 0)
+                MICROVM_EVENTS_DROPPED.inc(max(len(rows) - room, 0))
+                self._buffer = (rows[-room:] if room else []) + self._buffer
+                raise
+            finally:
+                MICROVM_EVENTS_BUFFERED.set(len(self._buffer))
+            MICROVM_EVENTS_WRITTEN.inc(len(rows))
+            return len(rows)
+
+    async def page(
+        self, microvm_id: int, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[MicroVMEvent], Optional[str]]:
+        """Events newest first, `limit` at a time; pass the returned cursor to get the next page.
+
+        Keyset pagination on (created_at, id) over ix_microvm_events_microvm_id_created_at,
+        so a page costs the same however deep it is. Raises ValueError for a bad cursor.
+        """
+        query = select(MicroVMEvent).where(MicroVMEvent.microvm_id == microvm_id)
+        if cursor:
+            query = query.where(tuple_(MicroVMEvent.created_at, MicroVMEvent.id) < decode_cursor(cursor))
+        query = query.order_by(MicroVMEvent.created_at.desc(), MicroVMEvent.id.desc()).limit(limit + 1)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(query)
+            events = list(result.scalars().all())
+        next_cursor = None
+        if len(events) > limit:
+            events = events[:limit]
+            next_cursor = encode_cursor(events[-1].created_at, events[-1].id)
+        return events, next_cursor
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Let the loop finish a flush it is in the middle of rather than cancelling it
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final MicroVM event flush failed, {len(self._buffer)} events lost: {e}")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            # asyncio.timeout rather than wait_for: wait_for can swallow the cancel from stop()
+            # when the event is set at the same moment
+            try:
+                async with asyncio.timeout(self.flush_interval):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"MicroVM event flush failed: {e}")
+                if not self._stopping:
+                    # Do not retry at the rate events arrive while the database is down
+                    await asyncio.sleep(self.flush_interval)
+
+
+microvm_events = MicroVMEventSink(
+    flush_interval=settings.microvm_event_flush_interval,
+    batch_size=settings.microvm_event_batch_size,
+    max_buffer=settings.microvm_event_batch_size * 20,
+)
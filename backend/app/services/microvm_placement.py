@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+from .vm_control import VMControlClient, vm_control
+
+logger = logging.getLogger(__name__)
+
+MICROVM_PLACEMENTS = Counter("vibecaas_microvm_placements_total", "MicroVMs placed per region", ["region", "reason"])
+MICROVM_REGION_LATENCY = Gauge(
+    "vibecaas_microvm_region_provision_seconds", "Smoothed cold-boot provisioning latency per region", ["region"]
+)
+MICROVM_REGION_FAILURE_RATE = Gauge(
+    "vibecaas_microvm_region_failure_rate", "Smoothed share of failed provisions per region", ["region"]
+)
+MICROVM_REGION_FREE_CPU = Gauge("vibecaas_microvm_region_free_cpu_cores", "Unallocated host CPU per region", ["region"])
+
+REGION_NAMES = {
+    "us-east-1": "US East (N. Virginia)",
+    "us-west-2": "US West (Oregon)",
+    "eu-west-1": "Europe (Ireland)",
+    "ap-southeast-1": "Asia Pacific (Singapore)",
+    "ap-northeast-1": "Asia Pacific (Tokyo)",
+}
+
+# Assumed for a region until its first VM finishes a cold boot
+PRIOR_LATENCY_SECONDS = 30.0
+
+
+class NoCapacity(ValueError):
+    """No host in the allowed regions has room for the VM"""
+
+
+@dataclass
+class Host:
+    region: str
+    id: str
+    cpu_total: int
+    memory_total_mb: int
+    cpu_used: int = 0
+    memory_used_mb: int = 0
+
+    def fits(self, cpu: int, memory_mb: int) -> bool:
+        return self.cpu_used + cpu <= self.cpu_total and self.memory_used_mb + memory_mb <= self.memory_total_mb
+
+    def leftover(self, cpu: int, memory_mb: int) -> float:
+        """Largest share of the host left free after adding the VM; best fit minimises it"""
+        return max(
+            (self.cpu_total - self.cpu_used - cpu) / max(self.cpu_total, 1),
+            (self.memory_total_mb - self.memory_used_mb - memory_mb) / max(self.memory_total_mb, 1),
+        )
+
+
+@dataclass
+class RegionStats:
+    latency: Optional[float] = None  # Smoothed cold-boot seconds
+    failure_rate: float = 0.0
+    samples: int = 0
+
+
+class Placement(NamedTuple):
+    region: str
+    host_id: Optional[str]  # None when capacity is unknown; vm-control picks the host
+    cost: Optional[float]
+
+
+class PlacementScheduler:
+    """Chooses the region and host for new MicroVMs.
+
+    Host capacity comes from vm-control every `refresh_interval` seconds and
+    is debited locally for each placement until the next refresh, so a burst
+    of creates does not pile onto one host. Provisioning outcomes reported by
+    the reconciler feed exponentially smoothed (`alpha`) per-region cold-boot
+    latency and failure rate. Each host a VM fits on gets a cost, lower is
+    better:
+
+      latency_weight * latency / slowest candidate region latency
+      + failure_weight * failure rate
+      + fit_weight * share of the host left free afterwards (best fit)
+
+    A requested region restricts the candidates to that region. When
+    capacity is unknown (vm-control not configured, or no refresh for four
+    intervals) the VM goes to the requested or default region and vm-control
+    picks the host. `explain` returns the full scoring for tuning.
+    """
+
+    def __init__(
+        self,
+        client: VMControlClient,
+        regions: List[str],
+        default_region: str,
+        refresh_interval: float,
+        latency_weight: float,
+        failure_weight: float,
+        fit_weight: float,
+        alpha: float = 0.2,
+    ) -> None:
+        self.client = client
+        self.default_region = default_region
+        self.refresh_interval = refresh_interval
+        self.weights = {"latency": latency_weight, "failure": failure_weight, "fit": fit_weight}
+        self.alpha = alpha
+        self.stats: Dict[str, RegionStats] = {region: RegionStats() for region in regions}
+        self.hosts: Dict[str, List[Host]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def capacity_known(self) -> bool:
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at < 4 * self.refresh_interval
+
+    async def refresh(self) -> None:
+        hosts: Dict[str, List[Host]] = {}
+        for region in await self.client.list_regions():
+            hosts[region["id"]] = [
+                Host(
+                    region=region["id"],
+                    id=host["id"],
+                    cpu_total=host["cpu_total"],
+                    memory_total_mb=host["memory_total_mb"],
+                    cpu_used=host.get("cpu_used", 0),
+                    memory_used_mb=host.get("memory_used_mb", 0),
+                )
+                for host in region.get("hosts", [])
+                if host.get("available", True)
+            ]
+            self.stats.setdefault(region["id"], RegionStats())
+            MICROVM_REGION_FREE_CPU.labels(region["id"]).set(
+                sum(host.cpu_total - host.cpu_used for host in hosts[region["id"]])
+            )
+        self.hosts = hosts
+        self._refreshed_at = time.monotonic()
+
+    def place(self, cpu: int, memory_mb: int, region: Optional[str] = None) -> Placement:
+        """Pick a region and host and debit the host; raises NoCapacity if nothing fits"""
+        if not self.capacity_known:
+            placement = Placement(region or self.default_region, None, None)
+            MICROVM_PLACEMENTS.labels(placement.region, "capacity_unknown").inc()
+            return placement
+        scored = self._scored(cpu, memory_mb, region)
+        if not scored:
+            raise NoCapacity(f"No capacity for {cpu} CPU / {memory_mb}MB in {region or 'any region'}")
+        cost, host, _ = scored[0]
+        host.cpu_used += cpu
+        host.memory_used_mb += memory_mb
+        MICROVM_PLACEMENTS.labels(host.region, "requested" if region else "scored").inc()
+        return Placement(host.region, host.id, round(cost, 4))
+
+    def observe(self, region: str, seconds: Optional[float], ok: bool) -> None:
+        """Record a provisioning outcome; `seconds` is the cold-boot time of a successful VM"""
+        stats = self.stats.setdefault(region, RegionStats())
+        stats.samples += 1
+        stats.failure_rate += self.alpha * ((0.0 if ok else 1.0) - stats.failure_rate)
+        if ok and seconds is not None:
+            stats.latency = seconds if stats.latency is None else stats.latency + self.alpha * (seconds - stats.latency)
+            MICROVM_REGION_LATENCY.labels(region).set(stats.latency)
+        MICROVM_REGION_FAILURE_RATE.labels(region).set(stats.failure_rate)
+
+    def regions(self) -> List[Dict[str, Any]]:
+        """Every known region with measured latency, failure rate and free capacity"""
+        result = []
+        for region, stats in sorted(self.stats.items()):
+            hosts = self.hosts.get(region, [])
+            free_cpu = sum(host.cpu_total - host.cpu_used for host in hosts)
+            free_memory = sum(host.memory_total_mb - host.memory_used_mb for host in hosts)
+            result.append(
+                {
+                    "id": region,
+                    "name": REGION_NAMES.get(region, region),
+                    "available": not self.capacity_known or free_cpu > 0,
+                    "latency_ms": int(stats.latency * 1000) if stats.latency is not None else None,
+                    "failure_rate": round(stats.failure_rate, 4),
+                    "free_cpu_cores": free_cpu if self.capacity_known else None,
+                    "free_memory_mb": free_memory if self.capacity_known else None,
+                }
+            )
+        return result
+
+    def explain(self, cpu: int, memory_mb: int, region: Optional[str] = None) -> Dict[str, Any]:
+        """The scoring `place` would use for a VM of this size, without debiting anything"""
+        return {
+            "weights": self.weights,
+            "capacity_known": self.capacity_known,
+            "capacity_age_seconds": (
+                round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at is not None else None
+            ),
+            "regions": self.regions(),
+            "candidates": [
+                {"region": host.region, "host_id": host.id, "cost": round(cost, 4), **terms}
+                for cost, host, terms in self._scored(cpu, memory_mb, region)
+            ],
+        }
+
+    def start(self) -> None:
+        if not self.client.base_url:
+            logger.info("VM_CONTROL_URL is not set; MicroVM placement uses the requested or default region")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _scored(self, cpu: int, memory_mb: int, region: Optional[str]) -> List[Tuple[float, Host, Dict[str, float]]]:
+        regions = [region] if region else list(self.hosts)
+        fitting = [host for r in regions for host in self.hosts.get(r, []) if host.fits(cpu, memory_mb)]
+        if not fitting:
+            return []
+        known = [s.latency for s in self.stats.values() if s.latency is not None]
+        prior = sum(known) / len(known) if known else PRIOR_LATENCY_SECONDS
+        latency = {
+            host.region: self.stats.get(host.region, RegionStats()).latency or prior for host in fitting
+        }
+        slowest = max(latency.values()) or 1.0
+        scored = []
+        for host in fitting:
+            terms = {
+                "latency": latency[host.region] / slowest,
+                "failure": self.stats.get(host.region, RegionStats()).failure_rate,
+                "fit": host.leftover(cpu, memory_mb),
+            }
+            cost = sum(self.weights[name] * value for name, value in terms.items())
+            scored.append((cost, host, {name: round(value, 4) for name, value in terms.items()}))
+        scored.sort(key=lambda item: item[0])
+        return scored
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"MicroVM capacity refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+
+microvm_placement = PlacementScheduler(
+    client=vm_control,
+    regions=settings.vm_regions_list,
+    default_region=settings.vm_default_region,
+    refresh_interval=settings.vm_placement_refresh_interval,
+    latency_weight=settings.vm_placement_latency_weight,
+    failure_weight=settings.vm_placement_failure_weight,
+    fit_weight=settings.vm_placement_fit_weight,
+)
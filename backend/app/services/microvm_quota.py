@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+from sqlalchemy import case, func, literal_column, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.microvm import MicroVM, MicroVMQuota
+
+MICROVM_QUOTA_RESERVATIONS = Counter(
+    "vibecaas_microvm_quota_reservations_total", "MicroVM quota reservations by outcome", ["result"]
+)
+
+# Limits for tenants that have no quota row yet
+DEFAULT_LIMITS = {"max_microvms": 5, "max_cpu_cores": 8, "max_memory_gb": 16, "max_storage_gb": 100}
+
+# Usage key -> (counter column, limit column)
+RESOURCES = {
+    "microvms": ("current_microvms", "max_microvms"),
+    "cpu_cores": ("current_cpu_cores", "max_cpu_cores"),
+    "memory_gb": ("current_memory_gb", "max_memory_gb"),
+    "storage_gb": ("current_storage_gb", "max_storage_gb"),
+}
+
+# Plain Core statements: there is no ORM state to keep in sync with the counters
+quotas = MicroVMQuota.__table__
+microvms = MicroVM.__table__
+
+
+class QuotaExceeded(ValueError):
+    """The tenant does not have room for the requested resources"""
+
+
+def usage_for(cpu_cores: int, memory_mb: int, storage_gb: int, microvms: int = 1) -> Dict[str, int]:
+    """Quota usage of one MicroVM; memory is charged in whole GB, rounded up"""
+    return {
+        "microvms": microvms,
+        "cpu_cores": cpu_cores,
+        "memory_gb": math.ceil(memory_mb / 1024),
+        "storage_gb": storage_gb,
+    }
+
+
+class QuotaLedger:
+    """Reserves and releases MicroVM quota with one conditional UPDATE each.
+
+    `reserve` adds the usage to the tenant's counters only if every counter
+    stays within its limit, checked in the UPDATE's WHERE clause. The database
+    re-evaluates that against the latest committed row while holding the row
+    lock, so concurrent creates cannot both take the last slot, and the lock
+    is held for one statement rather than a read-check-write round trip.
+    `release` subtracts the usage, clamped at zero. Usage is held from a
+    successful reserve until the MicroVM is destroyed; a VM that failed to
+    provision keeps its reservation until it is deleted. `recount` rebuilds
+    the counters from active MicroVMs (scripts/backfill_microvm_quota.py).
+    """
+
+    def __init__(self, defaults: Dict[str, int]) -> None:
+        self.defaults = defaults
+
+    def reserve(self, db: Session, tenant_id: int, usage: Dict[str, int]) -> bool:
+        """Take `usage` from the tenant's quota; returns False, changing nothing, if it does not fit"""
+        reserved = self._apply(db, tenant_id, usage)
+        if reserved is None:
+            # First reservation for this tenant: create its row and try again
+            self._ensure(db, tenant_id)
+            reserved = self._apply(db, tenant_id, usage)
+        MICROVM_QUOTA_RESERVATIONS.labels("reserved" if reserved else "rejected").inc()
+        return bool(reserved)
+
+    def adjust(self, db: Session, tenant_id: int, old: Dict[str, int], new: Dict[str, int]) -> bool:
+        """Move a reservation from `old` to `new` usage; only growth is checked against the limits"""
+        delta = {key: new.get(key, 0) - old.get(key, 0) for key in RESOURCES}
+        if not any(delta.values()):
+            return True
+        return self.reserve(db, tenant_id, delta)
+
+    def release(self, db: Session, tenant_id: int, usage: Dict[str, int]) -> None:
+        """Give `usage` back to the tenant's quota"""
+        self._apply(db, tenant_id, {key: -amount for key, amount in usage.items()})
+        MICROVM_QUOTA_RESERVATIONS.labels("released").inc()
+
+    def recount(self, db: Session, tenant_id: Optional[int] = None) -> int:
+        """Set the counters from the tenant's active MicroVMs; returns the quota rows updated.
+
+        For counters that were never maintained (or drifted): run it while no
+        creates or destroys are in flight, since those change the counters
+        between the sums being read and written.
+        """
+        active = [microvms.c.is_active == True]
+        if tenant_id is not None:
+            active.append(microvms.c.tenant_id == tenant_id)
+        missing = db.execute(
+            select(microvms.c.tenant_id)
+            .where(*active, microvms.c.tenant_id.not_in(select(quotas.c.tenant_id)))
+            .distinct()
+        ).scalars().all()
+        for missing_tenant in missing:
+            self._ensure(db, missing_tenant)
+
+        def total(expression):
+            return (
+                select(func.coalesce(func.sum(expression), 0))
+                .where(microvms.c.tenant_id == quotas.c.tenant_id, microvms.c.is_active == True)
+                .scalar_subquery()
+            )
+
+        stmt = update(quotas).values(
+            current_microvms=total(literal_column("1")),
+            current_cpu_cores=total(microvms.c.cpu_cores),
+            # Charged per VM in whole GB, as usage_for does
+            current_memory_gb=total((microvms.c.memory_mb + 1023) // 1024),
+            current_storage_gb=total(microvms.c.storage_gb),
+        )
+        if tenant_id is not None:
+            stmt = stmt.where(quotas.c.tenant_id == tenant_id)
+        result = db.execute(stmt)
+        db.commit()
+        return result.rowcount
+
+    def _apply(self, db: Session, tenant_id: int, delta: Dict[str, int]) -> Optional[bool]:
+        """Add `delta` in one statement; True if applied, False if over quota, None if there is no row"""
+        values = {}
+        conditions = [quotas.c.tenant_id == tenant_id]
+        for key, amount in delta.items():
+            if not amount:
+                continue
+            current_name, limit_name = RESOURCES[key]
+            current = quotas.c[current_name]
+            if amount > 0:
+                conditions.append(current + amount <= quotas.c[limit_name])
+                values[current_name] = current + amount
+            else:
+                values[current_name] = case((current + amount < 0, 0), else_=current + amount)
+        if not values:
+            return True
+        result = db.execute(update(quotas).where(*conditions).values(**values).returning(quotas.c.id))
+        applied = result.first() is not None
+        db.commit()
+        if applied:
+            return True
+        exists = db.execute(select(quotas.c.id).where(quotas.c.tenant_id == tenant_id)).first()
+        db.commit()
+        return False if exists else None
+
+    def _ensure(self, db: Session, tenant_id: int) -> None:
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            db.execute(
+                insert(quotas)
+                .values(tenant_id=tenant_id, **self.defaults)
+                .on_conflict_do_nothing(index_elements=[quotas.c.tenant_id])
+            )
+            db.commit()
+            return
+        try:
+            db.execute(quotas.insert().values(tenant_id=tenant_id, **self.defaults))
+            db.commit()
+        except IntegrityError:
+            # Another request created the row first
+            db.rollback()
+
+
+quota_ledger = QuotaLedger(defaults=DEFAULT_LIMITS)
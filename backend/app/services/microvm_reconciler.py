@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import insert, select, update
+
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..models.microvm import MicroVM, MicroVMEvent, MicroVMStatus
+from .microvm_placement import microvm_placement
+from .microvm_snapshots import microvm_snapshots
+from .vm_control import VMControlClient, vm_control
+
+logger = logging.getLogger(__name__)
+
+MICROVM_PENDING = Gauge("vibecaas_microvm_pending", "MicroVMs waiting to finish provisioning")
+MICROVM_RECONCILE_SECONDS = Histogram(
+    "vibecaas_microvm_reconcile_seconds",
+    "Duration of one reconcile pass over all provisioning MicroVMs",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+MICROVM_STATUS_REQUESTS = Counter(
+    "vibecaas_microvm_status_requests_total", "Batch status requests sent to vm-control", ["region", "result"]
+)
+MICROVM_TRANSITIONS = Counter(
+    "vibecaas_microvm_transitions_total", "Provisioning outcomes applied by the reconciler", ["status", "source"]
+)
+
+# vm-control status -> terminal MicroVM status; anything else means still provisioning
+TERMINAL_STATES = {
+    "running": MicroVMStatus.RUNNING,
+    "failed": MicroVMStatus.FAILED,
+    "error": MicroVMStatus.FAILED,
+}
+
+SIGNATURE_HEADER = "X-VM-Control-Signature"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _seconds_since(started: Optional[datetime], now: datetime) -> Optional[float]:
+    if started is None:
+        return None
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=timezone.utc)
+    return (now - started).total_seconds()
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check a `sha256=<hex>` HMAC of the raw webhook body"""
+    if not secret or not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class MicroVMReconciler:
+    """Tracks provisioning MicroVMs with a constant number of vm-control requests.
+
+    Every `interval` seconds one pass loads all MicroVMs still in CREATING,
+    groups them by region and asks vm-control for their states with one list
+    request per region (split into `batch_size` ids), so the request rate
+    depends on the number of regions rather than the number of VMs. States can
+    also be pushed through the vm-control webhook; both paths go through
+    `apply`, which writes field updates with one executemany and moves VMs out
+    of CREATING with one conditional UPDATE per outcome. Only rows that were
+    still CREATING get an event, so replicas reconciling the same VMs, or a
+    webhook racing a pass, do not log a transition twice. VMs still
+    provisioning after `timeout` are marked failed.
+    """
+
+    def __init__(self, client: VMControlClient, interval: float, batch_size: int, timeout: float) -> None:
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self.timeout = timedelta(seconds=timeout)
+        self._task: asyncio.Task | None = None
+
+    async def reconcile(self) -> int:
+        """One pass over every provisioning VM; returns how many changed state"""
+        with MICROVM_RECONCILE_SECONDS.time():
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(MicroVM.vm_control_id, MicroVM.vm_control_region, MicroVM.region).where(
+                        MicroVM.status == MicroVMStatus.CREATING,
+                        MicroVM.is_active == True,
+                        MicroVM.vm_control_id.is_not(None),
+                    )
+                )
+                pending = result.all()
+            MICROVM_PENDING.set(len(pending))
+
+            by_region: Dict[str, List[str]] = defaultdict(list)
+            for row in pending:
+                by_region[row.vm_control_region or row.region].append(row.vm_control_id)
+            results = await asyncio.gather(
+                *(self._fetch_region(region, ids) for region, ids in by_region.items()), return_exceptions=True
+            )
+            states: List[Dict[str, Any]] = []
+            for region, result in zip(by_region, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"vm-control status request for {region} failed: {result}")
+                    continue
+                states.extend(result)
+            changed = await self.apply(states, source="poll")
+            return changed + await self._expire()
+
+    async def apply(self, states: Iterable[Dict[str, Any]], source: str = "webhook") -> int:
+        """Write vm-control states (dicts with at least `id` and `status`) to their MicroVM rows"""
+        states = [state for state in states if state.get("id")]
+        if not states:
+            return 0
+        by_control_id = {state["id"]: state for state in states}
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MicroVM.id, MicroVM.vm_control_id).where(MicroVM.vm_control_id.in_(list(by_control_id)))
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+
+            field_updates = []
+            outcomes: Dict[MicroVMStatus, List[int]] = defaultdict(list)
+            for row in rows:
+                state = by_control_id[row.vm_control_id]
+                values: Dict[str, Any] = {"id": row.id, "vm_control_status": state.get("status")}
+                for field in ("dev_url", "internal_ip", "external_ip"):
+                    if state.get(field):
+                        values[field] = state[field]
+                field_updates.append(values)
+                terminal = TERMINAL_STATES.get(str(state.get("status")).lower())
+                if terminal is not None:
+                    outcomes[terminal].append(row.id)
+
+            # ORM bulk UPDATE by primary key: one executemany for every row
+            await db.execute(update(MicroVM), field_updates)
+
+            now = _utcnow()
+            events = []
+            cold_booted = []
+            for status, ids in outcomes.items():
+                values = {"status": status, "updated_at": now}
+                if status == MicroVMStatus.RUNNING:
+                    values["started_at"] = now
+                moved = await db.execute(
+                    update(MicroVM)
+                    .where(MicroVM.id.in_(ids), MicroVM.status == MicroVMStatus.CREATING)
+                    .values(**values)
+                    .returning(
+                        MicroVM.id, MicroVM.vm_id, MicroVM.boot_mode, MicroVM.snapshot_key,
+                        MicroVM.region, MicroVM.created_at,
+                    )
+                )
+                for microvm_id, vm_id, boot_mode, key, region, created_at in moved.all():
+                    if status == MicroVMStatus.RUNNING:
+                        events.append(self._event(microvm_id, "running", f"VM {vm_id} is now running"))
+                        if boot_mode == "cold" and key:
+                            cold_booted.append(microvm_id)
+                        # Restores say nothing about how fast the region boots
+                        cold = boot_mode != "restore"
+                        microvm_placement.observe(region, _seconds_since(created_at, now) if cold else None, ok=True)
+                    else:
+                        events.append(self._event(microvm_id, "failed", f"VM {vm_id} failed to start"))
+                        microvm_placement.observe(region, None, ok=False)
+                    MICROVM_TRANSITIONS.labels(status.value, source).inc()
+            if events:
+                await db.execute(insert(MicroVMEvent), events)
+            await db.commit()
+        # Built from scratch: keep the post-build state so the next VM like it can restore
+        microvm_snapshots.capture_later(cold_booted)
+        return len(events)
+
+    def start(self) -> None:
+        if not self.client.base_url:
+            logger.info("VM_CONTROL_URL is not set; MicroVM reconciler disabled")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _fetch_region(self, region: str, ids: List[str]) -> List[Dict[str, Any]]:
+        states: List[Dict[str, Any]] = []
+        for i in range(0, len(ids), self.batch_size):
+            try:
+                states.extend(await self.client.list_vms(region=region, ids=ids[i:i + self.batch_size]))
+            except Exception:
+                MICROVM_STATUS_REQUESTS.labels(region, "error").inc()
+                raise
+            MICROVM_STATUS_REQUESTS.labels(region, "ok").inc()
+        return states
+
+    async def _expire(self) -> int:
+        """Fail VMs that have been provisioning for longer than the timeout"""
+        now = _utcnow()
+        async with AsyncSessionLocal() as db:
+            moved = await db.execute(
+                update(MicroVM)
+                .where(
+                    MicroVM.status == MicroVMStatus.CREATING,
+                    MicroVM.is_active == True,
+                    MicroVM.vm_control_id.is_not(None),
+                    MicroVM.created_at < now - self.timeout,
+                )
+                .values(status=MicroVMStatus.FAILED, updated_at=now)
+                .returning(MicroVM.id, MicroVM.vm_id, MicroVM.region)
+            )
+            rows = moved.all()
+            if rows:
+                await db.execute(
+                    insert(MicroVMEvent),
+                    [
+                        self._event(microvm_id, "provisioning_timeout", f"VM {vm_id} did not start within {self.timeout}")
+                        for microvm_id, vm_id, _ in rows
+                    ],
+                )
+            await db.commit()
+        for _, _, region in rows:
+            microvm_placement.observe(region, None, ok=False)
+        MICROVM_TRANSITIONS.labels(MicroVMStatus.FAILED.value, "timeout").inc(len(rows))
+        return len(rows)
+
+    @staticmethod
+    def _event(microvm_id: int, event_type: str, message: str) -> Dict[str, Any]:
+        return {"microvm_id": microvm_id, "event_type": event_type, "message": message, "metadata": {}}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning(f"MicroVM reconcile failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+microvm_reconciler = MicroVMReconciler(
+    client=vm_control,
+    interval=settings.vm_reconcile_interval,
+    batch_size=settings.vm_reconcile_batch_size,
+    timeout=settings.vm_provision_timeout,
+)
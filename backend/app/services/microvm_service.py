@@ -1,12 +1,18 @@
-import httpx
 import asyncio
 import uuid
+import httpx
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
-from ..models.microvm import MicroVM, MicroVMEvent, MicroVMQuota, MicroVMStatus, MicroVMRuntime
+from ..models.microvm import MicroVM, MicroVMStatus, MicroVMRuntime
 from ..schemas.microvm import MicroVMCreate, MicroVMUpdate, MicroVMRuntimeTemplate, MicroVMRegion
 from ..config import settings
+from ..db import SessionLocal
+from .microvm_events import microvm_events
+from .microvm_placement import microvm_placement
+from .microvm_quota import QuotaExceeded, quota_ledger, usage_for
+from .microvm_snapshots import microvm_snapshots
+from .vm_control import vm_control
 import logging
 from datetime import datetime, timedelta
 
@@ -15,17 +21,23 @@ logger = logging.getLogger(__name__)
 class MicroVMService:
     def __init__(self, db: Session):
         self.db = db
-        self.vm_control_url = settings.VM_CONTROL_URL
-        self.vm_control_token = settings.VM_CONTROL_TOKEN
-        self.default_region = settings.VM_DEFAULT_REGION
-        self.default_cpu = settings.VM_DEFAULT_CPU
-        self.default_memory_mb = settings.VM_DEFAULT_MEMORY_MB
+        self.vm_control = vm_control
+        self.default_region = settings.vm_default_region
+        self.default_cpu = settings.vm_default_cpu
+        self.default_memory_mb = settings.vm_default_memory_mb
 
     async def create_microvm(self, microvm_data: MicroVMCreate, user_id: int, tenant_id: int) -> MicroVM:
         """Create a new MicroVM"""
-        # Check quotas
-        if not await self._check_quotas(tenant_id, microvm_data):
-            raise ValueError("Quota exceeded for tenant")
+        # Reserve quota up front; concurrent creates cannot both take the last slot
+        usage = usage_for(microvm_data.cpu_cores, microvm_data.memory_mb, microvm_data.storage_gb)
+        if not quota_ledger.reserve(self.db, tenant_id, usage):
+            raise QuotaExceeded("Quota exceeded for tenant")
+
+        try:
+            placement = microvm_placement.place(microvm_data.cpu_cores, microvm_data.memory_mb, microvm_data.region)
+        except ValueError:
+            quota_ledger.release(self.db, tenant_id, usage)
+            raise
 
         # Generate unique VM ID
         vm_id = f"vm-{uuid.uuid4().hex[:12]}"
@@ -38,7 +50,8 @@ class MicroVMService:
             owner_id=user_id,
             tenant_id=tenant_id,
             runtime=microvm_data.runtime,
-            region=microvm_data.region,
+            region=placement.region,
+            vm_control_host=placement.host_id,
             cpu_cores=microvm_data.cpu_cores,
             memory_mb=microvm_data.memory_mb,
             storage_gb=microvm_data.storage_gb,
@@ -47,14 +60,21 @@ class MicroVMService:
             build_command=microvm_data.build_command,
             start_command=microvm_data.start_command,
             environment_variables=microvm_data.environment_variables or {},
+            labels=microvm_data.labels or {},
             gpu_enabled=microvm_data.gpu_enabled,
             auto_scale=microvm_data.auto_scale,
+            fast_start=microvm_data.fast_start,
             status=MicroVMStatus.CREATING
         )
         
-        self.db.add(microvm)
-        self.db.commit()
-        self.db.refresh(microvm)
+        try:
+            self.db.add(microvm)
+            self.db.commit()
+            self.db.refresh(microvm)
+        except Exception:
+            self.db.rollback()
+            quota_ledger.release(self.db, tenant_id, usage)
+            raise
         
         # Log creation event
         await self._log_event(microvm.id, "created", f"MicroVM {vm_id} created")
@@ -125,8 +145,18 @@ class MicroVMService:
         if microvm.status not in [MicroVMStatus.RUNNING, MicroVMStatus.STOPPED]:
             raise ValueError("Cannot update MicroVM in current status")
         
+        changes = microvm_data.dict(exclude_unset=True)
+        old_usage = self._usage(microvm)
+        new_usage = usage_for(
+            changes.get("cpu_cores", microvm.cpu_cores),
+            changes.get("memory_mb", microvm.memory_mb),
+            changes.get("storage_gb", microvm.storage_gb),
+        )
+        if not quota_ledger.adjust(self.db, microvm.tenant_id, old_usage, new_usage):
+            raise QuotaExceeded("Quota exceeded for tenant")
+        
         # Update fields
-        for field, value in microvm_data.dict(exclude_unset=True).items():
+        for field, value in changes.items():
             setattr(microvm, field, value)
         
         microvm.updated_at = datetime.utcnow()
@@ -279,46 +309,22 @@ class MicroVMService:
         ]
 
     async def get_available_regions(self) -> List[MicroVMRegion]:
-        """Get available regions for MicroVM deployment"""
-        return [
-            MicroVMRegion(id="us-east-1", name="US East (N. Virginia)", available=True, latency_ms=50),
-            MicroVMRegion(id="us-west-2", name="US West (Oregon)", available=True, latency_ms=80),
-            MicroVMRegion(id="eu-west-1", name="Europe (Ireland)", available=True, latency_ms=120),
-            MicroVMRegion(id="ap-southeast-1", name="Asia Pacific (Singapore)", available=True, latency_ms=200),
-            MicroVMRegion(id="ap-northeast-1", name="Asia Pacific (Tokyo)", available=True, latency_ms=180),
-        ]
+        """Get available regions for MicroVM deployment, with measured latency and free capacity"""
+        return [MicroVMRegion(**region) for region in microvm_placement.regions()]
 
-    async def _check_quotas(self, tenant_id: int, microvm_data: MicroVMCreate) -> bool:
-        """Check if tenant has quota for new MicroVM"""
-        quota = self.db.query(MicroVMQuota).filter(MicroVMQuota.tenant_id == tenant_id).first()
-        if not quota:
-            # Create default quota
-            quota = MicroVMQuota(
-                tenant_id=tenant_id,
-                max_microvms=5,
-                max_cpu_cores=8,
-                max_memory_gb=16,
-                max_storage_gb=100
-            )
-            self.db.add(quota)
-            self.db.commit()
-        
-        # Check limits
-        if quota.current_microvms >= quota.max_microvms:
-            return False
-        if quota.current_cpu_cores + microvm_data.cpu_cores > quota.max_cpu_cores:
-            return False
-        if quota.current_memory_gb + (microvm_data.memory_mb // 1024) > quota.max_memory_gb:
-            return False
-        if quota.current_storage_gb + microvm_data.storage_gb > quota.max_storage_gb:
-            return False
-        
-        return True
+    @staticmethod
+    def _usage(microvm: MicroVM) -> Dict[str, int]:
+        return usage_for(microvm.cpu_cores, microvm.memory_mb, microvm.storage_gb)
 
     async def _provision_microvm(self, microvm_id: int):
-        """Provision MicroVM via vm-control API"""
+        """Provision MicroVM via vm-control API
+
+        Runs after the creating request has returned, so it uses its own short
+        sessions and holds no pool connection across the vm-control calls.
+        """
         try:
-            microvm = self.db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
+            with SessionLocal() as db:
+                microvm = db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
             if not microvm:
                 return
             
@@ -337,91 +343,69 @@ class MicroVMService:
                 "environment_variables": microvm.environment_variables,
                 "gpu_enabled": microvm.gpu_enabled
             }
+            if microvm.vm_control_host:
+                vm_config["host_id"] = microvm.vm_control_host
+            
+            # Restore from a post-build snapshot of the same commit and build config when there is one
+            match = await microvm_snapshots.lookup(microvm)
+            snapshot_id = match.snapshot_id
+            if match.commit:
+                vm_config["commit"] = match.commit
+            if snapshot_id:
+                vm_config["snapshot_id"] = snapshot_id
+            try:
+                vm_data = await self.vm_control.create_vm(vm_config)
+            except httpx.HTTPStatusError as e:
+                if not snapshot_id or e.response.status_code not in (404, 410):
+                    raise
+                # vm-control lost the snapshot: boot cold, which captures a new one
+                await microvm_snapshots.invalidate(match.key)
+                del vm_config["snapshot_id"]
+                snapshot_id = None
+                vm_data = await self.vm_control.create_vm(vm_config)
+            with SessionLocal() as db:
+                db.query(MicroVM).filter(MicroVM.id == microvm_id).update({
+                    "snapshot_key": match.key,
+                    "commit_sha": match.commit or None,
+                    "boot_mode": "restore" if snapshot_id else "cold",
+                    "vm_control_id": vm_data["id"],
+                    "vm_control_region": vm_data.get("region", microvm.region),
+                    "vm_control_host": vm_data.get("host_id", microvm.vm_control_host),
+                    "vm_control_status": vm_data["status"],
+                    "dev_url": vm_data.get("dev_url"),
+                    "internal_ip": vm_data.get("internal_ip"),
+                    "external_ip": vm_data.get("external_ip"),
+                }, synchronize_session=False)
+                db.commit()
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.vm_control_url}/api/v1/vms",
-                    json=vm_config,
-                    headers={"Authorization": f"Bearer {self.vm_control_token}"},
-                    timeout=30.0
+            if snapshot_id:
+                await self._log_event(
+                    microvm_id, "provisioning_started", f"VM restoring from snapshot {snapshot_id} with ID {vm_data['id']}",
+                    {"boot_mode": "restore", "snapshot_id": snapshot_id, "commit": match.commit}
                 )
-                response.raise_for_status()
-                
-                vm_data = response.json()
-                microvm.vm_control_id = vm_data["id"]
-                microvm.vm_control_region = vm_data["region"]
-                microvm.vm_control_status = vm_data["status"]
-                microvm.dev_url = vm_data.get("dev_url")
-                microvm.internal_ip = vm_data.get("internal_ip")
-                microvm.external_ip = vm_data.get("external_ip")
-                
-                self.db.commit()
-                
-                await self._log_event(microvm_id, "provisioning_started", f"VM provisioning started with ID {vm_data['id']}")
-                
-                # Poll for completion
-                await self._poll_vm_status(microvm_id)
-                
+            else:
+                await self._log_event(
+                    microvm_id, "provisioning_started", f"VM provisioning started with ID {vm_data['id']}",
+                    {"boot_mode": "cold", "commit": match.commit}
+                )
+            # microvm_reconciler moves the VM out of CREATING once vm-control reports it
+            
         except Exception as e:
             logger.error(f"Failed to provision MicroVM {microvm_id}: {e}")
-            microvm = self.db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
-            if microvm:
-                microvm.status = MicroVMStatus.FAILED
-                self.db.commit()
-                await self._log_event(microvm_id, "provisioning_failed", f"VM provisioning failed: {str(e)}")
-
-    async def _poll_vm_status(self, microvm_id: int):
-        """Poll VM status until completion"""
-        max_attempts = 60  # 5 minutes with 5-second intervals
-        attempt = 0
-        
-        while attempt < max_attempts:
-            try:
-                microvm = self.db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
-                if not microvm or not microvm.vm_control_id:
-                    break
-                
-                status_data = await self._fetch_vm_status(microvm.vm_control_id)
-                if not status_data:
-                    break
-                
-                # Update status
-                microvm.vm_control_status = status_data["status"]
-                microvm.dev_url = status_data.get("dev_url", microvm.dev_url)
-                microvm.internal_ip = status_data.get("internal_ip", microvm.internal_ip)
-                microvm.external_ip = status_data.get("external_ip", microvm.external_ip)
-                
-                if status_data["status"] == "running":
-                    microvm.status = MicroVMStatus.RUNNING
-                    microvm.started_at = datetime.utcnow()
-                    self.db.commit()
-                    await self._log_event(microvm_id, "running", f"VM {microvm.vm_id} is now running")
-                    break
-                elif status_data["status"] == "failed":
+            with SessionLocal() as db:
+                microvm = db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
+                region = microvm.region if microvm else None
+                if microvm:
                     microvm.status = MicroVMStatus.FAILED
-                    self.db.commit()
-                    await self._log_event(microvm_id, "failed", f"VM {microvm.vm_id} failed to start")
-                    break
-                
-                self.db.commit()
-                await asyncio.sleep(5)
-                attempt += 1
-                
-            except Exception as e:
-                logger.error(f"Error polling VM status for {microvm_id}: {e}")
-                break
+                    db.commit()
+            if region:
+                microvm_placement.observe(region, None, ok=False)
+                await self._log_event(microvm_id, "provisioning_failed", f"VM provisioning failed: {str(e)}")
 
     async def _fetch_vm_status(self, vm_control_id: str) -> Optional[Dict[str, Any]]:
         """Fetch VM status from vm-control API"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.vm_control_url}/api/v1/vms/{vm_control_id}",
-                    headers={"Authorization": f"Bearer {self.vm_control_token}"},
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self.vm_control.get_vm(vm_control_id)
         except Exception as e:
             logger.error(f"Failed to fetch VM status for {vm_control_id}: {e}")
             return None
@@ -430,24 +414,27 @@ class MicroVMService:
         """Destroy MicroVM via vm-control API"""
         try:
             microvm = self.db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
-            if not microvm or not microvm.vm_control_id:
+            if not microvm:
                 return
             
-            async with httpx.AsyncClient() as client:
-                response = await client.delete(
-                    f"{self.vm_control_url}/api/v1/vms/{microvm.vm_control_id}",
-                    headers={"Authorization": f"Bearer {self.vm_control_token}"},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                
-                microvm.status = MicroVMStatus.DESTROYED
-                microvm.stopped_at = datetime.utcnow()
-                microvm.is_active = False
-                self.db.commit()
-                
-                await self._log_event(microvm_id, "destroyed", f"VM {microvm.vm_id} destroyed")
-                
+            # A VM that failed before vm-control created it has nothing to delete there
+            if microvm.vm_control_id:
+                await self.vm_control.delete_vm(microvm.vm_control_id)
+            
+            # Only the destroy that deactivates the row gives the quota back
+            deactivated = self.db.query(MicroVM).filter(
+                MicroVM.id == microvm_id,
+                MicroVM.is_active == True
+            ).update(
+                {"status": MicroVMStatus.DESTROYED, "stopped_at": datetime.utcnow(), "is_active": False},
+                synchronize_session=False
+            )
+            self.db.commit()
+            if deactivated:
+                quota_ledger.release(self.db, microvm.tenant_id, self._usage(microvm))
+            
+            await self._log_event(microvm_id, "destroyed", f"VM {microvm.vm_id} destroyed")
+            
         except Exception as e:
             logger.error(f"Failed to destroy MicroVM {microvm_id}: {e}")
             microvm = self.db.query(MicroVM).filter(MicroVM.id == microvm_id).first()
@@ -469,27 +456,13 @@ class MicroVMService:
                 "storage_gb": microvm.storage_gb
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.patch(
-                    f"{self.vm_control_url}/api/v1/vms/{microvm.vm_control_id}",
-                    json=resource_config,
-                    headers={"Authorization": f"Bearer {self.vm_control_token}"},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                
-                await self._log_event(microvm_id, "resources_updated", f"VM resources updated")
-                
+            await self.vm_control.update_vm(microvm.vm_control_id, resource_config)
+            
+            await self._log_event(microvm_id, "resources_updated", f"VM resources updated")
+            
         except Exception as e:
             logger.error(f"Failed to update VM resources for {microvm_id}: {e}")
 
     async def _log_event(self, microvm_id: int, event_type: str, message: str, metadata: Optional[Dict[str, Any]] = None):
-        """Log a MicroVM event"""
-        event = MicroVMEvent(
-            microvm_id=microvm_id,
-            event_type=event_type,
-            message=message,
-            metadata=metadata or {}
-        )
-        self.db.add(event)
-        self.db.commit()
\ No newline at end of file
+        """Log a MicroVM event; written in the next batch of the event sink"""
+        microvm_events.emit(microvm_id, event_type, message, metadata)
\ No newline at end of file
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from prometheus_client import Counter, Histogram
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..config import settings
+from ..db import AsyncSessionLocal
+from ..models.microvm import MicroVM, MicroVMSnapshot
+from .vm_control import VMControlClient, vm_control
+
+logger = logging.getLogger(__name__)
+
+MICROVM_SNAPSHOT_LOOKUPS = Counter(
+    "vibecaas_microvm_snapshot_lookups_total", "Snapshot lookups when provisioning a MicroVM", ["result"]
+)
+MICROVM_SNAPSHOT_CAPTURES = Counter(
+    "vibecaas_microvm_snapshot_captures_total", "Post-build snapshot captures by outcome", ["result"]
+)
+MICROVM_SNAPSHOT_CAPTURE_SECONDS = Histogram(
+    "vibecaas_microvm_snapshot_capture_seconds",
+    "Time from requesting a snapshot until vm-control reports it ready",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+# MicroVM fields that shape the post-build state; a snapshot only matches VMs that agree on all of them
+BUILD_FIELDS = (
+    "tenant_id",
+    "runtime",
+    "region",
+    "cpu_cores",
+    "memory_mb",
+    "storage_gb",
+    "gpu_enabled",
+    "repo_url",
+    "branch",
+    "build_command",
+    "start_command",
+    "environment_variables",
+)
+
+
+class SnapshotMatch(NamedTuple):
+    key: Optional[str]  # None when the VM cannot use snapshots
+    commit: Optional[str]  # Commit the VM must build, "" without a repo
+    snapshot_id: Optional[str]  # vm-control snapshot to restore, None to boot cold
+
+
+NO_MATCH = SnapshotMatch(None, None, None)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def lineage_key(fields: Dict[str, Any]) -> str:
+    """Key of everything that shapes a VM's post-build state except the commit"""
+    return _hash({name: fields.get(name) for name in BUILD_FIELDS})
+
+
+def snapshot_key(fields: Dict[str, Any], commit: str) -> str:
+    return _hash([lineage_key(fields), commit])
+
+
+async def git_head(repo_url: str, branch: str) -> Optional[str]:
+    """Commit at the tip of `branch`, or None if the repository cannot be reached"""
+    proc = await asyncio.create_subprocess_exec(
+        # https only, and no redirects off the host the URL was allowed for
+        "git", "-c", "protocol.allow=never", "-c", "protocol.https.allow=always", "-c", "http.followRedirects=false",
+        "ls-remote", repo_url, f"refs/heads/{branch}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), 10)
+    except asyncio.TimeoutError:
+        proc.kill()
+        return None
+    if proc.returncode != 0 or not stdout:
+        return None
+    return stdout.split()[0].decode()
+
+
+class MicroVMSnapshots:
+    """Fast start for MicroVMs from post-build snapshots.
+
+    A snapshot is the memory and disk state of a VM that finished its build,
+    keyed by everything that went into that build: tenant, runtime, region,
+    VM size, repository, the exact commit and the build/start commands and
+    environment. Keys are per tenant because a memory snapshot carries the
+    source VM's secrets. When a VM is provisioned, `lookup` resolves the
+    branch head (cached for `commit_ttl`) and, if a ready snapshot matches,
+    the VM is restored from it instead of booting and building from scratch;
+    either way vm-control is asked to build that commit, so the key describes
+    what is actually running. The first VM that boots cold for a key is
+    captured once it is running (`capture_later`, called by the reconciler);
+    concurrent captures of one key are ruled out by its unique row. A ready
+    snapshot replaces older commits of the same lineage.
+
+    Branch heads are only resolved for https URLs on `git_hosts`, so users
+    cannot point the API server at arbitrary hosts; VMs with other
+    repositories, or any repository when git is not installed, boot cold.
+    """
+
+    def __init__(
+        self,
+        client: VMControlClient,
+        enabled: bool,
+        timeout: float,
+        commit_ttl: float,
+        git_hosts: Iterable[str],
+        resolver: Callable[[str, str], Awaitable[Optional[str]]] = git_head,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.client = client
+        self.enabled = enabled
+        self.timeout = timeout
+        self.commit_ttl = commit_ttl
+        self.git_hosts = {host.strip().lower() for host in git_hosts if host.strip()}
+        self.resolver = resolver
+        self.can_resolve = resolver is not git_head or shutil.which("git") is not None
+        if enabled and not self.can_resolve:
+            logger.warning("git not found; snapshot fast start is disabled for MicroVMs with a repository")
+        self.poll_interval = poll_interval
+        self._commits: Dict[Tuple[str, str], Tuple[float, Optional[str]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def lookup(self, microvm: MicroVM) -> SnapshotMatch:
+        """Find the snapshot `microvm` can be restored from, and the commit it should build"""
+        if not self.enabled or microvm.fast_start is False:
+            MICROVM_SNAPSHOT_LOOKUPS.labels("disabled").inc()
+            return NO_MATCH
+        if microvm.repo_url and not self.resolvable(microvm.repo_url):
+            MICROVM_SNAPSHOT_LOOKUPS.labels("disabled").inc()
+            return NO_MATCH
+        commit = await self.resolve_commit(microvm.repo_url, microvm.branch or "main")
+        if commit is None:
+            MICROVM_SNAPSHOT_LOOKUPS.labels("unresolved").inc()
+            return NO_MATCH
+        key = snapshot_key(self._fields(microvm), commit)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(MicroVMSnapshot)
+                .where(MicroVMSnapshot.snapshot_key == key, MicroVMSnapshot.status == "ready")
+                .values(restores=MicroVMSnapshot.restores + 1, last_used_at=_utcnow())
+                .returning(MicroVMSnapshot.vm_control_snapshot_id)
+            )
+            snapshot_id = result.scalar_one_or_none()
+            await db.commit()
+        MICROVM_SNAPSHOT_LOOKUPS.labels("hit" if snapshot_id else "miss").inc()
+        return SnapshotMatch(key, commit, snapshot_id)
+
+    def resolvable(self, repo_url: str) -> bool:
+        """Whether the branch head of `repo_url` may be looked up from here"""
+        if not self.can_resolve:
+            return False
+        try:
+            parts = urlsplit(repo_url)
+            port = parts.port
+        except ValueError:
+            return False
+        return parts.scheme == "https" and port in (None, 443) and (parts.hostname or "") in self.git_hosts
+
+    async def resolve_commit(self, repo_url: Optional[str], branch: str) -> Optional[str]:
+        if not repo_url:
+            return ""
+        cache_key = (repo_url, branch)
+        cached = self._commits.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        try:
+            commit = await self.resolver(repo_url, branch)
+        except Exception as e:
+            logger.warning(f"Could not resolve {repo_url}@{branch}: {e}")
+            commit = None
+        self._commits[cache_key] = (time.monotonic() + self.commit_ttl, commit)
+        return commit
+
+    async def invalidate(self, key: str) -> None:
+        """Forget a snapshot vm-control no longer has"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(MicroVMSnapshot).where(MicroVMSnapshot.snapshot_key == key))
+            await db.commit()
+
+    def capture_later(self, microvm_ids: Iterable[int]) -> None:
+        """Capture snapshots of VMs that just finished a cold boot, in the background"""
+        if not self.enabled:
+            return
+        for microvm_id in microvm_ids:
+            task = asyncio.create_task(self.capture(microvm_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def capture(self, microvm_id: int) -> Optional[str]:
+        """Snapshot a running VM unless its key already has one; returns the vm-control snapshot id"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MicroVM.vm_control_id, MicroVM.snapshot_key, MicroVM.boot_mode, MicroVM.commit_sha,
+                       *(getattr(MicroVM, name) for name in BUILD_FIELDS))
+                .where(MicroVM.id == microvm_id)
+            )
+            vm = result.first()
+            if not vm or not vm.snapshot_key or not vm.vm_control_id or vm.boot_mode != "cold":
+                return None
+            fields = {name: getattr(vm, name) for name in BUILD_FIELDS}
+            # A capture that never finished (restart, crash) must not block the key forever
+            await db.execute(
+                delete(MicroVMSnapshot).where(
+                    MicroVMSnapshot.snapshot_key == vm.snapshot_key,
+                    MicroVMSnapshot.status == "creating",
+                    MicroVMSnapshot.created_at < _utcnow() - timedelta(seconds=self.timeout),
+                )
+            )
+            db.add(
+                MicroVMSnapshot(
+                    snapshot_key=vm.snapshot_key,
+                    lineage_key=lineage_key(fields),
+                    tenant_id=vm.tenant_id,
+                    runtime=vm.runtime,
+                    region=vm.region,
+                    repo_url=vm.repo_url,
+                    branch=vm.branch,
+                    commit_sha=vm.commit_sha,
+                    source_microvm_id=microvm_id,
+                    status="creating",
+                )
+            )
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Already captured, or another VM with the same key is being captured
+                await db.rollback()
+                return None
+
+        started = time.perf_counter()
+        snapshot_id = None
+        try:
+            snapshot = await self.client.create_snapshot(vm.vm_control_id, {"snapshot_key": vm.snapshot_key})
+            snapshot_id = snapshot["id"]
+            snapshot = await self._wait_ready(snapshot)
+        except Exception as e:
+            logger.warning(f"Snapshot of MicroVM {microvm_id} failed: {e}")
+            MICROVM_SNAPSHOT_CAPTURES.labels("failed").inc()
+            await self.invalidate(vm.snapshot_key)
+            if snapshot_id:
+                await self._delete_remote(snapshot_id)
+            return None
+        MICROVM_SNAPSHOT_CAPTURE_SECONDS.observe(time.perf_counter() - started)
+        MICROVM_SNAPSHOT_CAPTURES.labels("ready").inc()
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(MicroVMSnapshot)
+                .where(MicroVMSnapshot.snapshot_key == vm.snapshot_key)
+                .values(
+                    status="ready",
+                    vm_control_snapshot_id=snapshot_id,
+                    size_mb=snapshot.get("size_mb"),
+                    ready_at=_utcnow(),
+                )
+            )
+            replaced = await db.execute(
+                delete(MicroVMSnapshot)
+                .where(
+                    MicroVMSnapshot.lineage_key == lineage_key(fields),
+                    MicroVMSnapshot.snapshot_key != vm.snapshot_key,
+                    MicroVMSnapshot.status == "ready",
+                )
+                .returning(MicroVMSnapshot.vm_control_snapshot_id)
+            )
+            stale = [row for row in replaced.scalars().all() if row]
+            await db.commit()
+        for stale_id in stale:
+            await self._delete_remote(stale_id)
+        return snapshot_id
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _wait_ready(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout
+        while snapshot.get("status") != "ready":
+            if snapshot.get("status") in ("failed", "error"):
+                raise RuntimeError(f"vm-control reported snapshot {snapshot['id']} as {snapshot['status']}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Snapshot {snapshot['id']} not ready after {self.timeout}s")
+            await asyncio.sleep(self.poll_interval)
+            snapshot = await self.client.get_snapshot(snapshot["id"])
+        return snapshot
+
+    async def _delete_remote(self, snapshot_id: str) -> None:
+        try:
+            await self.client.delete_snapshot(snapshot_id)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                logger.warning(f"Could not delete snapshot {snapshot_id}: {e}")
+        except Exception as e:
+            logger.warning(f"Could not delete snapshot {snapshot_id}: {e}")
+
+    @staticmethod
+    def _fields(microvm: MicroVM) -> Dict[str, Any]:
+        return {name: getattr(microvm, name) for name in BUILD_FIELDS}
+
+
+microvm_snapshots = MicroVMSnapshots(
+    client=vm_control,
+    enabled=settings.vm_snapshots_enabled,
+    timeout=settings.vm_snapshot_timeout,
+    commit_ttl=settings.vm_snapshot_commit_ttl,
+    git_hosts=settings.vm_snapshot_git_hosts.split(","),
+)
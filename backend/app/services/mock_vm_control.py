@@ -1,12 +1,23 @@
 """
 Mock VM Control Service for Testing
-Simulates the vm-control API for local development and testing
+Simulates the vm-control API for local development, testing and load tests
+
+Run it as a standalone service and point VM_CONTROL_URL at it:
+
+    cd backend && python -m app.services.mock_vm_control --port 8090 \
+        --boot lognormal:2,0.4 --region-hosts us-east-1=200,eu-west-1=100 \
+        --failure-rate us-east-1=0.01 --create-rate-limit 200 --api-error-rate 0.001
 """
 
+import argparse
 import asyncio
+import math
+import random
+import time
 import uuid
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from enum import Enum
 import json
 
@@ -14,15 +25,161 @@ class VMStatus(str, Enum):
     CREATING = "creating"
     RUNNING = "running"
     STOPPED = "stopped"
+    SUSPENDED = "suspended"
+    RESUMING = "resuming"
     ERROR = "error"
     TERMINATED = "terminated"
 
+class SnapshotNotFound(ValueError):
+    """The snapshot to restore from does not exist or is not ready"""
+
+class CapacityExhausted(ValueError):
+    """No host in the region has room for the VM"""
+
+class RateLimited(ValueError):
+    """The region is taking creates faster than its rate limit"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+class Latency:
+    """A simulated duration in seconds, fixed or drawn from a distribution
+
+    Specs: "2" or "fixed:2", "uniform:1,3" (low, high), "normal:2,0.5"
+    (mean, stddev), "lognormal:2,0.4" (median, sigma), "exp:2" (mean).
+    Draws below zero count as zero.
+    """
+    
+    PARAMS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+    
+    def __init__(self, kind: str, *params: float):
+        if self.PARAMS.get(kind) != len(params):
+            raise ValueError(f"Invalid latency: {kind} with {len(params)} parameters")
+        self.kind = kind
+        self.params = params
+    
+    @classmethod
+    def parse(cls, spec: Union["Latency", float, str]) -> "Latency":
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, _, params = spec.partition(":")
+        if not params:
+            return cls("fixed", float(kind))
+        return cls(kind, *(float(p) for p in params.split(",")))
+    
+    def sample(self, rng: random.Random) -> float:
+        a = self.params
+        if self.kind == "uniform":
+            value = rng.uniform(a[0], a[1])
+        elif self.kind == "normal":
+            value = rng.gauss(a[0], a[1])
+        elif self.kind == "lognormal":
+            value = a[0] * math.exp(rng.gauss(0, a[1]))
+        elif self.kind == "exp":
+            value = rng.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+        else:
+            value = a[0]
+        return max(value, 0.0)
+    
+    def __repr__(self):
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+class TokenBucket:
+    """Allows `rate` operations per second on average, in bursts of up to `burst`"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def take(self) -> float:
+        """0 if allowed, else seconds until the next token"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
 class MockVMControl:
-    """Mock implementation of vm-control API for testing"""
+    """Mock implementation of vm-control API for testing
+
+    Timings are simulated: a cold boot takes `boot_seconds`, plus
+    `build_seconds` when the VM has a repository or build command; restoring
+    from a snapshot takes `restore_seconds` instead; capturing a snapshot
+    takes `snapshot_seconds`; resuming a suspended VM takes
+    `resume_seconds`. Each is a fixed number of seconds or a Latency
+    distribution. `region_slowdown` multiplies those times per region and
+    `region_failure_rate` fails that share of its VMs.
+
+    Each region has `hosts_per_region` hosts (or its entry in
+    `region_hosts`) of `host_cpu` cores and `host_memory_mb`; a VM goes on
+    the requested host if it fits there, otherwise on the first host that
+    fits. Suspending a VM gives its resources back to the host until it
+    resumes. VMs report `cpu_usage_percent` from their record, 0 unless a
+    test sets it.
+
+    For load tests, `create_rate_limit` caps creates per second per region
+    (429 with Retry-After beyond it), and the HTTP app adds `api_latency`
+    to every request and fails `api_error_rate` of them with a 503.
+    `counters` tallies what happened; `seed` makes a run repeatable.
+    """
     
-    def __init__(self):
+    def __init__(
+        self,
+        boot_seconds: Union[Latency, float, str] = 2.0,
+        build_seconds: Union[Latency, float, str] = 0.0,
+        snapshot_seconds: Union[Latency, float, str] = 1.0,
+        restore_seconds: Union[Latency, float, str] = 0.2,
+        resume_seconds: Union[Latency, float, str] = 0.3,
+        hosts_per_region: int = 4,
+        host_cpu: int = 32,
+        host_memory_mb: int = 131072,
+        region_slowdown: Optional[Dict[str, float]] = None,
+        region_failure_rate: Optional[Dict[str, float]] = None,
+        region_hosts: Optional[Dict[str, int]] = None,
+        create_rate_limit: float = 0.0,
+        api_latency: Union[Latency, float, str] = 0.0,
+        api_error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.boot_seconds = Latency.parse(boot_seconds)
+        self.build_seconds = Latency.parse(build_seconds)
+        self.snapshot_seconds = Latency.parse(snapshot_seconds)
+        self.restore_seconds = Latency.parse(restore_seconds)
+        self.resume_seconds = Latency.parse(resume_seconds)
+        self.api_latency = Latency.parse(api_latency)
+        self.api_error_rate = api_error_rate
+        self.region_slowdown = region_slowdown or {}
+        self.region_failure_rate = region_failure_rate or {}
+        self.random = random.Random(seed)
+        self.counters: Counter = Counter()
         self.vms: Dict[str, Dict] = {}
+        self.snapshots: Dict[str, Dict] = {}
         self.regions = ["us-east-1", "us-west-2", "eu-west-1", "ap-southeast-1"]
+        region_hosts = region_hosts or {}
+        self.hosts: Dict[str, List[Dict]] = {
+            region: [
+                {
+                    "id": f"{region}-h{i}",
+                    "cpu_total": host_cpu,
+                    "memory_total_mb": host_memory_mb,
+                    "cpu_used": 0,
+                    "memory_used_mb": 0
+                }
+                for i in range(region_hosts.get(region, hosts_per_region))
+            ]
+            for region in self.regions
+        }
+        self.create_limits: Dict[str, TokenBucket] = {
+            region: TokenBucket(create_rate_limit, max(create_rate_limit, 1.0))
+            for region in self.regions
+        } if create_rate_limit > 0 else {}
         self.runtimes = [
             "nodejs-18",
             "nodejs-20", 
@@ -41,9 +198,13 @@ class MockVMControl:
         cpu: int = 1,
         memory_mb: int = 1024,
         region: str = "us-east-1",
-        template: Optional[str] = None
+        template: Optional[str] = None,
+        repo_url: Optional[str] = None,
+        build_command: Optional[str] = None,
+        snapshot_id: Optional[str] = None,
+        host_id: Optional[str] = None
     ) -> Dict:
-        """Create a new microVM"""
+        """Create a new microVM, restoring it from `snapshot_id` when given"""
         vm_id = str(uuid.uuid4())
         
         # Validate inputs
@@ -59,6 +220,31 @@ class MockVMControl:
         if memory_mb < 256 or memory_mb > 16384:
             raise ValueError("Memory must be between 256MB and 16GB")
         
+        if snapshot_id is not None:
+            snapshot = self.snapshots.get(snapshot_id)
+            if not snapshot or snapshot["status"] != "ready":
+                raise SnapshotNotFound(f"Snapshot not found: {snapshot_id}")
+            delay = self.restore_seconds.sample(self.random)
+        else:
+            delay = self.boot_seconds.sample(self.random)
+            if repo_url or build_command:
+                delay += self.build_seconds.sample(self.random)
+        delay *= self.region_slowdown.get(region, 1.0)
+        
+        if region in self.create_limits:
+            retry_after = self.create_limits[region].take()
+            if retry_after:
+                self.counters["rate_limited"] += 1
+                raise RateLimited(retry_after)
+        
+        host = self._place(region, cpu, memory_mb, host_id)
+        if host is None:
+            self.counters["capacity_exhausted"] += 1
+            raise CapacityExhausted(f"No capacity for {cpu} CPU / {memory_mb}MB in {region}")
+        self.counters["created"] += 1
+        host["cpu_used"] += cpu
+        host["memory_used_mb"] += memory_mb
+        
         # Create VM record
         vm = {
             "id": vm_id,
@@ -67,8 +253,12 @@ class MockVMControl:
             "cpu": cpu,
             "memory_mb": memory_mb,
             "region": region,
+            "host_id": host["id"],
             "template": template,
+            "snapshot_id": snapshot_id,
             "status": VMStatus.CREATING,
+            "cpu_usage_percent": 0.0,
+            "memory_usage_mb": 0,
             "dev_url": f"https://{name.lower().replace(' ', '-')}-{vm_id[:8]}.vibecaas.com",
             "created_at": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat(),
@@ -78,11 +268,13 @@ class MockVMControl:
         self.vms[vm_id] = vm
         
         # Simulate async creation process
-        asyncio.create_task(self._simulate_vm_creation(vm_id))
+        asyncio.create_task(self._simulate_vm_creation(vm_id, delay))
         
         return {
             "id": vm_id,
             "status": VMStatus.CREATING,
+            "region": region,
+            "host_id": host["id"],
             "dev_url": vm["dev_url"],
             "message": "VM creation initiated"
         }
@@ -109,6 +301,9 @@ class MockVMControl:
             raise ValueError(f"VM not found: {vm_id}")
         
         vm = self.vms[vm_id]
+        # Suspended and failed VMs already gave their resources back
+        if vm["status"] not in (VMStatus.TERMINATED, VMStatus.SUSPENDED, VMStatus.ERROR):
+            self._free(vm)
         vm["status"] = VMStatus.TERMINATED
         vm["updated_at"] = datetime.utcnow().isoformat()
         
@@ -131,6 +326,15 @@ class MockVMControl:
         if vm["status"] not in [VMStatus.STOPPED, VMStatus.ERROR]:
             raise ValueError(f"Cannot start VM in status: {vm['status']}")
         
+        if vm["status"] == VMStatus.ERROR:
+            # A failed boot freed its host; start it wherever it fits now
+            host = self._place(vm["region"], vm["cpu"], vm["memory_mb"], vm.get("host_id"))
+            if host is None:
+                self.counters["capacity_exhausted"] += 1
+                raise CapacityExhausted(f"No capacity for {vm['cpu']} CPU / {vm['memory_mb']}MB in {vm['region']}")
+            host["cpu_used"] += vm["cpu"]
+            host["memory_used_mb"] += vm["memory_mb"]
+            vm["host_id"] = host["id"]
         vm["status"] = VMStatus.RUNNING
         vm["updated_at"] = datetime.utcnow().isoformat()
         
@@ -159,6 +363,102 @@ class MockVMControl:
             "message": "VM stopped successfully"
         }
     
+    async def suspend_vm(self, vm_id: str) -> Dict:
+        """Suspend a running VM to disk, freeing its host resources"""
+        if vm_id not in self.vms:
+            raise ValueError(f"VM not found: {vm_id}")
+        
+        vm = self.vms[vm_id]
+        
+        if vm["status"] != VMStatus.RUNNING:
+            raise ValueError(f"Cannot suspend VM in status: {vm['status']}")
+        
+        self._free(vm)
+        vm["status"] = VMStatus.SUSPENDED
+        vm["cpu_usage_percent"] = 0.0
+        vm["updated_at"] = datetime.utcnow().isoformat()
+        
+        return {
+            "id": vm_id,
+            "status": VMStatus.SUSPENDED,
+            "message": "VM suspended"
+        }
+    
+    async def resume_vm(self, vm_id: str) -> Dict:
+        """Resume a suspended VM on its host"""
+        if vm_id not in self.vms:
+            raise ValueError(f"VM not found: {vm_id}")
+        
+        vm = self.vms[vm_id]
+        
+        if vm["status"] == VMStatus.RESUMING:
+            return {"id": vm_id, "status": VMStatus.RESUMING, "message": "VM is resuming"}
+        if vm["status"] != VMStatus.SUSPENDED:
+            raise ValueError(f"Cannot resume VM in status: {vm['status']}")
+        
+        # The memory image is restored on the host it was suspended on
+        for host in self.hosts.get(vm["region"], []):
+            if host["id"] == vm.get("host_id"):
+                host["cpu_used"] += vm["cpu"]
+                host["memory_used_mb"] += vm["memory_mb"]
+        vm["status"] = VMStatus.RESUMING
+        vm["updated_at"] = datetime.utcnow().isoformat()
+        asyncio.create_task(self._simulate_resume(vm_id))
+        
+        return {
+            "id": vm_id,
+            "status": VMStatus.RESUMING,
+            "message": "VM resume initiated"
+        }
+    
+    async def list_regions(self) -> List[Dict]:
+        """Host capacity per region"""
+        return [
+            {"id": region, "hosts": [dict(host) for host in self.hosts[region]]}
+            for region in self.regions
+        ]
+    
+    async def create_snapshot(self, vm_id: str, snapshot_key: Optional[str] = None) -> Dict:
+        """Capture a running VM's memory and disk state"""
+        if vm_id not in self.vms:
+            raise ValueError(f"VM not found: {vm_id}")
+        
+        vm = self.vms[vm_id]
+        
+        if vm["status"] != VMStatus.RUNNING:
+            raise ValueError(f"Cannot snapshot VM in status: {vm['status']}")
+        
+        snapshot_id = str(uuid.uuid4())
+        snapshot = {
+            "id": snapshot_id,
+            "vm_id": vm_id,
+            "snapshot_key": snapshot_key,
+            "runtime": vm["runtime"],
+            "region": vm["region"],
+            "status": "creating",
+            "size_mb": vm["memory_mb"] + 512,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        self.snapshots[snapshot_id] = snapshot
+        
+        asyncio.create_task(self._simulate_snapshot(snapshot_id))
+        
+        return dict(snapshot)
+    
+    async def get_snapshot(self, snapshot_id: str) -> Dict:
+        """Get snapshot details"""
+        if snapshot_id not in self.snapshots:
+            raise SnapshotNotFound(f"Snapshot not found: {snapshot_id}")
+        
+        return self.snapshots[snapshot_id]
+    
+    async def delete_snapshot(self, snapshot_id: str) -> Dict:
+        """Delete a snapshot"""
+        if self.snapshots.pop(snapshot_id, None) is None:
+            raise SnapshotNotFound(f"Snapshot not found: {snapshot_id}")
+        
+        return {"id": snapshot_id, "message": "Snapshot deleted"}
+    
     async def get_vm_logs(self, vm_id: str, lines: int = 100) -> Dict:
         """Get VM logs"""
         if vm_id not in self.vms:
@@ -187,38 +487,84 @@ class MockVMControl:
         vm = self.vms[vm_id]
         
         # Generate mock metrics
-        import random
-        
         return {
             "vm_id": vm_id,
             "timestamp": datetime.utcnow().isoformat(),
-            "cpu_usage_percent": random.uniform(10, 80),
-            "memory_usage_mb": random.randint(100, vm["memory_mb"] - 100),
-            "memory_usage_percent": random.uniform(20, 90),
-            "network_in_bytes": random.randint(1000, 100000),
-            "network_out_bytes": random.randint(1000, 100000),
-            "disk_usage_mb": random.randint(500, 2000),
-            "uptime_seconds": random.randint(60, 3600)
+            "cpu_usage_percent": self.random.uniform(10, 80),
+            "memory_usage_mb": self.random.randint(100, vm["memory_mb"] - 100),
+            "memory_usage_percent": self.random.uniform(20, 90),
+            "network_in_bytes": self.random.randint(1000, 100000),
+            "network_out_bytes": self.random.randint(1000, 100000),
+            "disk_usage_mb": self.random.randint(500, 2000),
+            "uptime_seconds": self.random.randint(60, 3600)
         }
     
-    async def _simulate_vm_creation(self, vm_id: str):
+    async def _simulate_vm_creation(self, vm_id: str, delay: float):
         """Simulate the VM creation process"""
-        await asyncio.sleep(2)  # Simulate creation time
+        await asyncio.sleep(delay)  # Simulate boot (and build) or restore time
         
-        if vm_id in self.vms:
+        if vm_id in self.vms and self.vms[vm_id]["status"] == VMStatus.CREATING:
             vm = self.vms[vm_id]
-            vm["status"] = VMStatus.RUNNING
             vm["updated_at"] = datetime.utcnow().isoformat()
             
+            if self.random.random() < self.region_failure_rate.get(vm["region"], 0.0):
+                self.counters["failed"] += 1
+                self._free(vm)
+                vm["status"] = VMStatus.ERROR
+                vm["events"].append({
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "type": "vm_failed",
+                    "message": f"VM {vm['name']} failed to boot",
+                    "status": VMStatus.ERROR
+                })
+                return
+            
+            vm["status"] = VMStatus.RUNNING
+            self.counters["running"] += 1
+            
             # Add creation event
+            restored = vm["snapshot_id"] is not None
             event = {
                 "timestamp": datetime.utcnow().isoformat(),
-                "type": "vm_created",
-                "message": f"VM {vm['name']} created successfully",
+                "type": "vm_restored" if restored else "vm_created",
+                "message": f"VM {vm['name']} {'restored from snapshot' if restored else 'created'} successfully",
                 "status": VMStatus.RUNNING
             }
             vm["events"].append(event)
     
+    def _place(self, region: str, cpu: int, memory_mb: int, host_id: Optional[str]) -> Optional[Dict]:
+        """The requested host if the VM fits there, else the first host it fits on"""
+        def fits(host: Dict) -> bool:
+            return (host["cpu_used"] + cpu <= host["cpu_total"]
+                    and host["memory_used_mb"] + memory_mb <= host["memory_total_mb"])
+        
+        hosts = self.hosts[region]
+        preferred = [host for host in hosts if host["id"] == host_id]
+        return next((host for host in preferred + hosts if fits(host)), None)
+    
+    def _free(self, vm: Dict):
+        """Give a VM's resources back to its host"""
+        for host in self.hosts.get(vm["region"], []):
+            if host["id"] == vm.get("host_id"):
+                host["cpu_used"] -= vm["cpu"]
+                host["memory_used_mb"] -= vm["memory_mb"]
+    
+    async def _simulate_snapshot(self, snapshot_id: str):
+        """Simulate capturing a snapshot"""
+        await asyncio.sleep(self.snapshot_seconds.sample(self.random))
+        
+        if snapshot_id in self.snapshots:
+            self.snapshots[snapshot_id]["status"] = "ready"
+    
+    async def _simulate_resume(self, vm_id: str):
+        """Simulate restoring a suspended VM's memory"""
+        await asyncio.sleep(self.resume_seconds.sample(self.random))
+        
+        vm = self.vms.get(vm_id)
+        if vm and vm["status"] == VMStatus.RESUMING:
+            vm["status"] = VMStatus.RUNNING
+            vm["updated_at"] = datetime.utcnow().isoformat()
+    
     async def _simulate_vm_deletion(self, vm_id: str):
         """Simulate the VM deletion process"""
         await asyncio.sleep(1)  # Simulate deletion time
@@ -239,5 +585,219 @@ class MockVMControl:
             if vm_id in self.vms:
                 del self.vms[vm_id]
 
+# MicroVMRuntime values as sent by MicroVMService -> runtimes the mock knows
+RUNTIME_ALIASES = {
+    "node": "nodejs-20",
+    "python": "python-3.12",
+    "go": "go-1.21",
+    "rust": "rust-1.75",
+    "java": "java-21",
+}
+
+
+def create_app(control: MockVMControl):
+    """Serve `control` over the vm-control HTTP API.
+
+    Run with `python -m app.services.mock_vm_control --port 8090` and point
+    VM_CONTROL_URL at it, or hand the app to httpx.ASGITransport in tests.
+    """
+    from fastapi import FastAPI, HTTPException, Query, Request
+    from fastapi.responses import JSONResponse
+
+    api = FastAPI(title="Mock vm-control")
+
+    @api.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        delay = control.api_latency.sample(control.random)
+        if delay:
+            await asyncio.sleep(delay)
+        if control.api_error_rate and control.random.random() < control.api_error_rate:
+            control.counters["injected_errors"] += 1
+            return JSONResponse({"detail": "Injected failure"}, status_code=503)
+        return await call_next(request)
+
+    @api.post("/api/v1/vms")
+    async def create_vm(config: Dict):
+        runtime = config.get("runtime", "nodejs-20")
+        try:
+            vm = await control.create_vm(
+                name=config.get("name", "vm"),
+                runtime=RUNTIME_ALIASES.get(runtime, runtime),
+                cpu=config.get("cpu_cores", config.get("cpu", 1)),
+                memory_mb=config.get("memory_mb", 1024),
+                region=config.get("region", "us-east-1"),
+                template=config.get("template"),
+                repo_url=config.get("repo_url"),
+                build_command=config.get("build_command"),
+                snapshot_id=config.get("snapshot_id"),
+                host_id=config.get("host_id"),
+            )
+        except SnapshotNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except CapacityExhausted as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except RateLimited as e:
+            raise HTTPException(
+                status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return vm
+
+    @api.get("/api/v1/vms")
+    async def list_vms(region: Optional[str] = Query(None), ids: Optional[str] = Query(None)):
+        if ids:
+            # Look the ids up rather than scanning every VM: reconcilers ask in batches
+            vms = [control.vms[vm_id] for vm_id in ids.split(",") if vm_id in control.vms]
+            if region:
+                vms = [vm for vm in vms if vm["region"] == region]
+        else:
+            vms = await control.list_vms(region)
+        return {"vms": vms}
+
+    @api.get("/api/v1/_stats")
+    async def stats():
+        by_status = Counter(VMStatus(vm["status"]).value for vm in control.vms.values())
+        return {"counters": dict(control.counters), "vms": dict(by_status)}
+
+    @api.get("/api/v1/regions")
+    async def list_regions():
+        return {"regions": await control.list_regions()}
+
+    @api.get("/api/v1/vms/{vm_id}")
+    async def get_vm(vm_id: str):
+        try:
+            return await control.get_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @api.patch("/api/v1/vms/{vm_id}")
+    async def update_vm(vm_id: str, config: Dict):
+        try:
+            vm = await control.get_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        vm["cpu"] = config.get("cpu_cores", vm["cpu"])
+        vm["memory_mb"] = config.get("memory_mb", vm["memory_mb"])
+        vm["updated_at"] = datetime.utcnow().isoformat()
+        return vm
+
+    @api.delete("/api/v1/vms/{vm_id}")
+    async def delete_vm(vm_id: str):
+        try:
+            return await control.delete_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @api.post("/api/v1/vms/{vm_id}/start")
+    async def start_vm(vm_id: str):
+        try:
+            return await control.start_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.post("/api/v1/vms/{vm_id}/stop")
+    async def stop_vm(vm_id: str):
+        try:
+            return await control.stop_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.post("/api/v1/vms/{vm_id}/suspend")
+    async def suspend_vm(vm_id: str):
+        if vm_id not in control.vms:
+            raise HTTPException(status_code=404, detail=f"VM not found: {vm_id}")
+        try:
+            return await control.suspend_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.post("/api/v1/vms/{vm_id}/resume")
+    async def resume_vm(vm_id: str):
+        if vm_id not in control.vms:
+            raise HTTPException(status_code=404, detail=f"VM not found: {vm_id}")
+        try:
+            return await control.resume_vm(vm_id)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.post("/api/v1/vms/{vm_id}/snapshots")
+    async def create_snapshot(vm_id: str, config: Dict):
+        if vm_id not in control.vms:
+            raise HTTPException(status_code=404, detail=f"VM not found: {vm_id}")
+        try:
+            return await control.create_snapshot(vm_id, config.get("snapshot_key"))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @api.get("/api/v1/snapshots/{snapshot_id}")
+    async def get_snapshot(snapshot_id: str):
+        try:
+            return await control.get_snapshot(snapshot_id)
+        except SnapshotNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @api.delete("/api/v1/snapshots/{snapshot_id}")
+    async def delete_snapshot(snapshot_id: str):
+        try:
+            return await control.delete_snapshot(snapshot_id)
+        except SnapshotNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    return api
+
+
+def _parse_map(value: str, cast=float) -> Dict:
+    return {k: cast(v) for k, v in (item.split("=") for item in value.split(",") if item)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--boot", default="2", help="cold boot latency spec, e.g. 2, uniform:1,3, lognormal:2,0.4")
+    parser.add_argument("--build", default="0", help="build latency spec, added when the VM has a repository")
+    parser.add_argument("--restore", default="0.2", help="snapshot restore latency spec")
+    parser.add_argument("--snapshot", default="1", help="snapshot capture latency spec")
+    parser.add_argument("--resume", default="0.3", help="resume-from-suspend latency spec")
+    parser.add_argument("--api-latency", default="0", help="latency spec added to every API request")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="share of API requests failed with 503")
+    parser.add_argument("--create-rate-limit", type=float, default=0.0, help="creates per second per region, 0 = none")
+    parser.add_argument("--hosts-per-region", type=int, default=4)
+    parser.add_argument("--region-hosts", default="", help="hosts per region overrides, e.g. us-east-1=200,eu-west-1=50")
+    parser.add_argument("--host-cpu", type=int, default=32)
+    parser.add_argument("--host-memory-mb", type=int, default=131072)
+    parser.add_argument("--slowdown", default="", help="boot time multiplier per region, e.g. us-east-1=2")
+    parser.add_argument("--failure-rate", default="", help="share of boots that fail per region, e.g. us-west-2=0.05")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    control = MockVMControl(
+        boot_seconds=args.boot,
+        build_seconds=args.build,
+        snapshot_seconds=args.snapshot,
+        restore_seconds=args.restore,
+        resume_seconds=args.resume,
+        hosts_per_region=args.hosts_per_region,
+        host_cpu=args.host_cpu,
+        host_memory_mb=args.host_memory_mb,
+        region_slowdown=_parse_map(args.slowdown),
+        region_failure_rate=_parse_map(args.failure_rate),
+        region_hosts=_parse_map(args.region_hosts, int),
+        create_rate_limit=args.create_rate_limit,
+        api_latency=args.api_latency,
+        api_error_rate=args.api_error_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(control), host=args.host, port=args.port, log_level="warning")
+
+
 # Global instance for testing
 mock_vm_control = MockVMControl()
+app = create_app(mock_vm_control)
+
+
+if __name__ == "__main__":
+    main()
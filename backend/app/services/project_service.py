@@ -1,18 +1,32 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from ..models.project import Project
 from ..models.user import User
 from ..schemas.project import ProjectCreate, ProjectUpdate
 from ..config import settings
+from .app_service import OWNER_LABEL, PROJECT_LABEL, TENANT_LABEL
+from .blob_store import blob_store
+from .build_logs import build_logs
+from .build_queue import BuildJob, build_queue
+from .docker_client import docker_clients
+from .docker_executor import docker_executor
+from .image_builder import DEFAULT_DOCKERIGNORE, image_builder
+from .template_registry import TemplateRegistry
+from .workspace_sweeper import workspace_sweeper
+import asyncio
 import docker
+import json
 import uuid
 import os
 from datetime import datetime
 
+# Dockerfiles carrying this line were written by _create_dockerfile and may be regenerated
+GENERATED_DOCKERFILE_MARKER = "# Generated by VibeCaaS; remove this line to manage the Dockerfile yourself"
+
 class ProjectService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, docker_client: Optional[docker.DockerClient] = None):
         self.db = db
-        self.docker_client = docker.from_env()
+        self.docker_client = docker_client or docker_clients.get()
 
     async def get_user_projects(
         self, 
@@ -61,11 +75,7 @@ class ProjectService:
         self.db.commit()
         self.db.refresh(project)
         
-        # Create project directory
-        project_dir = f"/workspace/projects/{project_id}"
-        os.makedirs(project_dir, exist_ok=True)
-        
-        # Initialize project files
+        # Initialize project files; directories are created off the event loop
         await self._initialize_project_files(project)
         
         return project
@@ -103,64 +113,82 @@ class ProjectService:
             return False
             
         # Stop and remove container if running
+        container_name = f"vibecaas-project-{project.project_id}"
         try:
-            container = self.docker_client.containers.get(f"vibecaas-project-{project.project_id}")
-            container.stop()
-            container.remove()
+            await docker_executor.run("stop", self.docker_client.api.stop, container_name)
+            await docker_executor.run("remove", self.docker_client.api.remove_container, container_name)
         except Exception as e:
             print(f"Error removing container for project {project_id}: {e}")
         
-        # Remove project directory
+        # Move the workspace aside; the sweeper removes it in the background
         project_dir = f"/workspace/projects/{project.project_id}"
-        if os.path.exists(project_dir):
-            import shutil
-            shutil.rmtree(project_dir)
+        await workspace_sweeper.tombstone(project_dir)
+        await asyncio.to_thread(blob_store.release, project.project_id)
         
         # Soft delete project
         project.is_active = False
         self.db.commit()
         return True
 
-    async def deploy_project(self, project_id: int, user_id: int) -> bool:
+    async def queue_deploy(self, project_id: int, user_id: int) -> Optional[BuildJob]:
+        """Queue a deploy for the build workers"""
+        project = await self.get_project(project_id, user_id)
+        if not project:
+            return None
+        user = self.db.query(User).filter(User.id == user_id).first()
+        job = await build_queue.enqueue(
+            project_id=project.id,
+            user_id=user_id,
+            tenant_id=project.tenant_id,
+            tier=user.subscription_tier if user else "starter",
+        )
+        project.status = "queued"
+        self.db.commit()
+        return job
+
+    async def deploy_project(self, project_id: int, user_id: int, build_id: Optional[str] = None) -> bool:
         """Deploy a project"""
         project = await self.get_project(project_id, user_id)
         if not project:
             return False
             
+        build_log = build_logs.open(project.id, build_id or uuid.uuid4().hex)
         try:
             # Update project status
             project.status = "deploying"
-            self.db.commit()
+            await asyncio.to_thread(self.db.commit)
             
             # Create or update container
             container_name = f"vibecaas-project-{project.project_id}"
             
-            try:
-                # Stop existing container
-                existing_container = self.docker_client.containers.get(container_name)
-                existing_container.stop()
-                existing_container.remove()
-            except:
-                pass  # Container doesn't exist
-            
-            # Build and run new container
             project_dir = f"/workspace/projects/{project.project_id}"
             
-            # Create Dockerfile if it doesn't exist
+            # Create Dockerfile if it doesn't exist; keep generated ones up to date
             dockerfile_path = os.path.join(project_dir, "Dockerfile")
-            if not os.path.exists(dockerfile_path):
+            if not os.path.exists(dockerfile_path) or await asyncio.to_thread(self._is_generated, dockerfile_path):
                 await self._create_dockerfile(project, dockerfile_path)
+            dockerignore_path = os.path.join(project_dir, ".dockerignore")
+            if not os.path.exists(dockerignore_path):
+                await asyncio.to_thread(self._write_file, dockerignore_path, "\n".join(DEFAULT_DOCKERIGNORE) + "\n")
             
-            # Build image
+            # Build image before touching the running container; skipped when the context is unchanged
             image_tag = f"vibecaas-project-{project.project_id}:latest"
-            image, build_logs = self.docker_client.images.build(
-                path=project_dir,
-                tag=image_tag,
-                rm=True
+            build = await image_builder.build(
+                self.docker_client, project_dir, image_tag, project=str(project.id), on_line=build_log.append
             )
+            build_log.append(f"Image {image_tag} ready in {build.duration:.1f}s")
+            
+            try:
+                # Stop existing container
+                await docker_executor.run("stop", self.docker_client.api.stop, container_name)
+                await docker_executor.run("remove", self.docker_client.api.remove_container, container_name)
+            except Exception:
+                pass  # Container doesn't exist
             
             # Run container
-            container = self.docker_client.containers.run(
+            container = await docker_executor.run(
+                "run",
+                self.docker_client.containers.run,
                 image=image_tag,
                 name=container_name,
                 ports={3000: None},  # Random port
@@ -168,6 +196,11 @@ class ProjectService:
                     project_dir: {"bind": "/app", "mode": "rw"}
                 },
                 environment=project.container_config.get("environment", {}),
+                labels={
+                    PROJECT_LABEL: str(project.id),
+                    OWNER_LABEL: str(project.owner_id),
+                    TENANT_LABEL: str(project.tenant_id)
+                },
                 detach=True,
                 restart_policy={"Name": "unless-stopped"}
             )
@@ -178,18 +211,28 @@ class ProjectService:
             project.container_image = image_tag
             
             # Get assigned port
-            container.reload()
+            await docker_executor.run("get", container.reload)
             port_info = container.ports.get('3000/tcp')
             if port_info:
                 project.preview_url = f"http://localhost:{port_info[0]['HostPort']}"
             
-            self.db.commit()
+            await asyncio.to_thread(self.db.commit)
+            build_log.append(f"Container {container_name} started")
+            build_logs.close(build_log, "succeeded")
             return True
             
+        except asyncio.CancelledError:
+            build_log.append("Deploy cancelled")
+            build_logs.close(build_log, "cancelled")
+            project.status = "cancelled"
+            await asyncio.to_thread(self.db.commit)
+            raise
         except Exception as e:
             print(f"Error deploying project {project_id}: {e}")
+            build_log.append(f"Deploy failed: {e}")
+            build_logs.close(build_log, "failed")
             project.status = "failed"
-            self.db.commit()
+            await asyncio.to_thread(self.db.commit)
             return False
 
     async def get_project_status(self, project_id: int, user_id: int) -> Optional[dict]:
@@ -224,19 +267,12 @@ class ProjectService:
         """Initialize project files based on framework"""
         project_dir = f"/workspace/projects/{project.project_id}"
         
-        if project.framework == "react":
-            await self._create_react_project(project_dir)
-        elif project.framework == "nextjs":
-            await self._create_nextjs_project(project_dir)
-        elif project.framework == "vue":
-            await self._create_vue_project(project_dir)
-        elif project.framework == "angular":
-            await self._create_angular_project(project_dir)
-        else:
-            await self._create_basic_project(project_dir)
+        # Scaffolds are rendered once per process and shared or extracted from there
+        await asyncio.to_thread(template_registry.materialize, project.framework, project.project_id, project_dir)
 
-    async def _create_react_project(self, project_dir: str):
-        """Create a React project"""
+    @staticmethod
+    def _react_project_files() -> Dict[str, str]:
+        """Template files for a React project"""
         package_json = {
             "name": "vibecaas-project",
             "version": "1.0.0",
@@ -252,16 +288,10 @@ class ProjectService:
             }
         }
         
-        with open(os.path.join(project_dir, "package.json"), "w") as f:
-            import json
-            json.dump(package_json, f, indent=2)
+        files = {"package.json": json.dumps(package_json, indent=2)}
         
-        # Create basic React app
-        src_dir = os.path.join(project_dir, "src")
-        os.makedirs(src_dir, exist_ok=True)
-        
-        with open(os.path.join(src_dir, "App.js"), "w") as f:
-            f.write("""import React from 'react';
+        # Basic React app
+        files["src/App.js"] = """import React from 'react';
 import './App.css';
 
 function App() {
@@ -276,19 +306,20 @@ function App() {
 }
 
 export default App;
-""")
+"""
         
-        with open(os.path.join(src_dir, "index.js"), "w") as f:
-            f.write("""import React from 'react';
+        files["src/index.js"] = """import React from 'react';
 import ReactDOM from 'react-dom/client';
 import App from './App';
 
 const root = ReactDOM.createRoot(document.getElementById('root'));
 root.render(<App />);
-""")
+"""
+        return files
 
-    async def _create_nextjs_project(self, project_dir: str):
-        """Create a Next.js project"""
+    @staticmethod
+    def _nextjs_project_files() -> Dict[str, str]:
+        """Template files for a Next.js project"""
         package_json = {
             "name": "vibecaas-project",
             "version": "1.0.0",
@@ -304,16 +335,9 @@ root.render(<App />);
             }
         }
         
-        with open(os.path.join(project_dir, "package.json"), "w") as f:
-            import json
-            json.dump(package_json, f, indent=2)
+        files = {"package.json": json.dumps(package_json, indent=2)}
         
-        # Create pages directory
-        pages_dir = os.path.join(project_dir, "pages")
-        os.makedirs(pages_dir, exist_ok=True)
-        
-        with open(os.path.join(pages_dir, "index.js"), "w") as f:
-            f.write("""export default function Home() {
+        files["pages/index.js"] = """export default function Home() {
   return (
     <div>
       <h1>Welcome to VibeCaaS</h1>
@@ -321,10 +345,12 @@ root.render(<App />);
     </div>
   );
 }
-""")
+"""
+        return files
 
-    async def _create_vue_project(self, project_dir: str):
-        """Create a Vue project"""
+    @staticmethod
+    def _vue_project_files() -> Dict[str, str]:
+        """Template files for a Vue project"""
         package_json = {
             "name": "vibecaas-project",
             "version": "1.0.0",
@@ -338,12 +364,11 @@ root.render(<App />);
             }
         }
         
-        with open(os.path.join(project_dir, "package.json"), "w") as f:
-            import json
-            json.dump(package_json, f, indent=2)
+        return {"package.json": json.dumps(package_json, indent=2)}
 
-    async def _create_angular_project(self, project_dir: str):
-        """Create an Angular project"""
+    @staticmethod
+    def _angular_project_files() -> Dict[str, str]:
+        """Template files for an Angular project"""
         package_json = {
             "name": "vibecaas-project",
             "version": "1.0.0",
@@ -358,14 +383,12 @@ root.render(<App />);
             }
         }
         
-        with open(os.path.join(project_dir, "package.json"), "w") as f:
-            import json
-            json.dump(package_json, f, indent=2)
+        return {"package.json": json.dumps(package_json, indent=2)}
 
-    async def _create_basic_project(self, project_dir: str):
-        """Create a basic project"""
-        with open(os.path.join(project_dir, "index.html"), "w") as f:
-            f.write("""<!DOCTYPE html>
+    @staticmethod
+    def _basic_project_files() -> Dict[str, str]:
+        """Template files for a basic project"""
+        return {"index.html": """<!DOCTYPE html>
 <html>
 <head>
     <title>VibeCaaS Project</title>
@@ -375,25 +398,66 @@ root.render(<App />);
     <p>Your project is ready!</p>
 </body>
 </html>
-""")
+"""}
+
+    def _is_generated(self, dockerfile_path: str) -> bool:
+        with open(dockerfile_path) as f:
+            return GENERATED_DOCKERFILE_MARKER in f.read(512)
+
+    @staticmethod
+    def _read_file(path: str) -> str:
+        with open(path) as f:
+            return f.read()
+
+    @staticmethod
+    def _write_file(path: str, content: str) -> None:
+        with open(path, "w") as f:
+            f.write(content)
 
     async def _create_dockerfile(self, project: Project, dockerfile_path: str):
         """Create a Dockerfile for the project"""
         if project.framework in ["react", "nextjs", "vue", "angular"]:
-            dockerfile_content = f"""FROM node:18-alpine
+            # Manifests are copied on their own so the install layer is reused
+            # until dependencies change; BuildKit also keeps npm's download cache
+            if image_builder.buildkit:
+                install = "RUN --mount=type=cache,target=/root/.npm npm install --prefer-offline --no-audit"
+            else:
+                install = "RUN npm install --no-audit"
+            dockerfile_content = f"""# syntax=docker/dockerfile:1
+{GENERATED_DOCKERFILE_MARKER}
+FROM node:18-alpine
 WORKDIR /app
 COPY package*.json ./
-RUN npm install
+{install}
 COPY . .
 EXPOSE 3000
 CMD ["npm", "start"]
 """
         else:
-            dockerfile_content = """FROM nginx:alpine
+            dockerfile_content = f"""{GENERATED_DOCKERFILE_MARKER}
+FROM nginx:alpine
 COPY . /usr/share/nginx/html
 EXPOSE 80
 CMD ["nginx", "-g", "daemon off;"]
 """
         
-        with open(dockerfile_path, "w") as f:
-            f.write(dockerfile_content)
\ No newline at end of file
+        if os.path.exists(dockerfile_path):
+            if await asyncio.to_thread(self._read_file, dockerfile_path) == dockerfile_content:
+                return  # Unchanged, keep the mtime so the context hash holds
+        await asyncio.to_thread(self._write_file, dockerfile_path, dockerfile_content)
+
+
+template_registry = TemplateRegistry(
+    root=settings.template_dir,
+    builders={
+        "react": ProjectService._react_project_files,
+        "nextjs": ProjectService._nextjs_project_files,
+        "vue": ProjectService._vue_project_files,
+        "angular": ProjectService._angular_project_files,
+        "basic": ProjectService._basic_project_files,
+    },
+    blobs=blob_store,
+    client=docker_clients.get,
+    default="basic",
+    node_modules=settings.template_node_modules,
+)
@@ -1,16 +1,20 @@
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
+from typing import List, Optional, Dict, Any
 from ..models.user import User
 from ..models.project import Project
 from ..config import settings
+from .app_service import OWNER_LABEL, PROJECT_LABEL, TENANT_LABEL
+from .docker_client import docker_clients
+from .docker_executor import docker_executor
+from .stats_collector import stats_collector
 import docker
 import psutil
 from datetime import datetime, timedelta
 
 class ResourceService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, docker_client: Optional[docker.DockerClient] = None):
         self.db = db
-        self.docker_client = docker.from_env()
+        self.docker_client = docker_client or docker_clients.get()
 
     async def get_user_usage(self, user_id: int) -> Dict[str, Any]:
         """Get resource usage for a user"""
@@ -20,36 +24,43 @@ class ResourceService:
             Project.is_active == True
         ).all()
         
+        usage = await self._aggregate_usage(projects, f"{OWNER_LABEL}={user_id}")
+        return {"user_id": user_id, **usage}
+
+    async def get_tenant_usage(self, tenant_id: int) -> Dict[str, Any]:
+        """Get aggregated resource usage for every project in a tenant"""
+        projects = self.db.query(Project).filter(
+            Project.tenant_id == tenant_id,
+            Project.is_active == True
+        ).all()
+        
+        usage = await self._aggregate_usage(projects, f"{TENANT_LABEL}={tenant_id}")
+        return {"tenant_id": tenant_id, **usage}
+
+    async def _aggregate_usage(self, projects: List[Project], label_filter: str) -> Dict[str, Any]:
+        """Resolve all containers behind `projects` with one labelled list call and join in memory"""
+        containers = await docker_executor.run(
+            "list", self.docker_client.api.containers, all=True, filters={"label": label_filter}
+        )
+        project_ids = {str(project.id) for project in projects}
+        
         total_cpu_usage = 0
         total_memory_usage = 0
         total_storage_usage = 0
         running_containers = 0
         
-        for project in projects:
-            try:
-                container = self.docker_client.containers.get(f"vibecaas-{project.id}")
-                if container.status == "running":
-                    running_containers += 1
-                    
-                    # Get container stats
-                    stats = container.stats(stream=False)
-                    
-                    # Calculate CPU usage
-                    cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
-                    system_delta = stats['cpu_stats']['system_cpu_usage'] - stats['precpu_stats']['system_cpu_usage']
-                    if system_delta > 0:
-                        cpu_percent = (cpu_delta / system_delta) * len(stats['cpu_stats']['cpu_usage']['percpu_usage']) * 100.0
-                        total_cpu_usage += cpu_percent
-                    
-                    # Calculate memory usage
-                    memory_usage = stats['memory_stats']['usage']
-                    total_memory_usage += memory_usage
-                    
-            except Exception as e:
-                print(f"Error getting stats for project {project.id}: {e}")
+        for container in containers:
+            labels = container.get("Labels") or {}
+            if labels.get(PROJECT_LABEL) not in project_ids or container.get("State") != "running":
+                continue
+            running_containers += 1
+            snapshot = stats_collector.get(container["Names"][0].lstrip("/"))
+            if snapshot is None:
+                continue
+            total_cpu_usage += snapshot.cpu_percent
+            total_memory_usage += snapshot.memory_usage_bytes
         
         return {
-            "user_id": user_id,
             "total_projects": len(projects),
             "running_containers": running_containers,
             "cpu_usage_percent": round(total_cpu_usage, 2),
@@ -86,36 +97,21 @@ class ResourceService:
         if not project:
             return None
             
-        try:
-            container = self.docker_client.containers.get(f"vibecaas-{project_id}")
-            stats = container.stats(stream=False)
-            
-            # Calculate CPU usage
-            cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
-            system_delta = stats['cpu_stats']['system_cpu_usage'] - stats['precpu_stats']['system_cpu_usage']
-            cpu_percent = 0
-            if system_delta > 0:
-                cpu_percent = (cpu_delta / system_delta) * len(stats['cpu_stats']['cpu_usage']['percpu_usage']) * 100.0
-            
-            # Calculate memory usage
-            memory_usage = stats['memory_stats']['usage']
-            memory_limit = stats['memory_stats']['limit']
-            memory_percent = (memory_usage / memory_limit) * 100.0 if memory_limit > 0 else 0
-            
-            return {
-                "project_id": project_id,
-                "container_id": container.id,
-                "status": container.status,
-                "cpu_usage_percent": round(cpu_percent, 2),
-                "memory_usage_bytes": memory_usage,
-                "memory_limit_bytes": memory_limit,
-                "memory_usage_percent": round(memory_percent, 2),
-                "uptime_seconds": stats.get('uptime', 0),
-                "last_updated": datetime.utcnow()
-            }
-        except Exception as e:
-            print(f"Error getting resources for project {project_id}: {e}")
+        snapshot = stats_collector.get(f"vibecaas-{project_id}")
+        if snapshot is None:
             return None
+            
+        return {
+            "project_id": project_id,
+            "container_id": snapshot.container_id,
+            "status": snapshot.status,
+            "cpu_usage_percent": snapshot.cpu_percent,
+            "memory_usage_bytes": snapshot.memory_usage_bytes,
+            "memory_limit_bytes": snapshot.memory_limit_bytes,
+            "memory_usage_percent": snapshot.memory_percent,
+            "uptime_seconds": snapshot.uptime_seconds,
+            "last_updated": snapshot.timestamp
+        }
 
     async def scale_project_resources(
         self, 
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import docker
+from prometheus_client import Counter, Gauge
+
+from ..config import settings
+from .docker_client import STREAMS_CLIENT, docker_clients
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_NAME_PREFIX = "vibecaas-"
+
+STATS_SUBSCRIPTIONS = Gauge("vibecaas_stats_subscriptions", "Open docker stats streams")
+STATS_SAMPLES = Counter("vibecaas_stats_samples_total", "Stats samples received from docker")
+STATS_STREAM_ERRORS = Counter("vibecaas_stats_stream_errors_total", "Stats streams that ended with an error")
+
+
+@dataclass(frozen=True)
+class ContainerStatsSnapshot:
+    container_id: str
+    name: str
+    status: str
+    cpu_percent: float
+    memory_usage_bytes: int
+    memory_limit_bytes: int
+    memory_percent: float
+    started_at: Optional[datetime]
+    sampled_at: float  # time.monotonic() of the sample
+    timestamp: datetime
+
+    @property
+    def uptime_seconds(self) -> int:
+        if not self.started_at:
+            return 0
+        return max(int((datetime.now(self.started_at.tzinfo) - self.started_at).total_seconds()), 0)
+
+
+def compute_cpu_percent(stats: Dict[str, Any], prev_total: int, prev_system: int) -> float:
+    """CPU% between a stats sample and the previous totals, docker CLI style"""
+    cpu_stats = stats.get("cpu_stats", {})
+    cpu_usage = cpu_stats.get("cpu_usage", {})
+    cpu_delta = cpu_usage.get("total_usage", 0) - prev_total
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - prev_system
+    if system_delta <= 0 or cpu_delta < 0:
+        return 0.0
+    online_cpus = cpu_stats.get("online_cpus") or len(cpu_usage.get("percpu_usage") or []) or 1
+    return (cpu_delta / system_delta) * online_cpus * 100.0
+
+
+def _parse_started_at(attrs: Dict[str, Any]) -> Optional[datetime]:
+    raw = attrs.get("State", {}).get("StartedAt")
+    if not raw or raw.startswith("0001-"):
+        return None
+    # Docker reports nanoseconds; datetime only takes microseconds
+    raw = raw.replace("Z", "+00:00")
+    if "." in raw:
+        head, tail = raw.split(".", 1)
+        frac, _, tz = tail.partition("+")
+        raw = f"{head}.{frac[:6]}+{tz}" if tz else f"{head}.{frac[:6]}"
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+class StatsCollector:
+    """Keeps one streaming stats subscription per running vibecaas container.
+
+    Docker pushes a sample roughly every second on each stream; each sample is
+    turned into a snapshot using the previous sample as the CPU baseline, so
+    readers get current usage from an in-memory dict without touching docker.
+    Streams are blocking generators, so each runs on its own daemon thread.
+    """
+
+    def __init__(self, discovery_interval: float, max_staleness: float) -> None:
+        self.discovery_interval = discovery_interval
+        self.max_staleness = max_staleness
+        self.client: docker.DockerClient | None = None
+        self._snapshots: Dict[str, ContainerStatsSnapshot] = {}
+        self._streams: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def get(self, name: str, max_age: float | None = None) -> Optional[ContainerStatsSnapshot]:
+        """Latest snapshot for a container name, or None if missing or stale"""
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            return None
+        max_age = self.max_staleness if max_age is None else max_age
+        if time.monotonic() - snapshot.sampled_at > max_age:
+            return None
+        return snapshot
+
+    def snapshots(self, max_age: float | None = None) -> List[ContainerStatsSnapshot]:
+        """All snapshots that are fresh enough to report"""
+        max_age = self.max_staleness if max_age is None else max_age
+        now = time.monotonic()
+        return [s for s in list(self._snapshots.values()) if now - s.sampled_at <= max_age]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._discovery_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            for stop_event in self._streams.values():
+                stop_event.set()
+
+    async def _discovery_loop(self) -> None:
+        while True:
+            try:
+                await self._discover()
+            except Exception as e:
+                logger.warning(f"Stats discovery failed: {e}")
+            await asyncio.sleep(self.discovery_interval)
+
+    async def _discover(self) -> None:
+        # Streams hold a connection each, so they use their own client
+        self.client = await docker_clients.aget(STREAMS_CLIENT)
+        # Sparse listing is a single API call; containers.list() would inspect each one
+        containers = await docker_executor.run(
+            "list", self.client.api.containers, filters={"name": CONTAINER_NAME_PREFIX, "status": "running"}
+        )
+        running = {}
+        for container in containers:
+            name = container["Names"][0].lstrip("/")
+            if name.startswith(CONTAINER_NAME_PREFIX):
+                running[name] = container["Id"]
+        with self._lock:
+            for name, stop_event in list(self._streams.items()):
+                if name not in running:
+                    stop_event.set()
+            for name, container_id in running.items():
+                if name in self._streams:
+                    continue
+                stop_event = threading.Event()
+                self._streams[name] = stop_event
+                threading.Thread(
+                    target=self._stream,
+                    args=(container_id, name, stop_event),
+                    name=f"stats-{name}",
+                    daemon=True,
+                ).start()
+
+    def _stream(self, container_id: str, name: str, stop_event: threading.Event) -> None:
+        STATS_SUBSCRIPTIONS.inc()
+        prev_total = prev_system = None
+        stream = None
+        try:
+            started_at = _parse_started_at(self.client.api.inspect_container(container_id))
+            stream = self.client.api.stats(container_id, stream=True, decode=True)
+            for stats in stream:
+                if stop_event.is_set():
+                    break
+                cpu_usage = stats.get("cpu_stats", {}).get("cpu_usage", {})
+                total = cpu_usage.get("total_usage", 0)
+                system = stats.get("cpu_stats", {}).get("system_cpu_usage", 0)
+                cpu_percent = 0.0
+                if prev_total is not None:
+                    cpu_percent = compute_cpu_percent(stats, prev_total, prev_system)
+                prev_total, prev_system = total, system
+
+                memory = stats.get("memory_stats", {})
+                mem_usage = memory.get("usage", 0)
+                mem_limit = memory.get("limit", 0)
+                self._snapshots[name] = ContainerStatsSnapshot(
+                    container_id=container_id,
+                    name=name,
+                    status="running",
+                    cpu_percent=round(cpu_percent, 2),
+                    memory_usage_bytes=mem_usage,
+                    memory_limit_bytes=mem_limit,
+                    memory_percent=round((mem_usage / mem_limit) * 100.0, 2) if mem_limit else 0.0,
+                    started_at=started_at,
+                    sampled_at=time.monotonic(),
+                    timestamp=datetime.utcnow(),
+                )
+                STATS_SAMPLES.inc()
+        except Exception as e:
+            STATS_STREAM_ERRORS.inc()
+            logger.info(f"Stats stream for {name} ended: {e}")
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            STATS_SUBSCRIPTIONS.dec()
+            with self._lock:
+                if self._streams.get(name) is stop_event:
+                    del self._streams[name]
+                    self._snapshots.pop(name, None)
+
+
+stats_collector = StatsCollector(
+    discovery_interval=settings.stats_discovery_interval,
+    max_staleness=settings.stats_max_staleness_seconds,
+)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import docker
+from prometheus_client import Counter, Histogram
+
+from ..config import settings
+from .blob_store import BlobStore
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_MATERIALIZE_SECONDS = Histogram(
+    "vibecaas_template_materialize_seconds",
+    "Time to lay a framework scaffold into a new project workspace",
+    ["framework"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+TEMPLATE_LAYER_BUILDS = Counter(
+    "vibecaas_template_layer_builds_total", "node_modules layer builds by outcome", ["framework", "result"]
+)
+
+NODE_IMAGE = "node:18-alpine"
+
+# Below this many files, writing them beats starting tar
+EXTRACT_MIN_FILES = 64
+
+TAR = shutil.which("tar")
+
+# Extract with the "data" filter where this Python has it (3.11.4+)
+_EXTRACT_FILTER = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+
+@dataclass
+class Template:
+    framework: str
+    digest: str
+    files: Dict[str, bytes]
+    archive: str
+    layer: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for data in self.files.values())
+
+
+def _extract(archive: str, target_dir: str) -> None:
+    """Unpack `archive` into `target_dir` in one sequential pass"""
+    if TAR:
+        # An order of magnitude faster than tarfile on trees like node_modules
+        subprocess.run(
+            [TAR, "-xf", archive, "-C", target_dir, "--no-same-owner"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        return
+    with tarfile.open(archive, "r|") as tar:
+        tar.extractall(target_dir, **_EXTRACT_FILTER)
+
+
+def _write_files(target_dir: str, files: Dict[str, bytes]) -> None:
+    for directory in sorted({os.path.dirname(rel_path) for rel_path in files}):
+        os.makedirs(os.path.join(target_dir, directory), exist_ok=True)
+    for rel_path, data in files.items():
+        with open(os.path.join(target_dir, rel_path), "wb") as f:
+            f.write(data)
+
+
+def _write_archive(path: str, files: Dict[str, bytes]) -> None:
+    mtime = time.time()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with tarfile.open(tmp, "w") as tar:
+        for rel_path, data in sorted(files.items()):
+            info = tarfile.TarInfo(rel_path)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = mtime
+            tar.addfile(info, io.BytesIO(data))
+    os.replace(tmp, path)
+
+
+class TemplateRegistry:
+    """Framework scaffolds rendered once and reused for every new project.
+
+    Each builder returns {relative path: text}; it runs once per process and
+    the encoded files are kept along with an uncompressed tarball under
+    `root`, named by the scaffold's digest. New workspaces get the files
+    through the blob store when it can share them. Otherwise large scaffolds
+    are extracted from the tarball in one pass and small ones are written
+    straight from memory, which is cheaper than starting tar.
+
+    Workspaces are mounted over /app when a project runs, hiding the
+    node_modules installed in the image. With `node_modules` enabled, an
+    `npm install` of each scaffold's package.json is run once in a throwaway
+    container and kept as a second tarball, extracted after the scaffold.
+    Layers are keyed by the package.json digest, so scaffolds with the same
+    dependencies share one.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        builders: Dict[str, Callable[[], Dict[str, str]]],
+        blobs: BlobStore,
+        client: Callable[[], docker.DockerClient],
+        default: str,
+        node_modules: bool = False,
+    ) -> None:
+        self.root = root
+        self.builders = builders
+        self.blobs = blobs
+        self._client = client
+        self.default = default
+        self.node_modules = node_modules
+        self._templates: Dict[str, Template] = {}
+        self._layers: Dict[str, asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+
+    def get(self, framework: str) -> Template:
+        """Rendered template for `framework`, rendering it on first use"""
+        if framework not in self.builders:
+            framework = self.default
+        template = self._templates.get(framework)
+        if template is None:
+            template = self._render(framework)
+            self._templates[framework] = template
+        return template
+
+    def materialize(self, framework: str, owner: str, target_dir: str) -> Template:
+        """Lay the scaffold (and node_modules layer, if built) into `target_dir`"""
+        template = self.get(framework)
+        started = time.perf_counter()
+        os.makedirs(target_dir, exist_ok=True)
+        if self.blobs.shares:
+            self.blobs.materialize(owner, target_dir, template.files)
+        elif len(template.files) >= EXTRACT_MIN_FILES:
+            _extract(template.archive, target_dir)
+        else:
+            _write_files(target_dir, template.files)
+        if template.layer and os.path.exists(template.layer):
+            _extract(template.layer, target_dir)
+        TEMPLATE_MATERIALIZE_SECONDS.labels(template.framework).observe(time.perf_counter() - started)
+        return template
+
+    async def prepare(self) -> None:
+        """Render every scaffold and, if enabled, build the missing node_modules layers"""
+        # Settle how workspaces are written before the first project is created
+        await asyncio.to_thread(lambda: self.blobs.shares)
+        for framework in self.builders:
+            template = await asyncio.to_thread(self.get, framework)
+            if self.node_modules and "package.json" in template.files:
+                try:
+                    template.layer = await self._ensure_layer(template)
+                except Exception as e:
+                    TEMPLATE_LAYER_BUILDS.labels(framework, "error").inc()
+                    logger.warning(f"node_modules layer for {framework} failed: {e}")
+
+    def status(self) -> Dict[str, Dict[str, object]]:
+        return {
+            framework: {
+                "digest": template.digest,
+                "files": len(template.files),
+                "bytes": template.size,
+                "archive": template.archive,
+                "layer": template.layer,
+            }
+            for framework, template in self._templates.items()
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _render(self, framework: str) -> Template:
+        files = {path: text.encode("utf-8") for path, text in self.builders[framework]().items()}
+        digest = hashlib.sha256()
+        for rel_path, data in sorted(files.items()):
+            digest.update(rel_path.encode() + b"\0" + hashlib.sha256(data).digest())
+        value = digest.hexdigest()
+        os.makedirs(self.root, exist_ok=True)
+        archive = os.path.join(self.root, f"{framework}-{value[:16]}.tar")
+        if not os.path.exists(archive):
+            _write_archive(archive, files)
+        layer = None
+        if "package.json" in files:
+            layer = self._layer_path(files["package.json"])
+            if not os.path.exists(layer):
+                layer = None
+        return Template(framework, value, files, archive, layer)
+
+    def _layer_path(self, package_json: bytes) -> str:
+        return os.path.join(self.root, f"node_modules-{hashlib.sha256(package_json).hexdigest()[:16]}.tar")
+
+    async def _ensure_layer(self, template: Template) -> str:
+        path = self._layer_path(template.files["package.json"])
+        if os.path.exists(path):
+            return path
+        # Scaffolds with the same package.json wait on one install
+        task = self._layers.get(path)
+        if task is None:
+            task = asyncio.create_task(self._build_layer(template, path))
+            self._layers[path] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._layers.pop(path, None)
+
+    async def _build_layer(self, template: Template, path: str) -> str:
+        # The install directory is bind-mounted, so it must live where the daemon can see it
+        work_dir = tempfile.mkdtemp(prefix="layer-", dir=self.root)
+        started = time.perf_counter()
+        try:
+            with open(os.path.join(work_dir, "package.json"), "wb") as f:
+                f.write(template.files["package.json"])
+            client = self._client()
+
+            def install() -> None:
+                output = client.containers.run(
+                    NODE_IMAGE,
+                    ["npm", "install", "--no-audit", "--no-fund", "--ignore-scripts"],
+                    working_dir="/app",
+                    volumes={work_dir: {"bind": "/app", "mode": "rw"}},
+                    remove=True,
+                    stdout=True,
+                    stderr=True,
+                )
+                logger.debug(output.decode("utf-8", errors="replace")[-2000:])
+
+            await docker_executor.run("build", install, timeout=settings.build_timeout)
+
+            def archive() -> None:
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with tarfile.open(tmp, "w") as tar:
+                    tar.add(os.path.join(work_dir, "node_modules"), arcname="node_modules")
+                    lock = os.path.join(work_dir, "package-lock.json")
+                    if os.path.exists(lock):
+                        tar.add(lock, arcname="package-lock.json")
+                os.replace(tmp, path)
+
+            await asyncio.to_thread(archive)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
+        TEMPLATE_LAYER_BUILDS.labels(template.framework, "ok").inc()
+        logger.info(f"Built node_modules layer for {template.framework} in {time.perf_counter() - started:.1f}s")
+        return path
+
+    async def _run(self) -> None:
+        try:
+            await self.prepare()
+        except Exception as e:
+            logger.warning(f"Template preparation failed: {e}")
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+VM_CONTROL_REQUEST_SECONDS = Histogram(
+    "vibecaas_vm_control_request_seconds",
+    "vm-control request latency per endpoint, including retries",
+    ["endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+VM_CONTROL_REQUESTS = Counter(
+    "vibecaas_vm_control_requests_total", "vm-control requests per endpoint and outcome", ["endpoint", "result"]
+)
+VM_CONTROL_RETRIES = Counter("vibecaas_vm_control_retries_total", "vm-control request retries", ["endpoint"])
+VM_CONTROL_CIRCUIT_OPEN = Gauge("vibecaas_vm_control_circuit_open", "1 while the vm-control circuit breaker is open")
+
+# Worth retrying: the server may be restarting or shedding load
+RETRY_STATUS = {429, 502, 503, 504}
+# Safe to resend even if the first attempt reached the server
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE", "HEAD", "OPTIONS"}
+
+
+class VMControlUnavailable(Exception):
+    """vm-control is failing and the circuit breaker is not letting requests through"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets one trial request
+    through each `reset_timeout` after that; success closes it again."""
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # One trial at a time; a trial that never reports back (cancelled) expires
+        now = time.monotonic()
+        if state == "half-open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+        VM_CONTROL_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(f"vm-control circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+            self._trial_at = None
+            VM_CONTROL_CIRCUIT_OPEN.set(1)
+
+
+class VMControlClient:
+    """Shared client for the vm-control API.
+
+    One httpx client per process keeps connections alive between calls (HTTP/2
+    when the h2 package is installed, so concurrent calls share a connection).
+    Failed connections, timeouts and 429/502/503/504 are retried with full
+    jitter exponential backoff; POSTs are only retried when the request never
+    reached the server or was turned away with a 429. Consecutive failures open a circuit breaker so callers
+    fail fast with VMControlUnavailable instead of queueing on a dead service.
+    Pass `transport` (e.g. httpx.ASGITransport over the mock vm-control app)
+    to run against something other than the network.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        http2: bool = True,
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        retries: int = 3,
+        backoff: float = 0.2,
+        backoff_max: float = 5.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.http2 = http2
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            http2 = self.http2 and self.transport is None
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("h2 is not installed; vm-control client falls back to HTTP/1.1 keep-alive")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=http2,
+                transport=self.transport,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def create_vm(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("create_vm", "POST", "/api/v1/vms", json=config, timeout=30.0)
+
+    async def get_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("get_vm", "GET", f"/api/v1/vms/{vm_control_id}")
+
+    async def list_vms(self, region: Optional[str] = None, ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        params = {}
+        if region:
+            params["region"] = region
+        if ids:
+            params["ids"] = ",".join(ids)
+        body = await self.request("list_vms", "GET", "/api/v1/vms", params=params)
+        return body.get("vms", []) if isinstance(body, dict) else body
+
+    async def update_vm(self, vm_control_id: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("update_vm", "PATCH", f"/api/v1/vms/{vm_control_id}", json=config, timeout=30.0)
+
+    async def delete_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("delete_vm", "DELETE", f"/api/v1/vms/{vm_control_id}", timeout=30.0)
+
+    async def start_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("start_vm", "POST", f"/api/v1/vms/{vm_control_id}/start", timeout=30.0)
+
+    async def stop_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("stop_vm", "POST", f"/api/v1/vms/{vm_control_id}/stop", timeout=30.0)
+
+    async def suspend_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("suspend_vm", "POST", f"/api/v1/vms/{vm_control_id}/suspend", timeout=30.0)
+
+    async def resume_vm(self, vm_control_id: str) -> Dict[str, Any]:
+        return await self.request("resume_vm", "POST", f"/api/v1/vms/{vm_control_id}/resume", timeout=30.0)
+
+    async def list_regions(self) -> List[Dict[str, Any]]:
+        """Regions with their hosts' CPU and memory totals and allocations"""
+        body = await self.request("list_regions", "GET", "/api/v1/regions")
+        return body.get("regions", []) if isinstance(body, dict) else body
+
+    async def create_snapshot(self, vm_control_id: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request(
+            "create_snapshot", "POST", f"/api/v1/vms/{vm_control_id}/snapshots", json=config, timeout=30.0
+        )
+
+    async def get_snapshot(self, snapshot_id: str) -> Dict[str, Any]:
+        return await self.request("get_snapshot", "GET", f"/api/v1/snapshots/{snapshot_id}")
+
+    async def delete_snapshot(self, snapshot_id: str) -> Dict[str, Any]:
+        return await self.request("delete_snapshot", "DELETE", f"/api/v1/snapshots/{snapshot_id}", timeout=30.0)
+
+    async def request(self, endpoint: str, method: str, path: str, **kwargs: Any) -> Any:
+        """Send a request with retries and circuit breaking; returns the decoded JSON body"""
+        if not self.breaker.allow():
+            VM_CONTROL_REQUESTS.labels(endpoint, "circuit_open").inc()
+            raise VMControlUnavailable(f"vm-control circuit is {self.breaker.state}")
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                    if response.status_code in RETRY_STATUS and attempt < self.retries:
+                        raise httpx.HTTPStatusError(f"{response.status_code}", request=response.request, response=response)
+                    response.raise_for_status()
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if not self._retryable(e, method) or attempt >= self.retries:
+                        raise
+                    attempt += 1
+                    VM_CONTROL_RETRIES.labels(endpoint).inc()
+                    await asyncio.sleep(self._delay(attempt, e))
+                    continue
+                break
+        except httpx.HTTPStatusError as e:
+            # A 4xx is the caller's problem, not a sign vm-control is down
+            if e.response.status_code >= 500 or e.response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            VM_CONTROL_REQUESTS.labels(endpoint, str(e.response.status_code)).inc()
+            raise
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            VM_CONTROL_REQUESTS.labels(endpoint, "error").inc()
+            raise
+        finally:
+            VM_CONTROL_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        VM_CONTROL_REQUESTS.labels(endpoint, "ok").inc()
+        return response.json() if response.content else {}
+
+    def _retryable(self, error: Exception, method: str) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            # A 429 is rejected before anything is applied, so even a POST can be resent
+            return status in RETRY_STATUS and (method in IDEMPOTENT_METHODS or status == 429)
+        if method in IDEMPOTENT_METHODS:
+            return True
+        # The request was never sent, so even a POST cannot have been applied
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+
+
+vm_control = VMControlClient(
+    base_url=settings.vm_control_url,
+    token=settings.vm_control_token,
+    http2=settings.vm_control_http2,
+    timeout=settings.vm_control_timeout,
+    max_connections=settings.vm_control_max_connections,
+    max_keepalive=settings.vm_control_max_keepalive,
+    retries=settings.vm_control_retries,
+    backoff=settings.vm_control_backoff,
+    breaker_threshold=settings.vm_control_breaker_threshold,
+    breaker_reset=settings.vm_control_breaker_reset,
+)
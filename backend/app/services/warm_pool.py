@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+import docker
+from prometheus_client import Counter, Gauge, Histogram
+
+from .docker_executor import docker_executor
+
+logger = logging.getLogger(__name__)
+
+WARM_POOL_LABEL = "vibecaas.warm-pool"
+WARM_CONTAINER_PREFIX = "vibecaas-pool-"
+
+WARM_POOL_IDLE = Gauge("vibecaas_warm_pool_idle", "Paused containers ready to be claimed", ["template"])
+WARM_POOL_TARGET = Gauge("vibecaas_warm_pool_target", "Configured idle containers per template", ["template"])
+WARM_POOL_CLAIMS = Counter("vibecaas_warm_pool_claims_total", "Container claims by outcome", ["template", "result"])
+WARM_POOL_CREATED = Counter("vibecaas_warm_pool_created_total", "Containers created to replenish the pool", ["template"])
+WARM_POOL_FAILURES = Counter("vibecaas_warm_pool_failures_total", "Failed pool creates or claims", ["template", "stage"])
+TIME_TO_RUNNING = Histogram(
+    "vibecaas_container_time_to_running_seconds",
+    "Time from create request to a running app container",
+    ["source"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+
+
+@dataclass(frozen=True)
+class WarmTemplate:
+    image: str
+    gpu: bool = False
+
+
+class WarmPool:
+    """Keeps paused, already started containers per base image.
+
+    A claim renames an idle container to the app's name, applies its resource
+    limits with `docker update` and unpauses it, which skips the image pull and
+    container create of a cold start. Anything that cannot be set after
+    creation (image, env, ports, devices) is part of the template, so a claim
+    only matches a template with the same image and GPU flag.
+
+    Idle containers are tracked by their pool name, and the rename addresses
+    the container by that name: replicas sharing a Docker daemon may queue
+    the same container, but only the first rename finds it, so the daemon
+    decides who gets it.
+    """
+
+    def __init__(
+        self,
+        client: Callable[[], docker.DockerClient],
+        templates: Dict[str, WarmTemplate],
+        targets: Dict[str, int],
+        create_kwargs: Callable[[WarmTemplate], Dict[str, Any]],
+        replenish_interval: float,
+    ) -> None:
+        self._client = client
+        self.templates = templates
+        self.targets = {key: targets.get(key, 0) for key in templates}
+        self.create_kwargs = create_kwargs
+        self.replenish_interval = replenish_interval
+        self._idle: Dict[str, Deque[str]] = {key: deque() for key in templates}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        for key, target in self.targets.items():
+            WARM_POOL_TARGET.labels(key).set(target)
+
+    def template_for(self, image: str, gpu: bool) -> Optional[str]:
+        for key, template in self.templates.items():
+            if template.image == image and template.gpu == gpu:
+                return key
+        return None
+
+    async def claim(self, image: str, gpu: bool, name: str, mem_limit: str, cpu_quota: int) -> Optional[Any]:
+        """Hand out a warm container configured for an app, or None on a miss"""
+        key = self.template_for(image, gpu)
+        if key is None:
+            return None
+        idle = self._idle[key]
+        while idle:
+            pool_name = idle.popleft()
+            WARM_POOL_IDLE.labels(key).set(len(idle))
+            self._wakeup.set()
+            client = self._client()
+            try:
+                await docker_executor.run("rename", client.api.rename, pool_name, name)
+            except docker.errors.NotFound:
+                # Claimed by another replica (or gone); it is theirs to deal with
+                WARM_POOL_CLAIMS.labels(key, "lost").inc()
+                continue
+            except Exception as e:
+                # E.g. the app's name is taken; the container is still idle and stays in the pool
+                logger.warning(f"Could not claim warm container {pool_name} ({key}) as {name}: {e}")
+                idle.appendleft(pool_name)
+                WARM_POOL_IDLE.labels(key).set(len(idle))
+                WARM_POOL_FAILURES.labels(key, "claim").inc()
+                return None
+            try:
+                container = await docker_executor.run("get", client.containers.get, name)
+                if container.status != "paused":
+                    raise RuntimeError(f"warm container is {container.status}")
+                await docker_executor.run("update", container.update, mem_limit=mem_limit, cpu_quota=cpu_quota)
+                await docker_executor.run("unpause", container.unpause)
+            except Exception as e:
+                logger.warning(f"Discarding warm container {pool_name} ({key}): {e}")
+                WARM_POOL_FAILURES.labels(key, "claim").inc()
+                # Ours since the rename; removing it also frees the app's name for a cold start
+                await self._remove(name, claimed=True)
+                continue
+            WARM_POOL_CLAIMS.labels(key, "hit").inc()
+            return container
+        WARM_POOL_CLAIMS.labels(key, "miss").inc()
+        return None
+
+    async def replenish(self) -> None:
+        """Create containers until every template is at its target"""
+        for key, template in self.templates.items():
+            while len(self._idle[key]) < self.targets[key]:
+                try:
+                    pool_name = await self._create(key, template)
+                except Exception as e:
+                    logger.warning(f"Failed to warm a {key} container: {e}")
+                    WARM_POOL_FAILURES.labels(key, "create").inc()
+                    break
+                self._idle[key].append(pool_name)
+                WARM_POOL_IDLE.labels(key).set(len(self._idle[key]))
+
+    async def adopt(self) -> None:
+        """Reuse paused pool containers left by a previous process; remove the rest"""
+        client = self._client()
+        containers = await docker_executor.run(
+            "list", client.api.containers, all=True, filters={"label": WARM_POOL_LABEL}
+        )
+        for container in containers:
+            pool_name = container["Names"][0].lstrip("/")
+            # Claimed containers keep the label but were renamed to their app
+            if not pool_name.startswith(WARM_CONTAINER_PREFIX):
+                continue
+            key = container["Labels"].get(WARM_POOL_LABEL)
+            idle = self._idle.get(key)
+            if idle is not None and container["State"] == "paused" and len(idle) < self.targets[key]:
+                idle.append(pool_name)
+            else:
+                await self._remove(pool_name)
+        for key, idle in self._idle.items():
+            WARM_POOL_IDLE.labels(key).set(len(idle))
+
+    def start(self) -> None:
+        if self._task is None and any(self.targets.values()):
+            self._task = asyncio.create_task(self._replenish_loop())
+
+    async def stop(self) -> None:
+        # Idle containers stay paused on the host and are adopted on next start
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def idle_counts(self) -> Dict[str, int]:
+        return {key: len(idle) for key, idle in self._idle.items()}
+
+    async def _create(self, key: str, template: WarmTemplate) -> str:
+        """Start and pause a pool container; returns its pool name"""
+        client = self._client()
+        kwargs = self.create_kwargs(template)
+        kwargs["name"] = f"{WARM_CONTAINER_PREFIX}{key}-{uuid.uuid4().hex[:8]}"
+        kwargs["labels"] = {**kwargs.get("labels", {}), WARM_POOL_LABEL: key}
+        # Pulls the image on first use; that cost is paid here instead of by an app create
+        container = await docker_executor.run("warm", client.containers.run, **kwargs)
+        try:
+            await docker_executor.run("pause", container.pause)
+        except Exception:
+            await self._remove(container.id)
+            raise
+        WARM_POOL_CREATED.labels(key).inc()
+        return kwargs["name"]
+
+    async def _remove(self, container: str, claimed: bool = False) -> None:
+        try:
+            client = self._client()
+            if not claimed:
+                attrs = await docker_executor.run("get", client.api.inspect_container, container)
+                # Another replica may have claimed (renamed) it in the meantime
+                if not attrs["Name"].lstrip("/").startswith(WARM_CONTAINER_PREFIX):
+                    return
+            await docker_executor.run("remove", client.api.remove_container, container, force=True)
+        except Exception:
+            pass
+
+    async def _replenish_loop(self) -> None:
+        try:
+            await self.adopt()
+        except Exception as e:
+            logger.warning(f"Warm pool adoption failed: {e}")
+        while True:
+            self._wakeup.clear()
+            await self.replenish()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.replenish_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import logging
+import os
+import shutil
+import time
+from typing import List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_TOMBSTONES = Gauge("vibecaas_workspace_tombstones", "Deleted workspaces waiting to be swept")
+WORKSPACE_SWEPT = Counter("vibecaas_workspace_swept_total", "Deleted workspaces removed from disk")
+WORKSPACE_SWEEP_SECONDS = Histogram(
+    "vibecaas_workspace_sweep_seconds",
+    "Time to remove one deleted workspace from disk",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+
+class WorkspaceSweeper:
+    """Deletes workspaces in the background so API latency does not depend on their size.
+
+    `tombstone` renames the workspace into the trash directory, which is one
+    metadata operation however large the tree is, and wakes the sweeper. The
+    sweeper removes tombstones one at a time on a worker thread, so a large
+    node_modules costs disk bandwidth rather than event loop time. Tombstones
+    left by a restart are swept on the next start. The trash directory must be
+    on the same filesystem as the workspaces; if it is not, the rename fails
+    and the tree is removed on a worker thread instead.
+    """
+
+    def __init__(self, trash_dir: str, interval: float) -> None:
+        self.trash_dir = trash_dir
+        self.interval = interval
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def tombstone(self, path: str) -> Optional[str]:
+        """Move `path` out of the way for deletion; returns the tombstone, or None if it did not exist"""
+        target = await asyncio.to_thread(self._tombstone, path)
+        if target is not None:
+            WORKSPACE_TOMBSTONES.inc()
+            self._wake.set()
+        return target
+
+    async def sweep(self) -> int:
+        """Remove the tombstones present now; returns how many were removed"""
+        names = await asyncio.to_thread(self._listdir)
+        swept = 0
+        for name in names:
+            path = os.path.join(self.trash_dir, name)
+            started = time.perf_counter()
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            WORKSPACE_SWEEP_SECONDS.observe(time.perf_counter() - started)
+            if os.path.lexists(path):
+                logger.warning(f"Could not fully remove {path}; retrying on the next sweep")
+                continue
+            WORKSPACE_SWEPT.inc()
+            swept += 1
+        WORKSPACE_TOMBSTONES.set(len(names) - swept)
+        return swept
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _tombstone(self, path: str) -> Optional[str]:
+        if not os.path.exists(path):
+            return None
+        os.makedirs(self.trash_dir, exist_ok=True)
+        target = os.path.join(self.trash_dir, f"{os.path.basename(path.rstrip(os.sep))}.{time.time_ns()}")
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logger.warning(f"{self.trash_dir} is on another filesystem than {path}; removing it inline")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        return target
+
+    def _listdir(self) -> List[str]:
+        try:
+            return sorted(os.listdir(self.trash_dir))
+        except FileNotFoundError:
+            return []
+
+    async def _run(self) -> None:
+        while True:
+            # Tombstones made while sweeping set the event again, so they are picked up right away
+            self._wake.clear()
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"Workspace sweep failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+workspace_sweeper = WorkspaceSweeper(trash_dir=settings.workspace_trash_dir, interval=settings.workspace_sweep_interval)
@@ -0,0 +1,110 @@
+"""
+Benchmark: a docker client per service instance vs. the shared registry client.
+
+Routers build a service per request, so before the registry every request paid
+for docker.from_env(): API version negotiation plus a fresh TCP connection.
+A minimal fake Docker Engine API runs on localhost over HTTP/1.1 keep-alive,
+so the numbers measure client setup and connection reuse, not daemon work.
+
+    cd backend && python -m scripts.bench_docker_clients --requests 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import docker
+
+from app.services.docker_client import DockerClientRegistry
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each response in one segment; otherwise Nagle + delayed ACK adds ~40ms
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        FakeDockerHandler.connections += 1
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/version"):
+            body = {"ApiVersion": "1.43", "MinAPIVersion": "1.12", "Version": "24.0.0"}
+        elif path.endswith("/containers/json"):
+            body = [{"Id": "c1", "Names": ["/vibecaas-1"], "State": "running", "Labels": {}}]
+        elif path.endswith("/_ping"):
+            body = "OK"
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def per_instance_request() -> None:
+    """The pre-registry path: AppService(db) called docker.from_env() every request"""
+    client = docker.from_env()
+    try:
+        client.api.containers(all=True)
+    finally:
+        client.close()
+
+
+def report(label: str, samples: list, connections: int) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{label:<14} mean {statistics.mean(samples):7.3f} ms | p50 {statistics.median(samples):7.3f} ms | "
+        f"p95 {p95:7.3f} ms | {connections} TCP connections"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDockerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["DOCKER_HOST"] = f"tcp://127.0.0.1:{server.server_address[1]}"
+    os.environ.pop("DOCKER_TLS_VERIFY", None)
+
+    FakeDockerHandler.connections = 0
+    samples = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        per_instance_request()
+        samples.append((time.perf_counter() - start) * 1000)
+    report("per-instance", samples, FakeDockerHandler.connections)
+
+    registry = DockerClientRegistry(max_pool_size=8, timeout=10, health_interval=30)
+    FakeDockerHandler.connections = 0
+    samples = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        registry.get().api.containers(all=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    report("shared", samples, FakeDockerHandler.connections)
+
+    registry.reset("default")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
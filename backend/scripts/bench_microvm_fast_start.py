@@ -0,0 +1,126 @@
+"""
+Benchmark: cold boot vs. snapshot restore, against the mock vm-control.
+
+MockVMControl is served in process over httpx.ASGITransport and driven with
+the same VMControlClient the backend uses. The flow is the one
+MicroVMSnapshots runs: cold-boot VMs from a repository, capture a snapshot
+of one that finished its build, then create VMs restored from it.
+Time to running is measured per VM, from the create request until
+vm-control reports it running.
+
+The mock's timings default to a realistic shape (boot 3 s, build 30 s,
+snapshot 4 s, restore 0.5 s) and are multiplied by --scale so the run
+takes seconds; results are reported both measured and divided by --scale.
+us-east-1 gets enough mock hosts for the cold and restored VMs together.
+
+    cd backend && python -m scripts.bench_microvm_fast_start --vms 50 --scale 0.02
+"""
+
+import argparse
+import asyncio
+import math
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app.services.mock_vm_control import MockVMControl, create_app
+from app.services.vm_control import VMControlClient
+
+POLL_SECONDS = 0.005
+HOST_CPU = 32
+HOST_MEMORY_MB = 131072
+
+VM_CONFIG = {
+    "name": "bench",
+    "runtime": "node",
+    "region": "us-east-1",
+    "cpu_cores": 2,
+    "memory_mb": 2048,
+    "repo_url": "https://github.com/vibecaas/example-app",
+    "branch": "main",
+    "build_command": "npm ci && npm run build",
+    "start_command": "npm start",
+}
+
+
+async def wait_for(fetch, status: str) -> Dict[str, Any]:
+    while True:
+        body = await fetch()
+        if body["status"] == status:
+            return body
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def time_to_running(client: VMControlClient, config: Dict[str, Any]) -> float:
+    started = time.perf_counter()
+    vm = await client.create_vm(config)
+    await wait_for(lambda: client.get_vm(vm["id"]), "running")
+    return time.perf_counter() - started
+
+
+def summary(name: str, samples: List[float], scale: float) -> None:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    mean = statistics.mean(samples)
+    print(
+        f"{name:<9} {len(samples):>5} {mean:>9.3f} {p50:>9.3f} {p99:>9.3f}"
+        f"   unscaled: mean {mean / scale:>7.2f} s  p99 {p99 / scale:>7.2f} s"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    # Cold and restored VMs all stay up until the end of the run
+    vms = 2 * args.vms
+    hosts = max(
+        math.ceil(vms * VM_CONFIG["cpu_cores"] / HOST_CPU), math.ceil(vms * VM_CONFIG["memory_mb"] / HOST_MEMORY_MB)
+    )
+    control = MockVMControl(
+        boot_seconds=args.boot * args.scale,
+        build_seconds=args.build * args.scale,
+        snapshot_seconds=args.snapshot * args.scale,
+        restore_seconds=args.restore * args.scale,
+        host_cpu=HOST_CPU,
+        host_memory_mb=HOST_MEMORY_MB,
+        region_hosts={VM_CONFIG["region"]: hosts},
+    )
+    client = VMControlClient(
+        "http://vm-control", "bench", max_connections=args.vms, transport=httpx.ASGITransport(app=create_app(control))
+    )
+    try:
+        cold = await asyncio.gather(*(time_to_running(client, VM_CONFIG) for _ in range(args.vms)))
+
+        source = next(vm for vm in control.vms.values() if vm["status"] == "running")
+        started = time.perf_counter()
+        snapshot = await client.create_snapshot(source["id"], {"snapshot_key": "bench"})
+        await wait_for(lambda: client.get_snapshot(snapshot["id"]), "ready")
+        capture = time.perf_counter() - started
+
+        restore_config = {**VM_CONFIG, "snapshot_id": snapshot["id"]}
+        restored = await asyncio.gather(*(time_to_running(client, restore_config) for _ in range(args.vms)))
+    finally:
+        await client.close()
+
+    print(f"scale {args.scale}: boot {args.boot} s, build {args.build} s, snapshot {args.snapshot} s, restore {args.restore} s")
+    print(f"{'mode':<9} {'vms':>5} {'mean s':>9} {'p50 s':>9} {'p99 s':>9}")
+    summary("cold", cold, args.scale)
+    summary("restore", restored, args.scale)
+    print(f"capture   {capture:.3f} s (unscaled {capture / args.scale:.2f} s), paid once per commit and build config")
+    print(f"speedup   x{statistics.mean(cold) / statistics.mean(restored):.1f} mean time to running")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vms", type=int, default=50, help="VMs per mode, created concurrently")
+    parser.add_argument("--scale", type=float, default=0.02, help="multiplier applied to the simulated timings")
+    parser.add_argument("--boot", type=float, default=3.0, help="simulated cold boot seconds")
+    parser.add_argument("--build", type=float, default=30.0, help="simulated build seconds")
+    parser.add_argument("--snapshot", type=float, default=4.0, help="simulated snapshot capture seconds")
+    parser.add_argument("--restore", type=float, default=0.5, help="simulated restore seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
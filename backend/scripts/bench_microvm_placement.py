@@ -0,0 +1,137 @@
+"""
+Simulation: MicroVM placement by the scheduler vs. a fixed default region.
+
+MockVMControl is served in process over httpx.ASGITransport with regions
+that differ in boot speed (--slowdown) and failure rate (--failures). VMs
+are created in waves; the scheduler refreshes capacity between waves and
+learns from each outcome the way the reconciler feeds it. The "static"
+strategy sends every VM to --default-region and lets vm-control pick the
+host, which is what MicroVMService did before the scheduler.
+
+Reported per strategy: mean and p99 time to running, failure share, VMs per
+region, and how many hosts ended up in use (fewer is tighter packing).
+Use it to tune the VM_PLACEMENT_*_WEIGHT settings:
+
+    cd backend && python -m scripts.bench_microvm_placement --vms 400 --fit-weight 0.2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.services.microvm_placement import NoCapacity, PlacementScheduler
+from app.services.mock_vm_control import MockVMControl, create_app
+from app.services.vm_control import VMControlClient
+
+POLL_SECONDS = 0.005
+
+
+def parse_map(value: str) -> Dict[str, float]:
+    return {k: float(v) for k, v in (item.split("=") for item in value.split(",") if item)}
+
+
+async def provision(client: VMControlClient, config: Dict) -> Optional[float]:
+    """Seconds until running, or None if the VM failed"""
+    started = time.perf_counter()
+    vm = await client.create_vm(config)
+    while True:
+        state = await client.get_vm(vm["id"])
+        if state["status"] == "running":
+            return time.perf_counter() - started
+        if state["status"] == "error":
+            return None
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def simulate(args: argparse.Namespace, strategy: str) -> None:
+    control = MockVMControl(
+        boot_seconds=args.boot,
+        hosts_per_region=args.hosts,
+        host_cpu=args.host_cpu,
+        host_memory_mb=args.host_cpu * 4096,
+        region_slowdown=parse_map(args.slowdown),
+        region_failure_rate=parse_map(args.failures),
+    )
+    client = VMControlClient(
+        "http://vm-control", "bench", max_connections=args.wave, transport=httpx.ASGITransport(app=create_app(control))
+    )
+    scheduler = PlacementScheduler(
+        client,
+        regions=control.regions,
+        default_region=args.default_region,
+        refresh_interval=3600,
+        latency_weight=args.latency_weight,
+        failure_weight=args.failure_weight,
+        fit_weight=args.fit_weight,
+    )
+    times: List[float] = []
+    failed = rejected = 0
+    regions: Counter = Counter()
+
+    async def one(cpu: int) -> None:
+        nonlocal failed, rejected
+        config = {"name": "sim", "runtime": "node", "cpu_cores": cpu, "memory_mb": cpu * 1024}
+        if strategy == "scheduler":
+            try:
+                placement = scheduler.place(cpu, cpu * 1024)
+            except NoCapacity:
+                rejected += 1
+                return
+            config.update(region=placement.region, host_id=placement.host_id)
+        else:
+            config["region"] = args.default_region
+        try:
+            seconds = await provision(client, config)
+        except httpx.HTTPStatusError:
+            rejected += 1
+            return
+        regions[config["region"]] += 1
+        if strategy == "scheduler":
+            scheduler.observe(config["region"], seconds, ok=seconds is not None)
+        if seconds is None:
+            failed += 1
+        else:
+            times.append(seconds)
+
+    try:
+        for start in range(0, args.vms, args.wave):
+            await scheduler.refresh()
+            await asyncio.gather(*(one(1 + (i % 4)) for i in range(start, min(start + args.wave, args.vms))))
+    finally:
+        await client.close()
+
+    hosts_used = sum(1 for hosts in control.hosts.values() for host in hosts if host["cpu_used"])
+    times.sort()
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))] if times else 0.0
+    print(
+        f"{strategy:<9} mean {statistics.mean(times) if times else 0:>6.3f} s  p99 {p99:>6.3f} s  "
+        f"failed {failed / args.vms:>5.1%}  rejected {rejected:>4}  hosts used {hosts_used:>3}  "
+        f"regions {dict(sorted(regions.items()))}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vms", type=int, default=400)
+    parser.add_argument("--wave", type=int, default=40, help="VMs created concurrently between capacity refreshes")
+    parser.add_argument("--boot", type=float, default=0.05, help="simulated boot seconds before slowdown")
+    parser.add_argument("--hosts", type=int, default=40, help="hosts per region")
+    parser.add_argument("--host-cpu", type=int, default=32, help="cores per host (memory is 4 GB per core)")
+    parser.add_argument("--slowdown", default="us-east-1=3,us-west-2=1.5,eu-west-1=1,ap-southeast-1=2")
+    parser.add_argument("--failures", default="us-east-1=0.02,us-west-2=0.25,eu-west-1=0.02,ap-southeast-1=0.05")
+    parser.add_argument("--default-region", default="us-east-1")
+    parser.add_argument("--latency-weight", type=float, default=1.0)
+    parser.add_argument("--failure-weight", type=float, default=2.0)
+    parser.add_argument("--fit-weight", type=float, default=0.2)
+    args = parser.parse_args()
+    for strategy in ("static", "scheduler"):
+        asyncio.run(simulate(args, strategy))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: per-file scaffold writes vs. the pre-rendered template registry.
+
+"per-file" is what project creation used to do: rebuild the template's JSON
+and strings, then create directories and write each file one by one. The
+registry renders each scaffold once, up front.
+
+Methods, each creating a fresh workspace per iteration:
+  per-file  rebuild the template and write it file by file (the old path)
+  write     write the pre-rendered files from memory
+  tar       extract the pre-rendered tarball in one pass
+  blob      materialize from the blob store (reflink, else copy)
+
+The scaffolds are only a few files, so --synthetic-files adds a template with
+that many small files, roughly the shape of an installed node_modules layer.
+Everything runs in a scratch directory; no Docker daemon is needed. Results
+depend heavily on the filesystem, so point --dir at the workspace volume.
+
+    cd backend && python -m scripts.bench_project_templates --projects 200 --dir /workspace
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict
+
+from app.services.blob_store import BlobStore
+from app.services.project_service import ProjectService
+from app.services.template_registry import TAR, TemplateRegistry, _extract, _write_files
+
+BUILDERS: Dict[str, Callable[[], Dict[str, str]]] = {
+    "react": ProjectService._react_project_files,
+    "nextjs": ProjectService._nextjs_project_files,
+    "vue": ProjectService._vue_project_files,
+    "angular": ProjectService._angular_project_files,
+    "basic": ProjectService._basic_project_files,
+}
+
+
+def synthetic_builder(count: int) -> Callable[[], Dict[str, str]]:
+    def build() -> Dict[str, str]:
+        files = {"package.json": '{"name": "synthetic", "version": "1.0.0"}'}
+        for i in range(count):
+            files[f"node_modules/pkg{i // 20}/lib/file{i % 20}.js"] = f"module.exports = {i};\n" * 8
+        return files
+
+    return build
+
+
+def write_per_file(builder: Callable[[], Dict[str, str]], target_dir: str) -> None:
+    os.makedirs(target_dir, exist_ok=True)
+    for rel_path, text in builder().items():
+        path = os.path.join(target_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+
+def timed(fn: Callable[[int], None], projects: int) -> Dict[str, float]:
+    samples = []
+    for i in range(projects):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=200, help="workspaces to create per framework and method")
+    parser.add_argument("--synthetic-files", type=int, default=2000, help="files in the synthetic template (0 to skip)")
+    parser.add_argument("--dir", default=None, help="scratch directory (default: a new temp dir)")
+    args = parser.parse_args()
+
+    builders = dict(BUILDERS)
+    if args.synthetic_files:
+        builders["synthetic"] = synthetic_builder(args.synthetic_files)
+
+    scratch = tempfile.mkdtemp(prefix="bench-templates-", dir=args.dir)
+    try:
+        blobs = BlobStore(os.path.join(scratch, "blobs"), "reflink")
+        registry = TemplateRegistry(
+            os.path.join(scratch, "templates"), builders, blobs, client=lambda: None, default="basic"
+        )
+        for framework in builders:
+            registry.get(framework)  # Rendering happens once, outside the timed loop
+
+        print(f"tar: {TAR or 'tarfile module'}")
+        print(f"{'framework':<10} {'method':<9} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for framework, builder in builders.items():
+            template = registry.get(framework)
+
+            def workspace(method: str, i: int) -> str:
+                path = os.path.join(scratch, "ws", framework, method, str(i))
+                os.makedirs(path)
+                return path
+
+            runs = {
+                "per-file": lambda i: write_per_file(builder, workspace("per-file", i)),
+                "write": lambda i: _write_files(workspace("write", i), template.files),
+                "tar": lambda i: _extract(template.archive, workspace("tar", i)),
+                "blob": lambda i: blobs.materialize(f"{framework}-{i}", workspace("blob", i), template.files),
+            }
+            baseline = None
+            for method, run in runs.items():
+                result = timed(run, args.projects)
+                baseline = baseline or result["mean"]
+                speedup = f"  x{baseline / result['mean']:.2f}" if method != "per-file" else ""
+                print(
+                    f"{framework:<10} {method:<9} {result['mean']:>9.3f} {result['p50']:>9.3f} {result['p99']:>9.3f}{speedup}"
+                )
+        print("blob store:", blobs.report())
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
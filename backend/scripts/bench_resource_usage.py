@@ -0,0 +1,140 @@
+"""
+Benchmark: per-project container lookups vs. the labelled bulk listing used by
+ResourceService.get_user_usage.
+
+Docker is replaced by an in-process fake that sleeps for a fixed per-request
+latency, so the numbers measure round-trips rather than daemon work.
+
+    cd backend && python -m scripts.bench_resource_usage --latency-ms 2
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.services.app_service import OWNER_LABEL, PROJECT_LABEL, TENANT_LABEL
+from app.services.docker_executor import docker_executor
+from app.services.resource_service import ResourceService
+from app.services.stats_collector import stats_collector
+
+USER_ID = 42
+
+
+class FakeAPI:
+    def __init__(self, containers, latency):
+        self._containers = containers
+        self.latency = latency
+        self.calls = 0
+
+    def containers(self, all=False, filters=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        key, _, value = filters["label"].partition("=")
+        return [c for c in self._containers if c["Labels"].get(key) == value]
+
+    def inspect_container(self, name):
+        self.calls += 1
+        time.sleep(self.latency)
+        for c in self._containers:
+            if c["Names"][0] == f"/{name}":
+                return c
+        raise LookupError(name)
+
+
+class FakeDockerClient:
+    def __init__(self, containers, latency):
+        self.api = FakeAPI(containers, latency)
+        self.containers = SimpleNamespace(get=self._get)
+
+    def _get(self, name):
+        attrs = self.api.inspect_container(name)
+        return SimpleNamespace(name=name, status=attrs["State"])
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, projects):
+        self.projects = projects
+
+    def query(self, model):
+        return FakeQuery(self.projects)
+
+
+def make_fixture(n_projects: int):
+    projects = [SimpleNamespace(id=i, owner_id=USER_ID, tenant_id=1) for i in range(n_projects)]
+    containers = [
+        {
+            "Id": f"c{p.id}",
+            "Names": [f"/vibecaas-{p.id}"],
+            "State": "running",
+            "Labels": {PROJECT_LABEL: str(p.id), OWNER_LABEL: str(USER_ID), TENANT_LABEL: "1"},
+        }
+        for p in projects
+    ]
+    return projects, containers
+
+
+async def per_project_usage(db, client) -> int:
+    """The pre-bulk path: one containers.get round-trip per project"""
+    running = 0
+    for project in db.query(None).filter().all():
+        try:
+            container = await docker_executor.run("get", client.containers.get, f"vibecaas-{project.id}")
+        except LookupError:
+            continue
+        if container.status == "running":
+            running += 1
+            stats_collector.get(container.name)
+    return running
+
+
+async def bench(n_projects: int, latency: float, repeat: int) -> None:
+    projects, containers = make_fixture(n_projects)
+    db = FakeSession(projects)
+
+    client = FakeDockerClient(containers, latency)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await per_project_usage(db, client)
+    loop_ms = (time.perf_counter() - start) / repeat * 1000
+    loop_calls = client.api.calls // repeat
+
+    client = FakeDockerClient(containers, latency)
+    service = ResourceService(db, docker_client=client)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        usage = await service.get_user_usage(USER_ID)
+    bulk_ms = (time.perf_counter() - start) / repeat * 1000
+    bulk_calls = client.api.calls // repeat
+    assert usage["running_containers"] == n_projects
+
+    print(
+        f"{n_projects:>6} projects | per-project: {loop_ms:9.1f} ms ({loop_calls} calls) | "
+        f"bulk: {bulk_ms:7.1f} ms ({bulk_calls} call) | speedup x{loop_ms / bulk_ms:.0f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated docker API round-trip")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--projects", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    for n in args.projects:
+        await bench(n, args.latency_ms / 1000, args.repeat)
+    docker_executor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -5,15 +5,16 @@ Main FastAPI application for managing user apps and containers
 
 import os
 import asyncio
+import time
 import uuid
 import json
 import docker
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks, status
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy import create_engine, Column, String, Boolean, DateTime, Float, Integer, ForeignKey, JSON
@@ -24,6 +25,7 @@ from pydantic import BaseModel, Field, EmailStr
 from passlib.context import CryptContext
 import jwt
 import redis
+import redis.asyncio as aioredis
 from prometheus_client import Counter, Histogram, Gauge, generate_latest
 from fastapi.responses import Response
 
@@ -58,6 +60,8 @@ JWT_EXPIRATION_HOURS = 24
 app_created_counter = Counter('vibecaas_apps_created_total', 'Total number of apps created')
 app_action_histogram = Histogram('vibecaas_app_action_duration_seconds', 'App action duration')
 active_apps_gauge = Gauge('vibecaas_active_apps', 'Number of active apps')
+image_pull_histogram = Histogram('vibecaas_image_pull_duration_seconds', 'Base image pull duration', ['image'],
+                                 buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
 
 # ====================
 # Database Models
@@ -208,6 +212,73 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 # Container Management
 # ====================
 
+# Images the app containers and generated Dockerfiles start from
+BASE_IMAGES = {
+    "python": "python:3.11-slim",
+    "nodejs": "node:18-alpine",
+    "go": "golang:1.21-alpine"
+}
+PREPULL_IMAGES = list(BASE_IMAGES.values()) + ["alpine:latest"]
+
+# Starter files per framework, built once rather than on every call
+STARTER_CODE = {
+    "python": {
+        "app.py": """
+from flask import Flask, jsonify
+import os
+
+app = Flask(__name__)
+
+@app.route('/')
+def hello():
+    return jsonify({
+        "message": "Hello from VibeCaaS!",
+        "framework": "Python/Flask"
+    })
+
+@app.route('/health')
+def health():
+    return jsonify({"status": "healthy"})
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 8000))
+    app.run(host='0.0.0.0', port=port)
+"""
+    },
+    "nodejs": {
+        "server.js": """
+const express = require('express');
+const app = express();
+const port = process.env.PORT || 8000;
+
+app.get('/', (req, res) => {
+    res.json({
+        message: 'Hello from VibeCaaS!',
+        framework: 'Node.js/Express'
+    });
+});
+
+app.get('/health', (req, res) => {
+    res.json({ status: 'healthy' });
+});
+
+app.listen(port, () => {
+    console.log(`Server running on port ${port}`);
+});
+""",
+        "package.json": """
+{
+    "name": "vibecaas-app",
+    "version": "1.0.0",
+    "main": "server.js",
+    "dependencies": {
+        "express": "^4.18.0"
+    }
+}
+"""
+    }
+}
+
 class ContainerManager:
     def __init__(self):
         self.docker_client = docker_client
@@ -263,64 +334,7 @@ CMD ["./main"]
     
     def create_starter_code(self, framework: str, template: str) -> Dict[str, str]:
         """Generate starter code files"""
-        starters = {
-            "python": {
-                "app.py": """
-from flask import Flask, jsonify
-import os
-
-app = Flask(__name__)
-
-@app.route('/')
-def hello():
-    return jsonify({
-        "message": "Hello from VibeCaaS!",
-        "framework": "Python/Flask"
-    })
-
-@app.route('/health')
-def health():
-    return jsonify({"status": "healthy"})
-
-if __name__ == '__main__':
-    port = int(os.getenv('PORT', 8000))
-    app.run(host='0.0.0.0', port=port)
-"""
-            },
-            "nodejs": {
-                "server.js": """
-const express = require('express');
-const app = express();
-const port = process.env.PORT || 8000;
-
-app.get('/', (req, res) => {
-    res.json({
-        message: 'Hello from VibeCaaS!',
-        framework: 'Node.js/Express'
-    });
-});
-
-app.get('/health', (req, res) => {
-    res.json({ status: 'healthy' });
-});
-
-app.listen(port, () => {
-    console.log(`Server running on port ${port}`);
-});
-""",
-                "package.json": """
-{
-    "name": "vibecaas-app",
-    "version": "1.0.0",
-    "main": "server.js",
-    "dependencies": {
-        "express": "^4.18.0"
-    }
-}
-"""
-            }
-        }
-        return starters.get(framework, starters["python"])
+        return dict(STARTER_CODE.get(framework, STARTER_CODE["python"]))
     
     async def build_and_run_container(self, app: App, user: User) -> str:
         """Build and run a container for the app"""
@@ -335,13 +349,7 @@ app.listen(port, () => {
             
             # For local development, use a pre-built image
             # In production, you would build from user code
-            base_images = {
-                "python": "python:3.11-slim",
-                "nodejs": "node:18-alpine",
-                "go": "golang:1.21-alpine"
-            }
-            
-            base_image = base_images.get(app.framework, "python:3.11-slim")
+            base_image = BASE_IMAGES.get(app.framework, BASE_IMAGES["python"])
             
             # Run container
             container = self.docker_client.containers.run(
@@ -372,6 +380,29 @@ app.listen(port, () => {
             logger.error(f"Failed to create container: {e}")
             return "simulated-container-id"
     
+    async def prepull_base_images(self):
+        """Pull base images in the background so the first app create doesn't wait on them"""
+        if not self.docker_client:
+            return
+        for image in PREPULL_IMAGES:
+            try:
+                await asyncio.to_thread(self.docker_client.images.get, image)
+                continue
+            except docker.errors.ImageNotFound:
+                pass
+            except Exception as e:
+                logger.warning(f"Failed to inspect image {image}: {e}")
+                continue
+            repository, _, tag = image.rpartition(":")
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.docker_client.images.pull, repository, tag=tag)
+                duration = time.perf_counter() - start
+                image_pull_histogram.labels(image).observe(duration)
+                logger.info(f"Pulled {image} in {duration:.1f}s")
+            except Exception as e:
+                logger.warning(f"Failed to pull {image}: {e}")
+    
     async def stop_container(self, container_id: str):
         """Stop a container"""
         if not self.docker_client:
@@ -436,7 +467,10 @@ app.listen(port, () => {
                 "network_rx_bytes": 1024000,
                 "network_tx_bytes": 512000
             }
-            
+        # stats(stream=False) blocks for ~1-2s while the daemon samples twice
+        return await asyncio.to_thread(self._read_container_stats, container_id)
+    
+    def _read_container_stats(self, container_id: str) -> Dict:
         try:
             container = self.docker_client.containers.get(container_id)
             stats = container.stats(stream=False)
@@ -464,6 +498,167 @@ app.listen(port, () => {
 # Initialize container manager
 container_manager = ContainerManager()
 
+# ====================
+# Real-time Stats Hub
+# ====================
+
+STATS_INTERVAL_SECONDS = float(os.getenv("STATS_INTERVAL_SECONDS", "5"))
+STATS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("STATS_SUBSCRIBER_QUEUE_SIZE", "4"))
+STATS_SEND_TIMEOUT_SECONDS = float(os.getenv("STATS_SEND_TIMEOUT_SECONDS", "10"))
+STATS_HUB_BACKEND = os.getenv("STATS_HUB_BACKEND", "memory")  # memory | redis
+
+hub_subscribers_gauge = Gauge('vibecaas_stats_hub_subscribers', 'WebSocket subscribers attached to the stats hub')
+hub_channels_gauge = Gauge('vibecaas_stats_hub_channels', 'Apps with at least one local subscriber')
+hub_samples_counter = Counter('vibecaas_stats_hub_samples_total', 'Container stats samples taken by hub producers')
+hub_delivered_counter = Counter('vibecaas_stats_hub_delivered_total', 'Stats messages queued for subscribers')
+hub_dropped_counter = Counter('vibecaas_stats_hub_dropped_total', 'Stale stats messages dropped for slow subscribers')
+hub_slow_disconnects_counter = Counter('vibecaas_stats_hub_slow_disconnects_total', 'Subscribers closed for not keeping up')
+
+class StatsHub:
+    """In-process fan-out: one producer per app samples stats and every subscriber gets a copy.
+    
+    Each subscriber has a small bounded queue. Stats are latest-wins, so when a
+    queue is full the oldest message is dropped instead of blocking the producer.
+    """
+    
+    def __init__(self, interval: float, queue_size: int):
+        self.interval = interval
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._channels: Dict[str, asyncio.Task] = {}
+        self._container_ids: Dict[str, Optional[str]] = {}
+    
+    async def subscribe(self, app_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(app_id, set()).add(queue)
+        hub_subscribers_gauge.inc()
+        if app_id not in self._channels:
+            self._channels[app_id] = asyncio.create_task(self._run_channel(app_id))
+            hub_channels_gauge.inc()
+        return queue
+    
+    async def unsubscribe(self, app_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(app_id)
+        if not subscribers or queue not in subscribers:
+            return
+        subscribers.discard(queue)
+        hub_subscribers_gauge.dec()
+        if not subscribers:
+            del self._subscribers[app_id]
+            self._container_ids.pop(app_id, None)
+            task = self._channels.pop(app_id, None)
+            if task:
+                task.cancel()
+                hub_channels_gauge.dec()
+    
+    async def close(self):
+        for task in self._channels.values():
+            task.cancel()
+        await asyncio.gather(*self._channels.values(), return_exceptions=True)
+    
+    def _deliver(self, app_id: str, message: Dict):
+        for queue in self._subscribers.get(app_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                hub_dropped_counter.inc()
+            queue.put_nowait(message)
+            hub_delivered_counter.inc()
+    
+    async def _run_channel(self, app_id: str):
+        while True:
+            try:
+                message = await self._sample(app_id)
+                if message:
+                    self._deliver(app_id, message)
+            except Exception as e:
+                # Keep the channel alive; a dead task would stay in _channels and never restart
+                logger.warning(f"Stats sampling for app {app_id} failed: {e}")
+                self._container_ids.pop(app_id, None)
+            await asyncio.sleep(self.interval)
+    
+    async def _sample(self, app_id: str) -> Optional[Dict]:
+        container_id = self._container_ids.get(app_id)
+        if container_id is None:
+            container_id = await asyncio.to_thread(self._lookup_container_id, app_id)
+            self._container_ids[app_id] = container_id
+        if not container_id:
+            # Re-check on the next tick; the app may still be creating
+            self._container_ids.pop(app_id, None)
+            return None
+        stats = await container_manager.get_container_stats(container_id)
+        hub_samples_counter.inc()
+        if not stats:
+            self._container_ids.pop(app_id, None)
+            return None
+        return {"type": "stats", "data": stats}
+    
+    @staticmethod
+    def _lookup_container_id(app_id: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            app = db.query(App).filter(App.id == app_id).first()
+            return app.container_id if app else None
+        finally:
+            db.close()
+
+class RedisStatsHub(StatsHub):
+    """Multi-replica fan-out over Redis pub/sub.
+    
+    Every replica with local subscribers listens on the app's channel; a
+    short-lived Redis lock elects the single replica that samples and publishes.
+    """
+    
+    def __init__(self, redis_url: str, interval: float, queue_size: int):
+        super().__init__(interval, queue_size)
+        self.redis = aioredis.Redis.from_url(redis_url)
+        self.replica_id = uuid.uuid4().hex
+    
+    async def close(self):
+        await super().close()
+        await self.redis.aclose()
+    
+    async def _run_channel(self, app_id: str):
+        channel = f"stats:{app_id}"
+        producer = asyncio.create_task(self._produce(app_id, channel))
+        try:
+            while True:
+                pubsub = self.redis.pubsub()
+                try:
+                    await pubsub.subscribe(channel)
+                    async for raw in pubsub.listen():
+                        if raw["type"] == "message":
+                            self._deliver(app_id, json.loads(raw["data"]))
+                except Exception as e:
+                    logger.warning(f"Stats listener for app {app_id} failed, resubscribing: {e}")
+                finally:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+                await asyncio.sleep(self.interval)
+        finally:
+            producer.cancel()
+    
+    async def _produce(self, app_id: str, channel: str):
+        lock_key = f"stats:producer:{app_id}"
+        lock_ttl = max(int(self.interval * 3), 1)
+        while True:
+            try:
+                acquired = await self.redis.set(lock_key, self.replica_id, nx=True, ex=lock_ttl)
+                if acquired or await self.redis.get(lock_key) == self.replica_id.encode():
+                    await self.redis.expire(lock_key, lock_ttl)
+                    message = await self._sample(app_id)
+                    if message:
+                        await self.redis.publish(channel, json.dumps(message, default=str))
+            except Exception as e:
+                logger.warning(f"Stats producer for app {app_id} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+if STATS_HUB_BACKEND == "redis":
+    stats_hub: StatsHub = RedisStatsHub(os.getenv("REDIS_URL", "redis://localhost:6379"), STATS_INTERVAL_SECONDS, STATS_SUBSCRIBER_QUEUE_SIZE)
+else:
+    stats_hub = StatsHub(STATS_INTERVAL_SECONDS, STATS_SUBSCRIBER_QUEUE_SIZE)
+
 # ====================
 # FastAPI Application
 # ====================
@@ -472,9 +667,15 @@ container_manager = ContainerManager()
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting VibeCaaS Backend API")
+    prepull_task = None
+    if os.getenv("IMAGE_PREPULL_ON_STARTUP", "true").lower() == "true":
+        prepull_task = asyncio.create_task(container_manager.prepull_base_images())
     yield
     # Shutdown
     logger.info("Shutting down VibeCaaS Backend API")
+    if prepull_task:
+        prepull_task.cancel()
+    await stats_hub.close()
 
 app = FastAPI(
     title="VibeCaaS API",
@@ -848,28 +1049,36 @@ async def get_resource_usage(
 # ====================
 
 @app.websocket("/ws/{app_id}")
-async def websocket_endpoint(
-    websocket: WebSocket,
-    app_id: str,
-    db: Session = Depends(get_db)
-):
+async def websocket_endpoint(websocket: WebSocket, app_id: str):
     await websocket.accept()
+    queue = await stats_hub.subscribe(app_id)
     
-    try:
+    async def send_stats():
         while True:
-            # Send app stats every 5 seconds
-            app = db.query(App).filter(App.id == app_id).first()
-            if app and app.container_id:
-                stats = await container_manager.get_container_stats(app.container_id)
-                await websocket.send_json({
-                    "type": "stats",
-                    "data": stats
-                })
-            
-            await asyncio.sleep(5)
-            
-    except WebSocketDisconnect:
+            message = await queue.get()
+            try:
+                await asyncio.wait_for(websocket.send_json(message), timeout=STATS_SEND_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                hub_slow_disconnects_counter.inc()
+                logger.info(f"Closing slow WebSocket for app {app_id}")
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+    
+    async def watch_disconnect():
+        # Clients send nothing, but receiving is how a dropped connection is noticed
+        # when no stats arrive to fail a send (e.g. the app has no container)
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
         logger.info(f"WebSocket disconnected for app {app_id}")
+    
+    tasks = [asyncio.create_task(send_stats()), asyncio.create_task(watch_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await stats_hub.unsubscribe(app_id, queue)
 
 if __name__ == "__main__":
     import uvicorn